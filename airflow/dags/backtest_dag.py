@@ -1,7 +1,6 @@
 from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
 from datetime import datetime, timedelta
-from app.services.backtest_service import run_backtest_by_id
 
 default_args = {
     'owner': 'airflow',
@@ -19,6 +18,8 @@ dag = DAG(
 )
 
 def run_backtest(task_id, *args, **kwargs):
+    # Imported in the task, so parsing the DAG does not load the backtest stack
+    from app.services.backtest_service import run_backtest_by_id
     run_backtest_by_id(task_id)
 
 run_backtest_task = PythonOperator(
@@ -2,16 +2,16 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
-import threading
+import atexit
+import os
 from flask_cors import CORS  
-from flask_migrate import Migrate
 
 db = SQLAlchemy()
 jwt = JWTManager()
 bcrypt = Bcrypt()
 
-from app.services.backtest_service import run_backtest_by_id
 from app.services.kafka_service import kafka_service
+from app.services.consumer_pool import ConsumerPool
 
 def create_app():
     app = Flask(__name__)
@@ -20,6 +20,8 @@ def create_app():
     db.init_app(app)
     jwt.init_app(app)
     bcrypt.init_app(app)
+    # alembic is heavy: loaded when an app is built, not when the package is imported
+    from flask_migrate import Migrate
     migrate = Migrate(app, db)
 
     CORS(app)
@@ -31,22 +33,35 @@ def create_app():
         app.register_blueprint(index.bp)
         app.register_blueprint(data.bp)
         db.create_all()
+        # Columns and indexes added since the tables were created
+        from app.schema import upgrade_schema
+        upgrade_schema(db.engine, db.metadata)
 
     return app
 
-def consume_backtest_scenes(app):
+def consume_backtest_scenes(app, stop=None):
+    # Only workers need the backtest stack (pandas, backtrader, mlflow)
+    from app.services.backtest_service import run_backtest_by_id
+    from app.services.mlflow_service import mlflow_service
+
     def callback(message):
         with app.app_context():
             backtest_id = message.get('backtest_id')
             run_backtest_by_id(backtest_id)
 
-    kafka_service.consume('backtest_scenes', callback)
-
-# Start consuming Kafka messages in a separate thread
-def start_consumer_thread(app):
-    consumer_thread = threading.Thread(target=consume_backtest_scenes, args=(app,))
-    consumer_thread.daemon = True  # Allow the thread to be killed when the main program exits
-    consumer_thread.start()
+    # Runs in a forked worker: leave the parent's pooled database connections to it
+    with app.app_context():
+        db.engine.dispose(close=False)
+    try:
+        kafka_service.consume('backtest_scenes', callback, stop=stop)
+    finally:
+        # Forked workers exit without running atexit handlers: send or spool the queued runs now
+        mlflow_service.close()
 
-app = create_app()
-start_consumer_thread(app)
+# Start a pool of consumer processes, each owning some of the topic's partitions
+def start_consumer_pool(app, workers=None):
+    workers = workers or int(os.getenv('BACKTEST_CONSUMER_WORKERS', '1'))
+    pool = ConsumerPool(consume_backtest_scenes, workers, args=(app,))
+    pool.start()
+    atexit.register(pool.stop)
+    return pool
@@ -5,12 +5,18 @@ class Backtest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
     symbol = db.Column(db.String(20))
+    # Comma-separated coins of a portfolio backtest; `symbol` then holds the first one
+    symbols = db.Column(db.Text, nullable=True)
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     inital_cash = db.Column(db.Integer)
     fee = db.Column(db.Float)
+    # JSON options of a walk-forward backtest (train_bars, test_bars, ...), see run_walk_forward
+    walk_forward = db.Column(db.Text, nullable=True)
     # status = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # The duplicate check of POST /backtests filters on these
+    __table_args__ = (db.Index('ix_backtests_scenario', 'symbol', 'start_date', 'end_date', 'name'),)
 
 class Indicator(db.Model):
     __tablename__ = 'indicators'
@@ -28,7 +34,7 @@ class Parameter(db.Model):
 class Result(db.Model):
     __tablename__ = 'results'
     id = db.Column(db.Integer, primary_key=True)
-    backtest_id = db.Column(db.Integer, db.ForeignKey('backtests.id'), nullable=False)
+    backtest_id = db.Column(db.Integer, db.ForeignKey('backtests.id'), nullable=False, index=True)
     strategy = db.Column(db.String(255))
     total_return = db.Column(db.Numeric(10, 2))
     number_of_trades = db.Column(db.Integer)
@@ -37,6 +43,76 @@ class Result(db.Model):
     max_drawdown = db.Column(db.Numeric(10, 2))
     sharpe_ratio = db.Column(db.Numeric(10, 2))
     is_best = db.Column(db.Boolean, default=False, nullable=True)
+    # Fingerprint of the run (see scripts/result_cache.py), the key of its ResultSeries
+    fingerprint = db.Column(db.String(64), nullable=True)
+
+class WindowResult(db.Model):
+    # Test period results of a walk-forward backtest; its Result rows hold the aggregate
+    __tablename__ = 'window_results'
+    id = db.Column(db.Integer, primary_key=True)
+    backtest_id = db.Column(db.Integer, db.ForeignKey('backtests.id'), nullable=False, index=True)
+    strategy = db.Column(db.String(255))
+    window = db.Column(db.Integer)
+    train_start = db.Column(db.Date)
+    train_end = db.Column(db.Date)
+    test_start = db.Column(db.Date)
+    test_end = db.Column(db.Date)
+    params = db.Column(db.Text)
+    total_return = db.Column(db.Numeric(10, 2))
+    number_of_trades = db.Column(db.Integer)
+    winning_trades = db.Column(db.Integer)
+    losing_trades = db.Column(db.Integer)
+    max_drawdown = db.Column(db.Numeric(10, 2))
+    sharpe_ratio = db.Column(db.Numeric(10, 2))
+
+class LeaderboardEntry(db.Model):
+    # Best result of a strategy on a symbol and period, updated as backtests finish (see leaderboard_service)
+    __tablename__ = 'leaderboard'
+    id = db.Column(db.Integer, primary_key=True)
+    # Comma-separated coins for portfolio backtests
+    symbol = db.Column(db.String(255), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    strategy = db.Column(db.String(255), nullable=False)
+    runs = db.Column(db.Integer, nullable=False)
+    # Backtests in which it was the best strategy
+    wins = db.Column(db.Integer, nullable=False)
+    backtest_id = db.Column(db.Integer, db.ForeignKey('backtests.id'), nullable=False)
+    result_id = db.Column(db.Integer, db.ForeignKey('results.id'), nullable=False)
+    total_return = db.Column(db.Numeric(10, 2))
+    number_of_trades = db.Column(db.Integer)
+    max_drawdown = db.Column(db.Numeric(10, 2))
+    sharpe_ratio = db.Column(db.Numeric(10, 2))
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    __table_args__ = (
+        db.UniqueConstraint('symbol', 'start_date', 'end_date', 'strategy', name='uq_leaderboard_period_strategy'),
+        db.Index('ix_leaderboard_symbol_return', 'symbol', 'total_return'),
+    )
+
+class CachedResult(db.Model):
+    # run_backtest results by fingerprint (see scripts/result_cache.py), reused by any backtest of the same scenario
+    __tablename__ = 'result_cache'
+    fingerprint = db.Column(db.String(64), primary_key=True)
+    # Comma-separated coins for portfolio backtests
+    symbol = db.Column(db.String(255), nullable=False)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    strategy = db.Column(db.String(255))
+    data_version = db.Column(db.String(64), nullable=False)
+    # The result as JSON
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    __table_args__ = (db.Index('ix_result_cache_range', 'symbol', 'start_date', 'end_date'),)
+
+class ResultSeries(db.Model):
+    # Equity curve and trade log of a run as Arrow IPC blobs (see scripts/result_series.py), one row per fingerprint
+    __tablename__ = 'result_series'
+    fingerprint = db.Column(db.String(64), primary_key=True)
+    bars = db.Column(db.Integer)
+    number_of_trades = db.Column(db.Integer)
+    equity = db.Column(db.LargeBinary, nullable=False)
+    trades = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 class Metric(db.Model):
     __tablename__ = 'metrics'
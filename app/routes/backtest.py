@@ -1,35 +1,110 @@
+import json
+import os
 import threading
-from flask import Blueprint, request, jsonify, current_app
-from app.models.backtest import Backtest, Result
+import numpy as np
+from datetime import date, datetime
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from sqlalchemy import and_, insert, or_, select
+from app.models.backtest import Backtest, Result, ResultSeries, WindowResult
 from app import db
 from flask_jwt_extended import jwt_required
-from app.services.backtest_service import run_backtest_by_id, run_and_evaluate_backtest
 from app.services.kafka_service import kafka_service
+from app.services.leaderboard_service import top_strategies
+from scripts.result_series import decode, downsample
 from flask_cors import CORS, cross_origin
 
 bp = Blueprint('backtest', __name__)
 CORS(bp)
 
+WALK_FORWARD_OPTIONS = {'train_bars', 'test_bars', 'step', 'anchored', 'optimize', 'warmup_bars'}
+
+
+def parse_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def parse_number(data, key, integer=False):
+    # As the column stores it, so "10000" and 10000 are the same scenario
+    value = data.get(key)
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number")
+    if integer:
+        if not number.is_integer():
+            raise ValueError(f"{key} must be a whole number")
+        return int(number)
+    return number
+
+
+def parse_backtest(data):
+    """Backtest columns from a request scenario; ValueError if it is invalid."""
+    symbol = data.get('coin')
+    coins = data.get('coins')
+    symbols = ','.join(coins) if coins else None
+    if coins:
+        symbol = coins[0]
+    walk_forward = data.get('walk_forward')
+    if walk_forward:
+        # e.g. {"train_bars": 365, "test_bars": 90, "step": 90, "anchored": false, "optimize": true, "warmup_bars": 100}
+        if coins:
+            raise ValueError("Walk-forward is not supported for portfolio backtests")
+        if not isinstance(walk_forward.get('train_bars'), int) or not isinstance(walk_forward.get('test_bars'), int):
+            raise ValueError("walk_forward needs integer train_bars and test_bars")
+        if not isinstance(walk_forward.get('warmup_bars', 0), int) or walk_forward.get('warmup_bars', 0) < 0:
+            raise ValueError("walk_forward warmup_bars must be a non-negative integer")
+        unknown = set(walk_forward) - WALK_FORWARD_OPTIONS
+        if unknown:
+            raise ValueError(f"Unknown walk_forward options: {', '.join(sorted(unknown))}")
+        walk_forward = json.dumps(walk_forward, sort_keys=True)
+    else:
+        walk_forward = None
+    return dict(
+        name=data.get('name'),
+        symbol=symbol,
+        symbols=symbols,
+        start_date=parse_date(data.get('start_date')),
+        end_date=parse_date(data.get('end_date')),
+        inital_cash=parse_number(data, 'inital_cash', integer=True),
+        fee=parse_number(data, 'fee'),
+        walk_forward=walk_forward,
+    )
+
+
+# What makes two backtests the same scenario
+SCENARIO_COLUMNS = ('name', 'symbol', 'symbols', 'start_date', 'end_date', 'inital_cash', 'fee', 'walk_forward')
+
+
+def backtest_key(columns):
+    return tuple(columns[key] for key in SCENARIO_COLUMNS)
+
+
+def matching(column, values):
+    # IN does not match NULL, so those are asked for separately
+    values = set(values)
+    clause = column.in_([value for value in values if value is not None])
+    return or_(clause, column.is_(None)) if None in values else clause
+
+
 @bp.route('/backtests', methods=['POST'])
 @jwt_required()
 @cross_origin(origin='*')
 def run_backtest():
-    data = request.get_json()
-    name = data.get('name')
-    symbol = data.get('coin')
-    start_date = data.get('start_date')
-    end_date = data.get('end_date')
-    inital_cash = data.get('inital_cash')
-    fee = data.get('fee')
+    try:
+        columns = parse_backtest(request.get_json())
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
 
     # Check if backtest with same parameters exists
-    existing_backtest = Backtest.query.filter_by(name=name, symbol=symbol, start_date=start_date, end_date=end_date).first()
+    existing_backtest = Backtest.query.filter_by(**{key: columns[key] for key in SCENARIO_COLUMNS}).first()
     if existing_backtest:
         return jsonify(
             {"msg": "Backtest with same parameters already exists", "backtest_id": existing_backtest.id}), 200
 
     # Create new backtest
-    new_backtest = Backtest(name=name, symbol=symbol, start_date=start_date, end_date=end_date, inital_cash=inital_cash, fee = fee)
+    new_backtest = Backtest(**columns)
     db.session.add(new_backtest)
     db.session.commit()
 
@@ -37,50 +112,293 @@ def run_backtest():
     # Publish backtest to Kafka for processing
     kafka_service.produce('backtest_scenes', {
         "backtest_id": new_backtest.id
-    })
+    }, key=str(new_backtest.id))
 
     return jsonify({"msg": "Backtest created and published to Kafka", "backtest_id": new_backtest.id}), 201
 
 
+@bp.route('/backtests/batch', methods=['POST'])
+@jwt_required()
+@cross_origin(origin='*')
+def run_backtests():
+    scenarios = request.get_json()
+    if isinstance(scenarios, dict):
+        scenarios = scenarios.get('backtests')
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({"msg": "Expected a list of backtests"}), 400
+    max_batch = int(os.getenv('BACKTEST_BATCH_MAX', '1000'))
+    if len(scenarios) > max_batch:
+        return jsonify({"msg": f"At most {max_batch} backtests per batch"}), 400
+
+    # All or nothing: one invalid scenario rejects the batch
+    rows = []
+    for idx, scenario in enumerate(scenarios):
+        try:
+            rows.append(parse_backtest(scenario))
+        except (ValueError, AttributeError, TypeError) as e:
+            return jsonify({"msg": f"Backtest {idx}: {e}"}), 400
+
+    # One query for every scenario that may already exist, narrowed down here
+    existing = Backtest.query.filter(
+        matching(Backtest.name, [row['name'] for row in rows]),
+        matching(Backtest.symbol, [row['symbol'] for row in rows]),
+        matching(Backtest.start_date, [row['start_date'] for row in rows]),
+    ).all()
+    ids = {backtest_key(vars(backtest)): backtest.id for backtest in existing}
+
+    new_rows = {}
+    for row in rows:
+        if backtest_key(row) not in ids:
+            new_rows.setdefault(backtest_key(row), row)
+    if new_rows:
+        # A single multi-row INSERT ... RETURNING, ids in the order of the rows
+        inserted = db.session.execute(insert(Backtest).returning(Backtest.id, sort_by_parameter_order=True), list(new_rows.values()))
+        ids.update(zip(new_rows, inserted.scalars().all()))
+        db.session.commit()
+
+    new_ids = [ids[key] for key in new_rows]
+    kafka_service.produce_batch('backtest_scenes', [{"backtest_id": backtest_id} for backtest_id in new_ids],
+                                keys=[str(backtest_id) for backtest_id in new_ids])
+
+    created = set(new_ids)
+    results = [{"backtest_id": ids[backtest_key(row)], "created": ids[backtest_key(row)] in created} for row in rows]
+    return jsonify({
+        "msg": f"{len(new_ids)} backtests created and published to Kafka, {len(rows) - len(new_ids)} already existed",
+        "backtests": results,
+    }), 201 if new_ids else 200
+
+
+def number(value):
+    return float(value) if value is not None else None
+
+
+def backtest_json(backtest):
+    return {
+        'id': backtest.id,
+        'name': backtest.name,
+        'symbol': backtest.symbol,
+        'symbols': backtest.symbols.split(',') if backtest.symbols else [backtest.symbol],
+        'start_date': backtest.start_date.strftime('%Y-%m-%d'),
+        'end_date': backtest.end_date.strftime('%Y-%m-%d'),
+        'inital_cash': backtest.inital_cash,
+        'fee': backtest.fee,
+        'walk_forward': json.loads(backtest.walk_forward) if backtest.walk_forward else None,
+        'created_at': backtest.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def result_json(result):
+    return {
+        'id': result.id,
+        'strategy': result.strategy,
+        'total_return': number(result.total_return),
+        'number_of_trades': result.number_of_trades,
+        'winning_trades': result.winning_trades,
+        'losing_trades': result.losing_trades,
+        'max_drawdown': number(result.max_drawdown),
+        'sharpe_ratio': number(result.sharpe_ratio),
+        'is_best': result.is_best
+    }
+
+
+def backtest_filters(args):
+    """WHERE clauses for the symbol, start_date, end_date, created_after and created_before query arguments."""
+    filters = []
+    if args.get('symbol'):
+        filters.append(Backtest.symbol == args['symbol'])
+    if args.get('start_date'):
+        filters.append(Backtest.start_date >= date.fromisoformat(args['start_date']))
+    if args.get('end_date'):
+        filters.append(Backtest.end_date <= date.fromisoformat(args['end_date']))
+    if args.get('created_after'):
+        filters.append(Backtest.created_at >= datetime.fromisoformat(args['created_after']))
+    if args.get('created_before'):
+        filters.append(Backtest.created_at < datetime.fromisoformat(args['created_before']))
+    return filters
+
+
+def listing(query, key, name, serialize):
+    """Rows of `query` in `key` order: one page, or all of them as NDJSON.
+
+    Pages are keyset-paginated: `after` is the last key of the previous page
+    (the `next` of its response) and `limit` the page size. With ?format=ndjson (or that
+    Accept type) every row is streamed as one JSON line instead, read from the
+    database in chunks rather than loaded at once.
+    """
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.where(key > after)
+    query = query.order_by(key)
+
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        limit = request.args.get('limit', type=int)
+        if limit:
+            query = query.limit(limit)
+
+        def generate():
+            for row in db.session.execute(query.execution_options(yield_per=1000)):
+                yield json.dumps(serialize(row)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    max_limit = int(os.getenv('BACKTEST_PAGE_MAX', '1000'))
+    limit = max(1, min(request.args.get('limit', 100, type=int), max_limit))
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    page = [serialize(row) for row in rows[:limit]]
+    return jsonify({name: page, 'next': page[-1]['id'] if len(rows) > limit else None}), 200
+
+
 @bp.route('/backtests', methods=['GET'])
 @jwt_required()
 @cross_origin(origin='*')
 def get_backtests():
-    backtests = Backtest.query.all()
-    backtest_list = []
-    for backtest in backtests:
-        backtest_list.append({
-            'id': backtest.id,
-            'name': backtest.name,
-            'symbol': backtest.symbol,
-            'start_date': backtest.start_date.strftime('%Y-%m-%d'),
-            'end_date': backtest.end_date.strftime('%Y-%m-%d'),
-            'inital_cash': backtest.inital_cash,
-            'fee': backtest.fee,
-            'created_at': backtest.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return jsonify({'backtests': backtest_list}), 200
+    try:
+        filters = backtest_filters(request.args)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    query = select(Backtest).where(*filters)
+    return listing(query, Backtest.id, 'backtests', lambda row: backtest_json(row.Backtest))
+
+
+@bp.route('/backtests/best', methods=['GET'])
+@jwt_required()
+@cross_origin(origin='*')
+def get_backtests_with_best_result():
+    # One joined query for the backtests and their best result, null while they have not run
+    try:
+        filters = backtest_filters(request.args)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    query = (select(Backtest, Result)
+             .outerjoin(Result, and_(Result.backtest_id == Backtest.id, Result.is_best.is_(True)))
+             .where(*filters))
+    return listing(query, Backtest.id, 'backtests',
+                   lambda row: dict(backtest_json(row.Backtest), best_result=result_json(row.Result) if row.Result else None))
+
 
 @bp.route('/backtests/<int:backtest_id>/results', methods=['GET'])
 @jwt_required()
 @cross_origin(origins='*')
 def get_backtest_results(backtest_id):
-    results = Result.query.filter_by(backtest_id=backtest_id).all()
-    if not results:
+    if not db.session.query(Result.query.filter_by(backtest_id=backtest_id).exists()).scalar():
         return jsonify({'msg': 'No results found for this backtest'}), 404
-    
-    result_list = []
-    for result in results:
-        result_list.append({
-            'id': result.id,
-            'strategy': result.strategy,
-            'total_return': float(result.total_return),
-            'number_of_trades': result.number_of_trades,
-            'winning_trades': result.winning_trades,
-            'losing_trades': result.losing_trades,
-            'max_drawdown': float(result.max_drawdown),
-            'sharpe_ratio': float(result.sharpe_ratio),
-            'is_best': result.is_best
+    query = select(Result).where(Result.backtest_id == backtest_id)
+    return listing(query, Result.id, 'results', lambda row: result_json(row.Result))
+
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+
+def result_series(result_id, column):
+    # The blob alone, found through the result's fingerprint
+    return db.session.execute(select(column).join(Result, Result.fingerprint == ResultSeries.fingerprint)
+                              .where(Result.id == result_id)).scalar()
+
+
+def iso_dates(values):
+    return np.datetime_as_string(values, unit='s').tolist()
+
+
+@bp.route('/results/<int:result_id>/equity', methods=['GET'])
+@jwt_required()
+@cross_origin(origins='*')
+def get_result_equity(result_id):
+    blob = result_series(result_id, ResultSeries.equity)
+    if blob is None:
+        return jsonify({'msg': 'No equity curve found for this result'}), 404
+    if request.args.get('format') == 'arrow':
+        return Response(blob, mimetype=ARROW_STREAM)
+
+    # Downsampled for charts: ?points= buckets (default 1000), 0 for every bar
+    points = request.args.get('points', 1000, type=int)
+    table = decode(blob)
+    series = downsample(table, points) if points > 0 else downsample(table, table.num_rows)
+    return jsonify({
+        'bars': table.num_rows,
+        'date': iso_dates(series['date']),
+        **{key: series[key].tolist() for key in ('equity', 'equity_min', 'equity_max', 'drawdown')}
+    }), 200
+
+
+@bp.route('/results/<int:result_id>/trades', methods=['GET'])
+@jwt_required()
+@cross_origin(origins='*')
+def get_result_trades(result_id):
+    blob = result_series(result_id, ResultSeries.trades)
+    if blob is None:
+        return jsonify({'msg': 'No trades found for this result'}), 404
+    if request.args.get('format') == 'arrow':
+        return Response(blob, mimetype=ARROW_STREAM)
+
+    table = decode(blob)
+    columns = {}
+    for column in table.column_names:
+        values = table.column(column).to_numpy()
+        columns[column] = iso_dates(values) if column.endswith('_date') else values.tolist()
+    trade_list = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return jsonify({'trades': trade_list}), 200
+
+
+@bp.route('/leaderboard', methods=['GET'])
+@jwt_required()
+@cross_origin(origins='*')
+def get_leaderboard():
+    # Best strategies per symbol and period, read from the materialized leaderboard table
+    args = request.args
+    try:
+        entries = top_strategies(
+            symbol=args.get('symbol'),
+            start_date=parse_date(args.get('start_date')),
+            end_date=parse_date(args.get('end_date')),
+            strategy=args.get('strategy'),
+            order_by=args.get('order_by', 'total_return'),
+            limit=max(1, min(args.get('limit', 20, type=int), int(os.getenv('BACKTEST_PAGE_MAX', '1000')))),
+        )
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    leaderboard = []
+    for entry in entries:
+        leaderboard.append({
+            'symbol': entry.symbol,
+            'start_date': entry.start_date.strftime('%Y-%m-%d'),
+            'end_date': entry.end_date.strftime('%Y-%m-%d'),
+            'strategy': entry.strategy,
+            'runs': entry.runs,
+            'wins': entry.wins,
+            'backtest_id': entry.backtest_id,
+            'result_id': entry.result_id,
+            'total_return': number(entry.total_return),
+            'number_of_trades': entry.number_of_trades,
+            'max_drawdown': number(entry.max_drawdown),
+            'sharpe_ratio': number(entry.sharpe_ratio)
         })
-    
-    return jsonify({'results': result_list}), 200
+    return jsonify({'leaderboard': leaderboard}), 200
+
+
+@bp.route('/backtests/<int:backtest_id>/windows', methods=['GET'])
+@jwt_required()
+@cross_origin(origins='*')
+def get_backtest_windows(backtest_id):
+    windows = WindowResult.query.filter_by(backtest_id=backtest_id).order_by(WindowResult.strategy, WindowResult.window).all()
+    if not windows:
+        return jsonify({'msg': 'No walk-forward windows found for this backtest'}), 404
+
+    window_list = []
+    for window in windows:
+        window_list.append({
+            'strategy': window.strategy,
+            'window': window.window,
+            'train_start': window.train_start.strftime('%Y-%m-%d'),
+            'train_end': window.train_end.strftime('%Y-%m-%d'),
+            'test_start': window.test_start.strftime('%Y-%m-%d'),
+            'test_end': window.test_end.strftime('%Y-%m-%d'),
+            'params': json.loads(window.params),
+            'total_return': float(window.total_return),
+            'number_of_trades': window.number_of_trades,
+            'winning_trades': window.winning_trades,
+            'losing_trades': window.losing_trades,
+            'max_drawdown': float(window.max_drawdown),
+            'sharpe_ratio': float(window.sharpe_ratio) if window.sharpe_ratio is not None else None
+        })
+
+    return jsonify({'windows': window_list}), 200
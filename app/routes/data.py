@@ -4,7 +4,6 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from app import db
 from app.models.backtest import Indicator, Coin
-from app.services.backtest_service import run_backtest_by_id
 from app.services.kafka_service import kafka_service
 
 # Define Blueprint
@@ -1,7 +1,12 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
+from app.services.kafka_service import kafka_service
 
 bp = Blueprint('index', __name__)
 
 @bp.route('/')
 def index():
     return "Welcome to the Backtest API!"
+
+@bp.route('/metrics/kafka')
+def kafka_metrics():
+    return jsonify(kafka_service.metrics()), 200
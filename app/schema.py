@@ -0,0 +1,33 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+# db.create_all() only creates the tables that are missing. Columns and indexes
+# added to the models since a database was created are added here at startup,
+# so deployed databases catch up with the models. Every statement is idempotent
+# (several workers may start at once) and only additions are made: a new column
+# must be nullable, existing ones are never altered or dropped.
+
+
+def upgrade_schema(engine, metadata):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    # SQLite has no IF NOT EXISTS for columns; the inspection above covers a single process
+    if_not_exists = 'IF NOT EXISTS ' if engine.dialect.name == 'postgresql' else ''
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable:
+                    logging.error(f"Cannot add NOT NULL column {table.name}.{column.name} to an existing table")
+                    continue
+                logging.info(f"Adding column {table.name}.{column.name}")
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {if_not_exists}"
+                                  f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"))
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
@@ -1,57 +1,114 @@
-from app.models.backtest import Backtest, Result
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from app.models.backtest import Backtest, Result, WindowResult
 from app import db
 from app.services.kafka_service import kafka_service
 from app.services.mlflow_service import mlflow_service
+from app.services.leaderboard_service import record_results, leaderboard_symbol
+from app.services.result_cache_service import cached_results, store_results, store_series
 from scripts.backtest_runner import RsiBollingerBandsStrategy, StochasticOscillatorStrategy, MacdStrategy
-from scripts.backtest_runner import run_backtest, score_backtest
+from scripts.backtest_runner import fetch_data, fetch_many, run_backtest, score_results
+from scripts.portfolio_backtest import run_portfolio_backtest
+from scripts.result_cache import data_version, fingerprint
+
+STRATEGIES = [
+    RsiBollingerBandsStrategy,
+    MacdStrategy,
+    StochasticOscillatorStrategy
+]
+
+# One worker per strategy, created on first use and reused across backtests
+_strategy_executor = None
+
+def get_strategy_executor():
+    global _strategy_executor
+    if _strategy_executor is None:
+        _strategy_executor = ProcessPoolExecutor(max_workers=int(os.getenv('BACKTEST_STRATEGY_WORKERS', len(STRATEGIES))))
+    return _strategy_executor
 
 def run_backtest_by_id(backtest_id):
     backtest = Backtest.query.get(backtest_id)
-    print('backtest', backtest.inital_cash)
     if not backtest:
         return
-    
-   
-    run_and_evaluate_backtest(backtest_id=backtest_id, symbol=backtest.symbol, initial_cash=backtest.inital_cash, fee=backtest.fee, start_date=backtest.start_date, end_date = backtest.end_date)
-
-
-def score_backtest(result, min_return, max_return, min_sharpe, max_sharpe, min_drawdown, max_drawdown):
-    weights = {
-        'total_return': 0.4,
-        'sharpe_ratio': 0.4,
-        'max_drawdown': 0.2,
-    }
-    
-    normalized_return = (result['total_return'] - min_return) / (max_return - min_return)
-    normalized_sharpe = (result['sharpe_ratio'] - min_sharpe) / (max_sharpe - min_sharpe)
-    normalized_drawdown = (max_drawdown - result['max_drawdown']) / (max_drawdown - min_drawdown)
-    
-    score = (
-        weights['total_return'] * normalized_return +
-        weights['sharpe_ratio'] * normalized_sharpe +
-        weights['max_drawdown'] * normalized_drawdown
-    )
-    return score
-
-def run_and_evaluate_backtest(backtest_id, symbol, initial_cash, fee, start_date, end_date):
-    strategies = [
-        RsiBollingerBandsStrategy,
-        MacdStrategy,
-        StochasticOscillatorStrategy
-    ]
-    
-    results = []
+    # Scenes are delivered at least once: a backtest whose results were committed has already run
+    if db.session.query(Result.query.filter_by(backtest_id=backtest_id).exists()).scalar():
+        logging.info(f"Backtest {backtest_id} already has results, skipping")
+        return
+    print('backtest', backtest.inital_cash)
+
+    symbols = backtest.symbols.split(',') if backtest.symbols else None
+    walk_forward = json.loads(backtest.walk_forward) if backtest.walk_forward else None
+    run_and_evaluate_backtest(backtest_id=backtest_id, symbol=backtest.symbol, initial_cash=backtest.inital_cash, fee=backtest.fee, start_date=backtest.start_date, end_date = backtest.end_date, symbols=symbols, walk_forward=walk_forward)
+
+
+def window_result(backtest_id, strategy, window):
+    columns = dict(window, params=json.dumps(window['params']))
+    for key in ('train_start', 'train_end', 'test_start', 'test_end'):
+        columns[key] = date.fromisoformat(window[key])
+    return WindowResult(backtest_id=backtest_id, strategy=strategy, **columns)
+
+
+def run_and_evaluate_backtest(backtest_id, symbol, initial_cash, fee, start_date, end_date, concurrent=True, symbols=None, walk_forward=None):
+    strategies = STRATEGIES
+    print(strategies, symbols or symbol, initial_cash, fee, start_date, end_date)
+
+    # Every strategy runs on the same OHLCV window, so load it once
+    options = {}
+    if symbols:
+        if walk_forward:
+            raise ValueError("Walk-forward is not supported for portfolio backtests.")
+        # Portfolio: all coins in one query and one Cerebro run per strategy
+        runner, target, data = run_portfolio_backtest, symbols, fetch_many(symbols, start_date, end_date)
+    else:
+        runner, target, data = run_backtest, symbol, fetch_data(symbol, start_date, end_date)
+        if walk_forward:
+            # Train and test windows of the range, see run_walk_forward
+            options['walk_forward'] = walk_forward
+
+    # Strategies already run on the same scenario and bars are read back instead of run again
+    version = data_version(data)
+    fingerprints = [fingerprint(strategy, target, start_date, end_date, initial_cash, fee, version, options=options) for strategy in strategies]
+    cached = cached_results(fingerprints)
+    to_run = [(strategy, key) for strategy, key in zip(strategies, fingerprints) if key not in cached]
+
+    # Single-symbol Cerebro runs also record their equity curve and trades
+    run_options = options if symbols or walk_forward else dict(options, series=True)
+    if walk_forward:
+        # The strategies run one after the other here and their windows in parallel, on the
+        # strategy pool: a pool per strategy inside that pool would oversubscribe the CPUs
+        pool = dict(executor=get_strategy_executor()) if concurrent else dict(max_workers=1)
+        computed = [runner(strategy, target, initial_cash, fee, start_date, end_date, data=data,
+                           walk_forward=dict(walk_forward, **pool)) for strategy, _ in to_run]
+    elif concurrent and len(to_run) > 1:
+        executor = get_strategy_executor()
+        futures = [executor.submit(runner, strategy, target, initial_cash, fee, start_date, end_date, data=data, **run_options) for strategy, _ in to_run]
+        computed = [future.result() for future in futures]
+    else:
+        computed = [runner(strategy, target, initial_cash, fee, start_date, end_date, data=data, **run_options) for strategy, _ in to_run]
+    series = [(key, result.pop('series')) for (_, key), result in zip(to_run, computed) if 'series' in result]
+    store_series(series)
+    symbol_key = leaderboard_symbol(symbol, symbols)
+    store_results(symbol_key, start_date, end_date, version,
+                  [(key, strategy.__name__, result) for (strategy, key), result in zip(to_run, computed)])
+    cached.update((key, result) for (_, key), result in zip(to_run, computed))
+    results = [dict(cached[key]) for key in fingerprints]
+
     result_objects = []
-    for strategy in strategies:
-        print(strategy, symbol, initial_cash, fee, start_date, end_date)
-        result = run_backtest(strategy, symbol, initial_cash, fee, start_date, end_date)
+    messages = []
+    run_metrics = {}
+    for strategy, result_fingerprint, result in zip(strategies, fingerprints, results):
         result['backtest_id'] = backtest_id
         result['strategy'] = strategy.__name__
-        
-        result_obj = Result(**result)
+
+        result_obj = Result(fingerprint=result_fingerprint, **{key: value for key, value in result.items() if key not in ('assets', 'windows')})
         db.session.add(result_obj)
         result_objects.append(result_obj)
-        
+        for window in result.get('windows', []):
+            db.session.add(window_result(backtest_id, strategy.__name__, window))
+
         metrics = {
             "total_return": result['total_return'],
             "number_of_trades": result['number_of_trades'],
@@ -60,32 +117,41 @@ def run_and_evaluate_backtest(backtest_id, symbol, initial_cash, fee, start_date
             "max_drawdown": result['max_drawdown'],
             "sharpe_ratio": result['sharpe_ratio']
         }
-        mlflow_service.log_metrics(run_name=f"Backtest_{backtest_id}", metrics=metrics)
-        
-        # publish results to Kafka
-        kafka_service.produce('backtest_results', {
+        message = {
             "backtest_id": backtest_id,
             "metrics": metrics
-        })
-        
-        db.session.commit()
-        results.append(result)
-    
-    min_return = min(result['total_return'] for result in results)
-    max_return = max(result['total_return'] for result in results)
-    min_sharpe = min(result['sharpe_ratio'] for result in results)
-    max_sharpe = max(result['sharpe_ratio'] for result in results)
-    min_drawdown = min(result['max_drawdown'] for result in results)
-    max_drawdown = max(result['max_drawdown'] for result in results)
-    
-    scores = [score_backtest(result, min_return, max_return, min_sharpe, max_sharpe, min_drawdown, max_drawdown) for result in results]
-    
+        }
+        for key, value in metrics.items():
+            if value is not None:
+                run_metrics[f"{strategy.__name__}_{key}"] = value
+        if 'assets' in result:
+            message["assets"] = result['assets']
+            for asset, asset_metrics in result['assets'].items():
+                for key, value in asset_metrics.items():
+                    run_metrics[f"{strategy.__name__}_{asset}_{key}"] = value
+        if 'windows' in result:
+            message["windows"] = result['windows']
+            for window in result['windows']:
+                for key, value in window.items():
+                    run_metrics[f"{strategy.__name__}_window{window['window']}_{key}"] = value
+        messages.append(message)
+
+    scores = score_results(results)
+
     best_strategy_index = scores.index(max(scores))
-    
+
     for idx, result_obj in enumerate(result_objects):
         result_obj.is_best = (idx == best_strategy_index)
-    
+
+    if not walk_forward:
+        # The leaderboard refers to the results by id, so they are flushed first; one commit covers both
+        db.session.flush()
+        record_results(symbol_key, start_date, end_date, result_objects)
+
+    # Side effects are batched: one commit, one MLflow run, one Kafka flush
     db.session.commit()
+    mlflow_service.log_metrics(run_name=f"Backtest_{backtest_id}", metrics=run_metrics)
+    kafka_service.produce_batch('backtest_results', messages)
 
     print("Best Strategy:")
     print(strategies[best_strategy_index].__name__)
@@ -93,6 +159,5 @@ def run_and_evaluate_backtest(backtest_id, symbol, initial_cash, fee, start_date
     print(scores[best_strategy_index])
     print("Metrics:")
     print(results[best_strategy_index])
-    
-    return results
 
+    return results
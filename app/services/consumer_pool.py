@@ -0,0 +1,60 @@
+import logging
+import multiprocessing
+import signal
+import threading
+
+# Consumer processes in one Kafka group. Kafka spreads the topic's partitions
+# over the group's members, so each worker owns a share of the partitions and
+# throughput grows with the number of workers (up to the partition count).
+# Workers are forked so they inherit the caller's app; they are not daemonic
+# because backtests start their own process pools.
+
+
+def _run_worker(target, args):
+    # SIGTERM asks the loop to stop after the message in hand, so its offset is committed
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    # Ctrl-C reaches the whole process group; the parent decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(*args, stop=stop)
+
+
+class ConsumerPool:
+    def __init__(self, target, workers, args=(), check_interval=5.0):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.check_interval = check_interval
+        self.processes = []
+        self._context = multiprocessing.get_context('fork')
+        self._stopping = threading.Event()
+        self._supervisor = None
+
+    def _spawn(self):
+        process = self._context.Process(target=_run_worker, args=(self.target, self.args))
+        process.start()
+        logging.info(f"Started consumer worker {process.pid}")
+        return process
+
+    def start(self):
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self):
+        # A worker that dies is replaced; its partitions go back to the group meanwhile
+        while not self._stopping.wait(self.check_interval):
+            for idx, process in enumerate(self.processes):
+                if not process.is_alive() and not self._stopping.is_set():
+                    logging.error(f"Consumer worker {process.pid} exited with {process.exitcode}, restarting")
+                    self.processes[idx] = self._spawn()
+
+    def stop(self, timeout=30):
+        self._stopping.set()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
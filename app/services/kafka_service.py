@@ -1,54 +1,231 @@
+import atexit
 import logging
-from confluent_kafka.admin import AdminClient, NewTopic
+import os
+import threading
+import time
+from confluent_kafka.admin import AdminClient, NewTopic, NewPartitions
 from confluent_kafka import Producer, Consumer, KafkaException, KafkaError
 import json
 from decimal import Decimal
 
 class KafkaService:
-    def __init__(self, brokers):
+    def __init__(self, brokers, group_id='backtest_group', num_partitions=None):
         self.brokers = brokers
-        self.producer = Producer({'bootstrap.servers': brokers})
-        self.consumer = Consumer({
+        self.group_id = group_id
+        self.num_partitions = num_partitions or int(os.getenv('KAFKA_NUM_PARTITIONS', '1'))
+        # Backtests can run for minutes between polls
+        self.max_poll_interval_ms = int(os.getenv('KAFKA_MAX_POLL_INTERVAL_MS', '1800000'))
+        # Producer batching: wait up to linger.ms to fill batches, optionally compressed
+        self.producer_config = {
             'bootstrap.servers': brokers,
-            'group.id': 'backtest_group',
-            'auto.offset.reset': 'earliest'
+            'linger.ms': int(os.getenv('KAFKA_LINGER_MS', '20')),
+            'batch.num.messages': int(os.getenv('KAFKA_BATCH_MESSAGES', '1000')),
+            'compression.type': os.getenv('KAFKA_COMPRESSION', 'none'),
+        }
+        self._clients = {}
+        self._pid = None
+        self._stats = {'produced': 0, 'delivered': 0, 'failed': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        self._stats_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _client(self, name, factory):
+        # librdkafka clients do not survive a fork, so each process builds its own
+        if self._pid != os.getpid():
+            self._clients = {}
+            self._pid = os.getpid()
+        if name not in self._clients:
+            self._clients[name] = factory()
+        return self._clients[name]
+
+    @property
+    def producer(self):
+        return self._client('producer', self._start_producer)
+
+    def _start_producer(self):
+        producer = Producer(self.producer_config)
+        # Delivery callbacks only run inside poll(), so serve them in the background
+        stop = threading.Event()
+        poller = threading.Thread(target=self._poll_producer, args=(producer, stop), daemon=True)
+        poller.start()
+        self._clients['producer_stop'] = stop
+        return producer
+
+    def _poll_producer(self, producer, stop):
+        while not stop.is_set():
+            producer.poll(0.1)
+
+    def _on_delivery(self, sent_at, then=None):
+        def callback(err, msg):
+            latency = time.monotonic() - sent_at
+            with self._stats_lock:
+                if err is not None:
+                    self._stats['failed'] += 1
+                else:
+                    self._stats['delivered'] += 1
+                    self._stats['latency_total'] += latency
+                    self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+            if err is not None:
+                logging.error(f"Failed to deliver message to {msg.topic()}: {err}")
+            if then is not None:
+                then(err, msg)
+        return callback
+
+    def _send(self, topic, value, key=None, headers=None, on_delivery=None):
+        while True:
+            try:
+                self.producer.produce(topic, key=key, value=value, headers=headers,
+                                      on_delivery=self._on_delivery(time.monotonic(), then=on_delivery))
+                break
+            except BufferError:
+                # Local queue is full: wait for deliveries to free some room
+                self.producer.poll(0.5)
+        with self._stats_lock:
+            self._stats['produced'] += 1
+
+    def _has_producer(self):
+        return 'producer' in self._clients and self._pid == os.getpid()
+
+    def flush(self, timeout=30):
+        """Block until queued messages are delivered; returns how many are still queued."""
+        if not self._has_producer():
+            return 0
+        return self.producer.flush(timeout)
+
+    def close(self):
+        remaining = self.flush()
+        if remaining:
+            logging.error(f"{remaining} Kafka messages not delivered at shutdown")
+        if self._has_producer():
+            self._clients['producer_stop'].set()
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {
+            'produced': stats['produced'],
+            'delivered': stats['delivered'],
+            'failed': stats['failed'],
+            'queue_depth': len(self.producer) if self._has_producer() else 0,
+            'latency_avg_ms': 1000 * stats['latency_total'] / stats['delivered'] if stats['delivered'] else 0.0,
+            'latency_max_ms': 1000 * stats['latency_max'],
+        }
+
+    @property
+    def admin_client(self):
+        return self._client('admin_client', lambda: AdminClient({'bootstrap.servers': self.brokers}))
+
+    def new_consumer(self):
+        # Offsets are committed by hand once a message has been handled
+        return Consumer({
+            'bootstrap.servers': self.brokers,
+            'group.id': self.group_id,
+            'auto.offset.reset': 'earliest',
+            'enable.auto.commit': False,
+            'max.poll.interval.ms': self.max_poll_interval_ms,
         })
-        self.admin_client = AdminClient({'bootstrap.servers': brokers})
 
-    def create_topic(self, topic):
+    def create_topic(self, topic, num_partitions=None):
+        num_partitions = num_partitions or self.num_partitions
         topic_metadata = self.admin_client.list_topics(timeout=10)
         if topic not in topic_metadata.topics:
             logging.info(f"Creating topic {topic}")
-            new_topic = NewTopic(topic, num_partitions=1, replication_factor=1)
+            new_topic = NewTopic(topic, num_partitions=num_partitions, replication_factor=1)
             fs = self.admin_client.create_topics([new_topic])
-            for topic, f in fs.items():
-                try:
-                    f.result()  # The result itself is None
-                    logging.info(f"Topic {topic} created successfully")
-                except Exception as e:
-                    logging.error(f"Failed to create topic {topic}: {str(e)}")
+        elif len(topic_metadata.topics[topic].partitions) < num_partitions:
+            # Partitions can only be added; more of them lets more workers share the topic
+            logging.info(f"Growing topic {topic} to {num_partitions} partitions")
+            fs = self.admin_client.create_partitions([NewPartitions(topic, num_partitions)])
         else:
             logging.info(f"Topic {topic} already exists")
+            return
+        for topic, f in fs.items():
+            try:
+                f.result()  # The result itself is None
+                logging.info(f"Topic {topic} updated successfully")
+            except Exception as e:
+                logging.error(f"Failed to update topic {topic}: {str(e)}")
 
     def json_serializer(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)
         raise TypeError("Type not serializable")
 
-    def produce(self, topic, message):
+    def produce(self, topic, message, key=None, sync=False):
+        """Queue a message; delivery happens in the background unless `sync`."""
         logging.info(f"Producing message to topic {topic}: {message}")
         serialized_message = json.dumps(message, default=self.json_serializer)
-        self.producer.produce(topic, key=None, value=serialized_message)
-        self.producer.flush()
-        logging.info("Message produced successfully")
+        self._send(topic, serialized_message, key=key)
+        if sync:
+            self.flush()
+
+    def produce_batch(self, topic, messages, sync=False, keys=None):
+        logging.info(f"Producing {len(messages)} messages to topic {topic}")
+        for message, key in zip(messages, keys or [None] * len(messages)):
+            serialized_message = json.dumps(message, default=self.json_serializer)
+            self._send(topic, serialized_message, key=key)
+        if sync:
+            self.flush()
+
+    def dead_letter(self, dead_letter_topic, msg, error, timeout=30):
+        """Copy `msg` to `dead_letter_topic`; raises KafkaException unless the copy was delivered."""
+        logging.error(f"Moving message {msg.topic()}[{msg.partition()}]@{msg.offset()} to {dead_letter_topic}: {error}")
+        delivered = threading.Event()
+        report = {}
+
+        def on_delivery(err, dlq_msg):
+            report['err'] = err
+            delivered.set()
 
-    def consume(self, topic, callback):
+        self._send(dead_letter_topic, msg.value(), key=msg.key(), headers={
+            'error': str(error),
+            'source_topic': msg.topic(),
+            'source_partition': str(msg.partition()),
+            'source_offset': str(msg.offset()),
+        }, on_delivery=on_delivery)
+        # The offset is committed next, so the copy must be durable first
+        self.flush(timeout)
+        if not delivered.wait(timeout):
+            raise KafkaException(KafkaError(KafkaError._MSG_TIMED_OUT, f"Dead letter copy to {dead_letter_topic} not delivered in {timeout}s"))
+        if report['err'] is not None:
+            raise KafkaException(report['err'])
+
+    def handle(self, msg, callback, dead_letter_topic, retries=2, backoff=1.0):
+        try:
+            message = json.loads(msg.value())
+        except ValueError as e:
+            self.dead_letter(dead_letter_topic, msg, e)
+            return
+        for attempt in range(retries + 1):
+            try:
+                callback(message)
+                return
+            except Exception as e:
+                logging.error(f"Error handling message (attempt {attempt + 1}): {str(e)}")
+                error = e
+                if attempt < retries:
+                    time.sleep(backoff * 2 ** attempt)
+        self.dead_letter(dead_letter_topic, msg, error)
+
+    def consume(self, topic, callback, dead_letter_topic=None, stop=None, retries=2):
+        """Run `callback` on every message of `topic` until `stop` is set.
+
+        Each call has its own consumer in the service's group, so several calls
+        (threads or processes) split the topic's partitions between them. Offsets
+        are committed after the callback returns; messages that cannot be decoded
+        or keep failing go to `dead_letter_topic` (`<topic>_dlq` by default), and
+        if that copy is not delivered the consumer stops without committing. The
+        messages the callbacks produced are flushed before returning: forked
+        workers exit without running atexit handlers.
+        """
+        dead_letter_topic = dead_letter_topic or f'{topic}_dlq'
         self.create_topic(topic)
-        self.consumer.subscribe([topic])
+        self.create_topic(dead_letter_topic, num_partitions=1)
+        consumer = self.new_consumer()
+        consumer.subscribe([topic])
         logging.info(f"Subscribed to topic {topic}")
         try:
-            while True:
-                msg = self.consumer.poll(timeout=1.0)
+            while stop is None or not stop.is_set():
+                msg = consumer.poll(timeout=1.0)
                 if msg is None:
                     logging.debug("No message received")
                     continue
@@ -56,14 +233,20 @@ class KafkaService:
                     if msg.error().code() == KafkaError._PARTITION_EOF:
                         logging.info("End of partition reached")
                         continue
-                    else:
-                        logging.error(f"Consumer error: {msg.error()}")
+                    if msg.error().fatal():
                         raise KafkaException(msg.error())
+                    logging.error(f"Consumer error: {msg.error()}")
+                    continue
                 logging.info(f"Received message: {msg.value()}")
-                callback(json.loads(msg.value()))
+                self.handle(msg, callback, dead_letter_topic, retries=retries)
+                consumer.commit(message=msg, asynchronous=False)
         except Exception as e:
             logging.error(f"Error in Kafka consumer: {str(e)}")
+            raise
         finally:
-            self.consumer.close()
+            consumer.close()
+            remaining = self.flush()
+            if remaining:
+                logging.error(f"{remaining} Kafka messages not delivered when the consumer stopped")
 
-kafka_service = KafkaService(brokers='localhost:9092')
+kafka_service = KafkaService(brokers=os.getenv('KAFKA_BROKERS', 'localhost:9092'))
@@ -0,0 +1,99 @@
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.backtest import Backtest, Result, LeaderboardEntry
+
+# The leaderboard keeps, for every symbol, period (start and end date) and
+# strategy, its best result over all the backtests run on them, how many times
+# it ran there and how many times it was the best strategy of its backtest.
+# Each finished backtest is folded in with one upsert, so reading the
+# leaderboard never goes through the results. Best is the highest total
+# return; on a tie the earlier result stays.
+#
+# Walk-forward backtests are left out: their metrics only cover the test periods.
+
+KEY_COLUMNS = ('symbol', 'start_date', 'end_date', 'strategy')
+BEST_COLUMNS = ('backtest_id', 'result_id', 'total_return', 'number_of_trades', 'max_drawdown', 'sharpe_ratio')
+ORDER_COLUMNS = ('total_return', 'sharpe_ratio', 'max_drawdown', 'wins', 'runs')
+
+
+def leaderboard_symbol(symbol, symbols=None):
+    return ','.join(symbols) if symbols else symbol
+
+
+def entry(symbol, start_date, end_date, result):
+    return dict(
+        symbol=symbol,
+        start_date=start_date,
+        end_date=end_date,
+        strategy=result.strategy,
+        runs=1,
+        wins=1 if result.is_best else 0,
+        backtest_id=result.backtest_id,
+        result_id=result.id,
+        total_return=result.total_return,
+        number_of_trades=result.number_of_trades,
+        max_drawdown=result.max_drawdown,
+        sharpe_ratio=result.sharpe_ratio,
+    )
+
+
+def upsert(entries):
+    # INSERT ... ON CONFLICT, the same statement on PostgreSQL and SQLite
+    table = LeaderboardEntry.__table__
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(table).values(entries)
+    better = stmt.excluded.total_return > table.c.total_return
+    stmt = stmt.on_conflict_do_update(index_elements=KEY_COLUMNS, set_=dict(
+        runs=table.c.runs + stmt.excluded.runs,
+        wins=table.c.wins + stmt.excluded.wins,
+        updated_at=db.func.current_timestamp(),
+        **{column: case((better, stmt.excluded[column]), else_=table.c[column]) for column in BEST_COLUMNS},
+    ))
+    db.session.execute(stmt)
+
+
+def record_results(symbol, start_date, end_date, results):
+    """Fold the flushed Result rows of one backtest into the leaderboard, in the caller's transaction."""
+    if results:
+        upsert([entry(symbol, start_date, end_date, result) for result in results])
+
+
+def rebuild_leaderboard(chunk_size=1000):
+    """Recompute the leaderboard from every result, e.g. after results were deleted."""
+    db.session.execute(delete(LeaderboardEntry))
+    query = (select(Backtest.symbol, Backtest.symbols, Backtest.start_date, Backtest.end_date, Result)
+             .join(Result, Result.backtest_id == Backtest.id)
+             .where(Backtest.walk_forward.is_(None))
+             .order_by(Result.id))
+    entries = {}
+    for symbol, symbols, start_date, end_date, result in db.session.execute(query.execution_options(yield_per=chunk_size)):
+        new = entry(leaderboard_symbol(symbol, symbols and symbols.split(',')), start_date, end_date, result)
+        key = tuple(new[column] for column in KEY_COLUMNS)
+        current = entries.get(key)
+        if current is None:
+            entries[key] = new
+            continue
+        current['runs'] += 1
+        current['wins'] += new['wins']
+        if new['total_return'] > current['total_return']:
+            current.update({column: new[column] for column in BEST_COLUMNS})
+
+    entries = list(entries.values())
+    for start in range(0, len(entries), chunk_size):
+        upsert(entries[start:start + chunk_size])
+    db.session.commit()
+    return len(entries)
+
+
+def top_strategies(symbol=None, start_date=None, end_date=None, strategy=None, order_by='total_return', limit=20):
+    """Leaderboard entries matching the filters, best first by `order_by` (smallest first for max_drawdown)."""
+    if order_by not in ORDER_COLUMNS:
+        raise ValueError(f"order_by must be one of {', '.join(ORDER_COLUMNS)}")
+    filters = {'symbol': symbol, 'start_date': start_date, 'end_date': end_date, 'strategy': strategy}
+    column = getattr(LeaderboardEntry, order_by)
+    query = (select(LeaderboardEntry)
+             .filter_by(**{key: value for key, value in filters.items() if value is not None})
+             .order_by((column.asc() if order_by == 'max_drawdown' else column.desc()).nulls_last(), LeaderboardEntry.id)
+             .limit(limit))
+    return db.session.execute(query).scalars().all()
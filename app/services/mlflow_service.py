@@ -1,25 +1,22 @@
-import mlflow
-import mlflow.sklearn
+import os
+from scripts.mlflow_tracking import MlflowTracker
 
 class MLflowService:
     def __init__(self, tracking_uri, experiment_name):
-        mlflow.set_tracking_uri(tracking_uri)
+        self.tracking_uri = tracking_uri
         self.experiment_name = experiment_name
-        self.experiment_id = self.get_or_create_experiment_id(experiment_name)
+        # Nothing is contacted until the first run is sent, from a background thread
+        self.tracker = MlflowTracker(tracking_uri, experiment_name)
 
-    def get_or_create_experiment_id(self, experiment_name):
-        experiment = mlflow.get_experiment_by_name(experiment_name)
-        if experiment is None:
-            experiment_id = mlflow.create_experiment(experiment_name)
-        else:
-            experiment_id = experiment.experiment_id
-        return experiment_id
+    def log_metrics(self, run_name, metrics, params=None):
+        # Queued: the backtest never waits on the tracking server
+        self.tracker.log_run(run_name, metrics, params=params)
 
-    def log_metrics(self, run_name, metrics):
-        with mlflow.start_run(experiment_id=self.experiment_id, run_name=run_name):
-            for key, value in metrics.items():
-                print(key, value)
-                mlflow.log_metric(key, value)
+    def flush(self, timeout=30):
+        return self.tracker.flush(timeout)
+
+    def close(self, timeout=10):
+        self.tracker.close(timeout)
 
 # Initialize the MLflowService with the desired experiment name
-mlflow_service = MLflowService(tracking_uri='http://localhost:5050', experiment_name='Backtest_Results')
+mlflow_service = MLflowService(tracking_uri=os.getenv('MLFLOW_TRACKING_URI', 'http://localhost:5050'), experiment_name='Backtest_Results')
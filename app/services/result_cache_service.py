@@ -0,0 +1,61 @@
+import json
+import os
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.backtest import CachedResult, ResultSeries
+from scripts.result_series import encode_equity, encode_trades
+
+# Database side of the result cache: results stored by fingerprint, shared by
+# all workers. Stored together with the backtest's results, in its transaction.
+# Setting RESULT_CACHE=0 turns it off. The equity curves and trade logs of the
+# runs are kept by fingerprint as well, whether the cache is on or not.
+
+
+def result_cache_enabled():
+    return os.getenv('RESULT_CACHE', '1') != '0'
+
+
+def _insert(table):
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    return dialect.insert(table)
+
+
+def cached_results(fingerprints):
+    """{fingerprint: result} of the fingerprints already computed, in one query."""
+    if not fingerprints or not result_cache_enabled():
+        return {}
+    rows = db.session.execute(select(CachedResult.fingerprint, CachedResult.result)
+                              .where(CachedResult.fingerprint.in_(set(fingerprints))))
+    return {fingerprint: json.loads(result) for fingerprint, result in rows}
+
+
+def store_results(symbol, start_date, end_date, data_version, entries):
+    """Store [(fingerprint, strategy, result)] computed on `data_version`.
+
+    Results of the same symbol and dates computed on other versions of the data
+    are deleted: they can no longer be hit.
+    """
+    if not entries or not result_cache_enabled():
+        return
+    rows = [dict(fingerprint=fingerprint, symbol=symbol, start_date=start_date, end_date=end_date, strategy=strategy,
+                 data_version=data_version, result=json.dumps(result, default=lambda value: value.item()))
+            for fingerprint, strategy, result in entries]
+    # Another worker may have stored the same fingerprints meanwhile
+    db.session.execute(_insert(CachedResult.__table__).values(rows).on_conflict_do_nothing(index_elements=['fingerprint']))
+    db.session.execute(delete(CachedResult).where(
+        CachedResult.symbol == symbol,
+        CachedResult.start_date == start_date,
+        CachedResult.end_date == end_date,
+        CachedResult.data_version != data_version,
+    ))
+
+
+def store_series(entries):
+    """Store [(fingerprint, series)] of SeriesRecorder analyses, a row each, all in one INSERT."""
+    if not entries:
+        return
+    rows = [dict(fingerprint=fingerprint, bars=len(series['equity']), number_of_trades=len(series['trades']['pnl']),
+                 equity=encode_equity(series), trades=encode_trades(series))
+            for fingerprint, series in entries]
+    db.session.execute(_insert(ResultSeries.__table__).values(rows).on_conflict_do_nothing(index_elements=['fingerprint']))
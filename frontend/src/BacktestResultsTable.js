@@ -12,12 +12,20 @@ const BacktestResultsTable = ({ token }) => {
   useEffect(() => {
     const fetchBacktests = async () => {
       try {
-        const response = await axios.get(`${API_BASE_URL}/backtests`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        setBacktests(response.data.backtests);
+        // The list comes in pages; `next` is the cursor of the following one
+        const all = [];
+        let after = null;
+        do {
+          const response = await axios.get(`${API_BASE_URL}/backtests`, {
+            headers: {
+              Authorization: `Bearer ${token}`,
+            },
+            params: after === null ? {} : { after },
+          });
+          all.push(...response.data.backtests);
+          after = response.data.next;
+        } while (after !== null && after !== undefined);
+        setBacktests(all);
       } catch (error) {
         console.error('Error fetching backtests:', error);
       }
@@ -1,3 +1,4 @@
  mlflow server --host 127.0.0.1 --port 5050
  python run.py
+ python worker.py
  cd frontend && npm install && npm run start 
\ No newline at end of file
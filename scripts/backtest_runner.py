@@ -1,47 +1,167 @@
 import pandas as pd
+import numpy as np
 from sqlalchemy import create_engine
 import backtrader as bt
 import os
+import logging
+from array import array
+from scripts.ohlcv_cache import get_ohlcv_cache
+from scripts.ohlcv_db import canonical_symbol, query_range, query_symbols_range, query_ohlcv_version
+from scripts.frame_cache import FrameCache, get_frame_cache
+from scripts.indicator_store import INDICATORS, get_indicator_store
+from scripts.result_series import num_to_ns
 
-# RDS connection information
-rds_host = os.getenv('PG_HOST')
-rds_port = os.getenv('PG_PORT')
-rds_db = os.getenv('PG_DATABASE')
-rds_user = os.getenv('PG_USER')
-rds_password = os.getenv('PG_PASSWORD')
+_engine = None
 
-engine = create_engine(f'postgresql+psycopg2://{rds_user}:{rds_password}@{rds_host}:{rds_port}/{rds_db}')
+def get_engine():
+    # Built on first query, so importing the runner needs no database settings
+    global _engine
+    if _engine is None:
+        # RDS connection information
+        rds_host = os.getenv('PG_HOST')
+        rds_port = os.getenv('PG_PORT')
+        rds_db = os.getenv('PG_DATABASE')
+        rds_user = os.getenv('PG_USER')
+        rds_password = os.getenv('PG_PASSWORD')
+        _engine = create_engine(f'postgresql+psycopg2://{rds_user}:{rds_password}@{rds_host}:{rds_port}/{rds_db}')
+    return _engine
+
+def query_ohlcv(symbol, start_date, end_date):
+    data = query_range(get_engine(), symbol, start_date, end_date)
+    print(f"Fetched data:\n{data.head()}\n")  # Print the first few rows of fetched data for debugging
+    return normalize_ohlcv(data)
+
+def normalize_ohlcv(data):
+    # Convert 'date' column to datetime
+    data['date'] = pd.to_datetime(data['date'], format='%Y-%m-%d')
+    
+    # Set 'date' column as index
+    data.set_index('date', inplace=True)
+    
+    # Ensure column names are correctly capitalized for Backtrader
+    data.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}, inplace=True)
+
+    return data
+
+def fetch_many(symbols, start_date, end_date):
+    """{symbol: frame} for several symbols, read with a single query on the unified table."""
+    bars = query_symbols_range(get_engine(), symbols, start_date, end_date)
+    frames = {symbol: normalize_ohlcv(group.drop(columns='symbol').reset_index(drop=True))
+              for symbol, group in bars.groupby('symbol', sort=False)}
+    missing = [symbol for symbol in symbols if canonical_symbol(symbol) not in frames]
+    if missing:
+        raise ValueError(f"No data returned for {', '.join(missing)}.")
+    return {symbol: frames[canonical_symbol(symbol)] for symbol in symbols}
+
+def ohlcv_version(symbol):
+    return query_ohlcv_version(get_engine(), symbol)
 
 def fetch_data(symbol, start_date, end_date):
-    query = f"""
-        SELECT timestamp AS date, open AS open, high AS high, low AS low, close AS close, volume AS volume 
-        FROM public."ohlcv_{symbol.replace('/', '_')}"
-        WHERE timestamp >= '{start_date}' AND timestamp <= '{end_date}';
-    """
+    # Bursts of backtests on the same window reuse the frame prepared in this process
+    frame_cache = get_frame_cache()
+    key = FrameCache.key(symbol, start_date, end_date)
+    if frame_cache is not None:
+        data = frame_cache.get(key)
+        if data is not None:
+            logging.debug(f"Frame cache hit for {key}: {frame_cache.stats()}")
+            return data
+
     try:
-        print(f"Executing query:\n{query}\n")  # Print the SQL query for debugging purposes
-        
-        data = pd.read_sql(query, con=engine)
-        print(f"Fetched data:\n{data.head()}\n")  # Print the first few rows of fetched data for debugging
+        cache = get_ohlcv_cache()
+        if cache is not None:
+            data = cache.get(symbol, start_date, end_date, query_ohlcv, ohlcv_version)
+        else:
+            data = query_ohlcv(symbol, start_date, end_date)
         
         # Check if data is empty
         if data.empty:
             raise ValueError("No data returned from query.")
-        
-        # Convert 'date' column to datetime
-        data['date'] = pd.to_datetime(data['date'], format='%Y-%m-%d')
-        
-        # Set 'date' column as index
-        data.set_index('date', inplace=True)
-        
-        # Ensure column names are correctly capitalized for Backtrader
-        data.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}, inplace=True)
 
+        if frame_cache is not None:
+            frame_cache.put(key, data)
+            logging.debug(f"Frame cache miss for {key}: {frame_cache.stats()}")
         return data
     except Exception as e:
         print(f"Error fetching data: {e}")
         raise
 
+class StoredIndicator(bt.Indicator):
+    # Lines filled from precomputed values instead of being calculated
+    params = (
+        ('values', ()),
+        ('warmup', 0),
+    )
+
+    def __init__(self):
+        self.addminperiod(self.p.warmup + 1)
+
+    def next(self):
+        for line, values in zip(self.lines, self.p.values):
+            line[0] = values[len(self) - 1]
+
+    def once(self, start, end):
+        for line, values in zip(self.lines, self.p.values):
+            line.array[start:end] = array('d', values[start:end])
+
+
+_stored_indicator_classes = {}
+
+
+def indicator(strategy, name, fallback, **params):
+    """`fallback(**params)`, or the same lines read from the indicator store when the feed has one."""
+    lines = getattr(strategy.data, 'indicator_lines', None)
+    if lines is None:
+        return fallback(**params)
+    if name not in _stored_indicator_classes:
+        # Same line names as the backtrader indicator, for the lines the store keeps
+        _stored_indicator_classes[name] = type(f'Stored{fallback.__name__}', (StoredIndicator,), {'lines': INDICATORS[name][3]})
+    values = lines(name, params)
+    warmup = max(np.argmax(~np.isnan(line)) if (~np.isnan(line)).any() else len(line) for line in values)
+    return _stored_indicator_classes[name](values=values, warmup=int(warmup))
+
+
+def attach_indicator_store(data_feed, symbol, data):
+    # Strategies then read their indicators from the store (see indicator())
+    store = get_indicator_store()
+    if store is not None and symbol is not None:
+        data_feed.indicator_lines = lambda name, params: store.series(symbol, name, params, data)
+
+
+class SeriesRecorder(bt.Analyzer):
+    # Broker value on every bar and the closed trades, see scripts/result_series.py
+    def start(self):
+        self.dates = array('d')
+        self.equity = array('d')
+        self.opened = {}
+        self.trades = []
+
+    def next(self):
+        self.dates.append(self.data.datetime[0])
+        self.equity.append(self.strategy.broker.getvalue())
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self.opened[trade.ref] = trade.size
+        elif trade.isclosed:
+            self.trades.append((trade.dtopen, trade.dtclose, self.opened.pop(trade.ref, 0.0), trade.price,
+                                trade.pnl, trade.pnlcomm, trade.barlen))
+
+    def get_analysis(self):
+        trades = np.array(self.trades, dtype=float).reshape(len(self.trades), 7)
+        return {
+            'dates': num_to_ns(self.dates),
+            'equity': np.frombuffer(self.equity, dtype=float),
+            'trades': {
+                'open_date': num_to_ns(trades[:, 0]),
+                'close_date': num_to_ns(trades[:, 1]),
+                'size': trades[:, 2],
+                'price': trades[:, 3],
+                'pnl': trades[:, 4],
+                'pnlcomm': trades[:, 5],
+                'bars': trades[:, 6].astype(np.int32),
+            },
+        }
+
 class RsiBollingerBandsStrategy(bt.Strategy):
     params = (
         ('rsi_period', 14),
@@ -52,8 +172,8 @@ class RsiBollingerBandsStrategy(bt.Strategy):
     )
 
     def __init__(self):
-        self.rsi = bt.indicators.RelativeStrengthIndex(period=self.params.rsi_period)
-        self.bbands = bt.indicators.BollingerBands(period=self.params.bb_period, devfactor=self.params.bb_dev)
+        self.rsi = indicator(self, 'rsi', bt.indicators.RelativeStrengthIndex, period=self.params.rsi_period)
+        self.bbands = indicator(self, 'bollinger_bands', bt.indicators.BollingerBands, period=self.params.bb_period, devfactor=self.params.bb_dev)
 
     def next(self):
         if not self.position:
@@ -71,7 +191,7 @@ class MacdStrategy(bt.Strategy):
     )
 
     def __init__(self):
-        self.macd = bt.indicators.MACDHisto(period_me1=self.params.macd1_period, period_me2=self.params.macd2_period, period_signal=self.params.signal_period)
+        self.macd = indicator(self, 'macd_histogram', bt.indicators.MACDHisto, period_me1=self.params.macd1_period, period_me2=self.params.macd2_period, period_signal=self.params.signal_period)
 
     def next(self):
         if not self.position:
@@ -89,7 +209,7 @@ class StochasticOscillatorStrategy(bt.Strategy):
     )
 
     def __init__(self):
-        self.stoch = bt.indicators.Stochastic(period=self.params.stoch_period)
+        self.stoch = indicator(self, 'stochastic', bt.indicators.Stochastic, period=self.params.stoch_period)
 
     def next(self):
         if not self.position:
@@ -100,12 +220,65 @@ class StochasticOscillatorStrategy(bt.Strategy):
                 self.sell()
 
 
-def run_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date):
-    data = fetch_data(symbol, start_date, end_date)
+def trading_after(strategy_class, warmup_bars):
+    """`strategy_class` with its orders dropped on the first `warmup_bars` bars, which only warm its indicators up."""
+    def buy(self, *args, **kwargs):
+        if len(self.data) > warmup_bars:
+            return strategy_class.buy(self, *args, **kwargs)
+
+    def sell(self, *args, **kwargs):
+        if len(self.data) > warmup_bars:
+            return strategy_class.sell(self, *args, **kwargs)
+
+    return type(strategy_class.__name__, (strategy_class,), {'buy': buy, 'sell': sell})
+
+
+def run_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date, vectorized=False, data=None, params=None, walk_forward=None, series=False, warmup_bars=0):
+    """Metrics of `strategy_class` over the range (or `data`).
+
+    The first `warmup_bars` bars only warm the indicators up: no order is placed
+    on them and the metrics cover the bars after them.
+    """
+    if data is None:
+        data = fetch_data(symbol, start_date, end_date)
+
+    if walk_forward:
+        # {'train_bars': .., 'test_bars': .., ...}, see run_walk_forward
+        from scripts.walk_forward import run_walk_forward
+        return run_walk_forward(strategy_class, symbol, initial_cash, fee, start_date, end_date, vectorized=vectorized, data=data, **walk_forward)
+
+    if vectorized:
+        from scripts.vectorized_backtest import run_vectorized_backtest
+        return run_vectorized_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date, data=data, params=params,
+                                       warmup_bars=warmup_bars)
+
+    if warmup_bars:
+        strategy_class = trading_after(strategy_class, warmup_bars)
+    cerebro = build_cerebro(strategy_class, data, initial_cash, fee, symbol=symbol, params=params, series=series or warmup_bars > 0)
+    
+    starting_value = cerebro.broker.getvalue()
+    print(f'Starting Portfolio Value: {starting_value:.2f}')
+    
+    result = cerebro.run()
+    metrics = extract_metrics(result[0], cerebro, initial_cash, series=series or warmup_bars > 0)
+    if warmup_bars:
+        # The equity is flat until then, so only the yearly Sharpe ratio has to be measured again
+        from scripts.vectorized_backtest import annual_sharpe_ratio
+        recorded = metrics['series'] if series else metrics.pop('series')
+        metrics['sharpe_ratio'] = annual_sharpe_ratio(recorded['equity'][warmup_bars:], data.index[warmup_bars:], initial_cash)
+    
+    ending_value = cerebro.broker.getvalue()
+    print(f'Ending Portfolio Value: {ending_value:.2f}')
+    
+    return metrics
+
+
+def build_cerebro(strategy_class, data, initial_cash, fee, symbol=None, params=None, series=False):
     data_feed = bt.feeds.PandasData(dataname=data)
+    attach_indicator_store(data_feed, symbol, data)
     
     cerebro = bt.Cerebro()
-    cerebro.addstrategy(strategy_class)
+    cerebro.addstrategy(strategy_class, **(params or {}))
     cerebro.adddata(data_feed)
     cerebro.broker.set_cash(float(initial_cash))
     cerebro.broker.setcommission(commission=fee)
@@ -113,30 +286,29 @@ def run_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date
     cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='tradeanalyzer')
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.SharpeRatio_A, _name='sharpe')
-    
-    starting_value = cerebro.broker.getvalue()
-    print(f'Starting Portfolio Value: {starting_value:.2f}')
-    
-    result = cerebro.run()
-    
+    if series:
+        # Per-bar equity and the trade log (Cerebro runs only)
+        cerebro.addanalyzer(SeriesRecorder, _name='series')
+    return cerebro
+
+
+def extract_metrics(strategy, cerebro, initial_cash, series=False):
+    """run_backtest's result from the analyzers of a finished run."""
     total_return = cerebro.broker.getvalue() / initial_cash - 1
     
     # Extract trade analysis metrics
-    trade_analysis = result[0].analyzers.tradeanalyzer.get_analysis()
+    trade_analysis = strategy.analyzers.tradeanalyzer.get_analysis()
     number_of_trades = trade_analysis.get('total', {}).get('closed', 0)
     winning_trades = trade_analysis.get('won', {}).get('total', 0)
     losing_trades = trade_analysis.get('lost', {}).get('total', 0)
     
-    drawdown_analysis = result[0].analyzers.drawdown.get_analysis()
+    drawdown_analysis = strategy.analyzers.drawdown.get_analysis()
     max_drawdown = drawdown_analysis.get('max', {}).get('drawdown', 0.0)
     
-    sharpe_analysis = result[0].analyzers.sharpe.get_analysis()
+    sharpe_analysis = strategy.analyzers.sharpe.get_analysis()
     sharpe_ratio = sharpe_analysis.get('sharperatio', 0.0)
     
-    ending_value = cerebro.broker.getvalue()
-    print(f'Ending Portfolio Value: {ending_value:.2f}')
-    
-    return {
+    metrics = {
         'backtest_id': 0,
         'total_return': total_return,
         'number_of_trades': number_of_trades,
@@ -145,19 +317,29 @@ def run_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date
         'max_drawdown': max_drawdown,
         'sharpe_ratio': sharpe_ratio
     }
+    if series:
+        metrics['series'] = strategy.analyzers.series.get_analysis()
+    return metrics
+
 
 
+def normalize(value, low, high):
+    # All candidates equal on this metric, so it cannot separate them
+    if high == low:
+        return 0.0
+    return (value - low) / (high - low)
 
-def score_backtest(result):
+
+def score_backtest(result, min_return, max_return, min_sharpe, max_sharpe, min_drawdown, max_drawdown):
     weights = {
         'total_return': 0.4,
         'sharpe_ratio': 0.4,
         'max_drawdown': 0.2,
     }
     
-    normalized_return = (result['total_return'] - min_return) / (max_return - min_return)
-    normalized_sharpe = (result['sharpe_ratio'] - min_sharpe) / (max_sharpe - min_sharpe)
-    normalized_drawdown = (max_drawdown - result['max_drawdown']) / (max_drawdown - min_drawdown)
+    normalized_return = normalize(result['total_return'], min_return, max_return)
+    normalized_sharpe = normalize(result['sharpe_ratio'], min_sharpe, max_sharpe)
+    normalized_drawdown = normalize(max_drawdown - result['max_drawdown'], 0.0, max_drawdown - min_drawdown)
     
     score = (
         weights['total_return'] * normalized_return +
@@ -167,6 +349,20 @@ def score_backtest(result):
     return score
 
 
+def score_results(results):
+    # SharpeRatio_A reports None when it cannot be computed (e.g. a single year)
+    sharpes = [result['sharpe_ratio'] or 0.0 for result in results]
+    bounds = dict(
+        min_return=min(result['total_return'] for result in results),
+        max_return=max(result['total_return'] for result in results),
+        min_sharpe=min(sharpes),
+        max_sharpe=max(sharpes),
+        min_drawdown=min(result['max_drawdown'] for result in results),
+        max_drawdown=max(result['max_drawdown'] for result in results),
+    )
+    return [score_backtest(dict(result, sharpe_ratio=sharpe), **bounds) for result, sharpe in zip(results, sharpes)]
+
+
 if __name__ == "__main__":
     symbol = 'ETH/USD'
     start_date = '2023-06-20'
@@ -185,16 +381,9 @@ if __name__ == "__main__":
         result = run_backtest(strategy, symbol, initial_cash, fee, start_date, end_date)
         results.append(result)
     print(results)
-    # Determine the min and max values for normalization
-    min_return = min(result['total_return'] for result in results)
-    max_return = max(result['total_return'] for result in results)
-    min_sharpe = min(result['sharpe_ratio'] for result in results)
-    max_sharpe = max(result['sharpe_ratio'] for result in results)
-    min_drawdown = min(result['max_drawdown'] for result in results)
-    max_drawdown = max(result['max_drawdown'] for result in results)
     
     # Score each strategy
-    scores = [score_backtest(result) for result in results]
+    scores = score_results(results)
     
     # Select the best strategy
     best_strategy_index = scores.index(max(scores))
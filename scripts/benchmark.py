@@ -0,0 +1,308 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import backtrader as bt
+import pandas as pd
+from sqlalchemy import create_engine
+
+from scripts import backtest_runner
+from scripts.backtest_runner import (build_cerebro, extract_metrics, normalize_ohlcv, score_results, RsiBollingerBandsStrategy,
+                                     MacdStrategy, StochasticOscillatorStrategy)
+from scripts.ohlcv_db import UNIFIED_TABLE, ensure_unified_table, query_range
+from scripts.synthetic_data import generate_ohlcv
+
+# Benchmarks of the backtest pipeline, stage by stage, on synthetic bars.
+#
+# Each size gets a random-walk OHLCV series (minute bars, so 10M bars still fit
+# pandas' date range) stored in a SQLite file in the unified layout, standing
+# in for Postgres. The stages then run one after the other on it:
+#   fetch_data     the range query through the runner's engine
+#   normalize      normalize_ohlcv on the raw rows
+#   feed           PandasData creation and loading, as Cerebro does on run()
+#   cerebro.run    each strategy with run_backtest's analyzers (feed load included)
+#   analyzers      extract_metrics on the finished runs
+#   score_backtest score_results over the strategies' results
+#   worker         run_and_evaluate_backtest against a SQLite app database, with
+#                  in-memory stand-ins for Kafka and MLflow
+# Timings are the best of --repeat runs; peak memory (tracemalloc) is measured
+# in a separate run so its overhead does not show in the timings. Results can
+# be saved as a baseline and later runs compared against it.
+#
+#   python -m scripts.benchmark --sizes 1000,10000,100000 --save-baseline benchmark_baseline.json
+#   python -m scripts.benchmark --sizes 1000,10000,100000 --baseline benchmark_baseline.json
+
+SYMBOL = 'BENCH/USD'
+STRATEGIES = [RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy]
+INITIAL_CASH = 10000
+FEE = 0.001
+
+# The runner's caches would turn repeats into cache hits
+ISOLATED_ENV = {
+    'OHLCV_LAYOUT': 'unified',
+    'OHLCV_CACHE_DIR': '',
+    'FRAME_CACHE_MAX_BYTES': '0',
+    'INDICATOR_STORE_DIR': '',
+    'RESULT_CACHE': '0',
+}
+
+
+class InMemoryKafka:
+    # Stand-in for kafka_service: keeps what would have been produced
+    def __init__(self):
+        self.messages = []
+
+    def produce(self, topic, message, key=None, sync=False):
+        self.messages.append((topic, message))
+
+    def produce_batch(self, topic, messages, sync=False, keys=None):
+        self.messages.extend((topic, message) for message in messages)
+
+    def flush(self, timeout=30):
+        return 0
+
+
+class InMemoryMlflow:
+    # Stand-in for mlflow_service: keeps the logged runs
+    def __init__(self):
+        self.runs = []
+
+    def log_metrics(self, run_name, metrics, params=None):
+        self.runs.append((run_name, metrics, params))
+
+    def flush(self, timeout=30):
+        return True
+
+
+@contextlib.contextmanager
+def isolated_env(values):
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def sqlite_engine(path):
+    # Timestamps come back as datetimes, as they do from Postgres
+    return create_engine(f'sqlite:///{path}', connect_args={'detect_types': sqlite3.PARSE_DECLTYPES})
+
+
+def seed_database(engine, data):
+    ensure_unified_table(engine)
+    rows = data.rename(columns=str.lower).rename_axis('timestamp').reset_index().assign(symbol=SYMBOL)
+    rows.to_sql(UNIFIED_TABLE, engine, if_exists='append', index=False, chunksize=100_000)
+
+
+def date_range(data):
+    # Dates as the app passes them; the end is the day after the last bar
+    return data.index[0].date(), (data.index[-1] + pd.Timedelta(days=1)).date()
+
+
+def measure(fn, repeat, memory):
+    """(best seconds, peak MiB or None, last return value) of `fn()`, with its prints silenced."""
+    best, value = None, None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                fn()
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            finally:
+                tracemalloc.stop()
+    return best, peak, value
+
+
+def load_feed(data):
+    # What Cerebro does with a feed before the strategies run
+    feed = bt.feeds.PandasData(dataname=data)
+    feed._env = bt.Cerebro()
+    feed._start()
+    feed.preload()
+    return feed
+
+
+def run_strategy(strategy_class, data):
+    cerebro = build_cerebro(strategy_class, data, INITIAL_CASH, FEE)
+    return cerebro, cerebro.run()[0]
+
+
+@contextlib.contextmanager
+def worker(database_path, start_date, end_date):
+    # The app stack is only needed for this stage
+    from flask import Flask
+    from app import db
+    from app.models.backtest import Backtest
+    from app.services import backtest_service
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    services = backtest_service.kafka_service, backtest_service.mlflow_service
+    backtest_service.kafka_service, backtest_service.mlflow_service = InMemoryKafka(), InMemoryMlflow()
+    try:
+        with app.app_context():
+            db.create_all()
+
+            def run():
+                backtest = Backtest(name='benchmark', symbol=SYMBOL, inital_cash=INITIAL_CASH, fee=FEE,
+                                    start_date=start_date, end_date=end_date)
+                db.session.add(backtest)
+                db.session.commit()
+                return backtest_service.run_and_evaluate_backtest(backtest.id, SYMBOL, INITIAL_CASH, FEE, start_date, end_date,
+                                                                  concurrent=False)
+            yield run
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        backtest_service.kafka_service, backtest_service.mlflow_service = services
+
+
+def benchmark_size(bars, workdir, repeat=3, memory=True, max_run_bars=1_000_000):
+    """{stage: {'seconds', 'bars_per_sec', 'peak_mb'}} for a series of `bars` bars."""
+    data = generate_ohlcv(bars, seed=bars, freq='min')
+    ohlcv_path = os.path.join(workdir, f'ohlcv_{bars}.db')
+    engine = sqlite_engine(ohlcv_path)
+    seed_database(engine, data)
+    start_date, end_date = date_range(data)
+
+    stages = {}
+
+    def record(stage, fn, per_bar=True):
+        seconds, peak, value = measure(fn, repeat, memory)
+        stages[stage] = {
+            'seconds': seconds,
+            'bars_per_sec': bars / seconds if per_bar and seconds > 0 else None,
+            'peak_mb': peak,
+        }
+        return value
+
+    saved_engine = backtest_runner._engine
+    backtest_runner._engine = engine
+    try:
+        raw = record('fetch_data', lambda: query_range(backtest_runner.get_engine(), SYMBOL, start_date, end_date))
+        frame = record('normalize', lambda: normalize_ohlcv(raw.copy()))
+        if len(frame) != bars:
+            raise RuntimeError(f"Read back {len(frame)} of {bars} bars")
+        record('feed', lambda: load_feed(frame))
+
+        if bars > max_run_bars:
+            print(f"{bars} bars: strategy stages skipped (above --max-run-bars {max_run_bars})", file=sys.stderr)
+            return stages
+
+        runs = {}
+        for strategy_class in STRATEGIES:
+            runs[strategy_class] = record(f'cerebro.run[{strategy_class.__name__}]', lambda: run_strategy(strategy_class, frame))
+        results = record('analyzers', lambda: [extract_metrics(strategy, cerebro, INITIAL_CASH) for cerebro, strategy in runs.values()],
+                         per_bar=False)
+
+        # A single call is too short to time, so the figure is per call over many
+        calls = 1000
+        record('score_backtest', lambda: [score_results(results) for _ in range(calls)], per_bar=False)
+        stages['score_backtest']['seconds'] /= calls
+
+        with worker(os.path.join(workdir, f'app_{bars}.db'), start_date, end_date) as run:
+            record('worker', run)
+    finally:
+        backtest_runner._engine = saved_engine
+        engine.dispose()
+    return stages
+
+
+def run_benchmarks(sizes, repeat=3, memory=True, max_run_bars=1_000_000):
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as workdir, isolated_env(ISOLATED_ENV):
+        for bars in sizes:
+            report['results'][str(bars)] = benchmark_size(bars, workdir, repeat=repeat, memory=memory, max_run_bars=max_run_bars)
+    return report
+
+
+def compare(report, baseline, tolerance=0.25, noise=0.001):
+    """[(bars, stage, seconds, baseline seconds)] of the stages more than `tolerance` slower than the baseline.
+
+    Differences under `noise` seconds are ignored.
+    """
+    regressions = []
+    for bars, stages in report['results'].items():
+        for stage, current in stages.items():
+            previous = baseline.get('results', {}).get(bars, {}).get(stage)
+            if previous is None:
+                continue
+            if current['seconds'] > previous['seconds'] * (1 + tolerance) and current['seconds'] - previous['seconds'] > noise:
+                regressions.append((int(bars), stage, current['seconds'], previous['seconds']))
+    return regressions
+
+
+def format_report(report, baseline=None):
+    lines = [f"{'bars':>10}  {'stage':<40} {'seconds':>10} {'bars/s':>12} {'peak MiB':>9} {'vs baseline':>12}"]
+    for bars, stages in report['results'].items():
+        for stage, result in stages.items():
+            bars_per_sec = f"{result['bars_per_sec']:,.0f}" if result['bars_per_sec'] else '-'
+            peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else '-'
+            change = ''
+            previous = (baseline or {}).get('results', {}).get(bars, {}).get(stage)
+            if previous:
+                change = f"{result['seconds'] / previous['seconds'] - 1:+.0%}"
+            lines.append(f"{bars:>10}  {stage:<40} {result['seconds']:>10.4f} {bars_per_sec:>12} {peak:>9} {change:>12}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the backtest pipeline stage by stage on synthetic bars.')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma-separated bar counts, e.g. 1000,10000,100000,1000000,10000000')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--max-run-bars', type=int, default=1_000_000,
+                        help='sizes above this only run the data stages (fetch_data, normalize, feed)')
+    parser.add_argument('--baseline', help='JSON report to compare against; exits with 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown over the baseline reported as a regression')
+    parser.add_argument('--save-baseline', help='write this run\'s report to this JSON file')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run_benchmarks(sizes, repeat=args.repeat, memory=not args.no_memory, max_run_bars=args.max_run_bars)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, tolerance=args.tolerance)
+        for bars, stage, seconds, previous in regressions:
+            print(f"Regression: {stage} on {bars} bars took {seconds:.4f}s, baseline {previous:.4f}s")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
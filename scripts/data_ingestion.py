@@ -4,6 +4,7 @@ from sqlalchemy import create_engine
 import yfinance as yf
 import pandas as pd
 from time import sleep
+from scripts.ohlcv_db import has_stored_data, ensure_symbol_storage, ensure_all_timestamp_indexes, query_latest_timestamp, store_ohlcv
 
 load_dotenv()
 
@@ -27,21 +28,72 @@ def fetch_ohlcv(symbol, since):
         print(f"Error fetching data for {symbol}: {str(e)}")
         return None
 
-def store_dataframe(df, table_name):
-    df.to_sql(table_name, con=engine, if_exists='append', index=False)
+# Sources return Yahoo-shaped frames (Date, Open, High, Low, Close, Volume) from `since` on
+
+class YFinanceSource:
+    def fetch(self, symbol, since):
+        return fetch_ohlcv(symbol, since)
+
+class CsvSource:
+    """Reads `<directory>/<symbol>.csv` files, for offline runs and tests."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, symbol, since):
+        path = os.path.join(self.directory, f'{symbol}.csv')
+        if not os.path.exists(path):
+            print(f"No file for {symbol} at {path}")
+            return None
+        ohlcv = pd.read_csv(path, parse_dates=['Date'])
+        since = pd.Timestamp(since, tz=ohlcv['Date'].dt.tz)
+        return ohlcv[ohlcv['Date'] >= since].reset_index(drop=True)
+
+def transform(ohlcv):
+    # Rename columns to match the existing structure
+    df = ohlcv.rename(columns={'Date': 'timestamp', 'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Volume': 'volume'})
+    return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+
+def store_dataframe(df, symbol, engine=engine):
+    ensure_symbol_storage(engine, symbol)
+    return store_ohlcv(engine, symbol, df)
+
+def resume_since(symbol, since, engine=engine, incremental=True):
+    if incremental and has_stored_data(engine, symbol):
+        latest = query_latest_timestamp(engine, symbol)
+        if latest is not None and not pd.isna(latest):
+            # Start from the last stored bar: it may have been partial, the upsert replaces it
+            return pd.Timestamp(latest).strftime('%Y-%m-%d')
+    return since
+
+def ingest_symbol(symbol, source, since, engine=engine, incremental=True):
+    since = resume_since(symbol, since, engine=engine, incremental=incremental)
+
+    ohlcv = source.fetch(symbol, since)
+    if ohlcv is None or ohlcv.empty:
+        print(f'No new data for {symbol}')
+        return 0
+
+    stored = store_dataframe(transform(ohlcv), symbol, engine=engine)
+    print(f'Stored {stored} rows for {symbol} since {since}')
+    return stored
+
+def ingest(symbols, source, since, engine=engine, incremental=True, delay=0):
+    stored = {}
+    for symbol in symbols:
+        stored[symbol] = ingest_symbol(symbol, source, since, engine=engine, incremental=incremental)
+        if delay:
+            sleep(delay)  # Add a delay to avoid hitting rate limits
+    return stored
 
 # Fetch and store data for multiple symbols
 symbols = ['BTC-USD', 'ETH-USD', 'BNB-USD', 'XRP-USD', 'ADA-USD', 'SOL1-USD', 'DOGE-USD', 'DOT1-USD', 'SHIB-USD', 'MATIC-USD', 'LTC-USD', 'UNI-USD', 'BCH-USD', 'LINK-USD', 'XLM-USD', 'ATOM-USD', 'VET-USD', 'ICP-USD', 'FIL-USD', 'THETA-USD']
 since = '2020-06-20'
 
-for symbol in symbols:
-    ohlcv = fetch_ohlcv(symbol, since)
-    if ohlcv is not None and not ohlcv.empty:
-        # Rename columns to match the existing structure if needed
-        df = ohlcv.rename(columns={'Date': 'timestamp', 'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Volume': 'volume'})
-        store_dataframe(df, f'ohlcv_{symbol.replace("-", "_")}')
-        print(f'Stored data for {symbol}')
-    else:
-        print(f'Failed to fetch data for {symbol}')
-    sleep(1)  # Add a delay to avoid hitting rate limits
+if __name__ == "__main__":
+    # Backfill the unique index on tables created before it was maintained here
+    ensure_all_timestamp_indexes(engine)
 
+    source = CsvSource(os.getenv('OHLCV_SOURCE_DIR')) if os.getenv('OHLCV_SOURCE_DIR') else YFinanceSource()
+    ingest(symbols, source, since, incremental=os.getenv('OHLCV_FULL_REFRESH') is None,
+           delay=0 if isinstance(source, CsvSource) else 1)
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-process LRU of normalized OHLCV frames (date index, capitalized columns) as
+# returned by fetch_data, bounded by their in-memory size. Cached frames are
+# shared between callers and must be treated as read-only.
+#
+# The cache serves bursts of backtests on the same window. It cannot tell when
+# bars are ingested or revised, so an entry is only used for `ttl` seconds after
+# it was loaded; later requests read the bars again (through the versioned
+# OhlcvCache when enabled).
+
+
+class FrameCache:
+    def __init__(self, max_bytes, ttl=60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(symbol, start_date, end_date):
+        return (symbol, str(start_date), str(end_date))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() >= entry[2]:
+                self.current_bytes -= self._entries.pop(key)[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data):
+        size = int(data.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, size, time.monotonic() + self.ttl)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+_frame_cache = None
+
+
+def get_frame_cache():
+    """Process-wide cache sized by FRAME_CACHE_MAX_BYTES (default 256 MiB, 0 disables).
+
+    Frames are kept for FRAME_CACHE_TTL seconds (default 60, as OHLCV_CACHE_VERSION_TTL).
+    """
+    global _frame_cache
+    max_bytes = int(os.getenv('FRAME_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+    ttl = float(os.getenv('FRAME_CACHE_TTL', '60'))
+    if max_bytes <= 0 or ttl <= 0:
+        return None
+    if _frame_cache is None:
+        _frame_cache = FrameCache(max_bytes, ttl=ttl)
+    _frame_cache.max_bytes = max_bytes
+    _frame_cache.ttl = ttl
+    return _frame_cache
@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scripts import indicators
+
+# Persisted indicator series shared by backtests.
+#
+# Each (symbol, timeframe, indicator, params) is kept in one uncompressed Arrow
+# IPC file: the date column, the input columns and the indicator's lines for
+# every bar seen so far. The schema metadata holds the online indicator's
+# snapshot() after the last bar, so when newer bars come in only those are
+# computed and appended. Bars already stored must come back unchanged: when one
+# was revised (a partial last bar upserted again, a backfill) the whole series is
+# computed afresh.
+#
+# RSI and MACD are smoothed from their first bar and so depend on where the
+# series starts; their files are keyed by that first date too. Bollinger Bands
+# and Stochastic only look at the last bars and serve any later start, with the
+# warm-up bars blanked as a run starting there would have them.
+
+_METADATA_KEY = b'indicator_store'
+
+INDICATORS = {
+    # name: (online class, batch function, input columns, lines, depends on the first bar)
+    'rsi': (indicators.RSI, indicators.rsi, ('Close',), ('rsi',), True),
+    'bollinger_bands': (indicators.BollingerBands, indicators.bollinger_bands, ('Close',), ('mid', 'top', 'bot'), False),
+    'macd_histogram': (indicators.MACDHistogram, indicators.macd_histogram, ('Close',), ('histo',), True),
+    'stochastic': (indicators.Stochastic, indicators.stochastic, ('High', 'Low', 'Close'), ('percK', 'percD'), False),
+}
+
+
+def compute(data, name, params):
+    """The lines of indicator `name` over an OHLCV frame (as fetch_data returns), without the store."""
+    _, batch, columns, _, _ = INDICATORS[name]
+    values = batch(*(data[column].to_numpy(dtype=float) for column in columns), **params)
+    return values if isinstance(values, tuple) else (values,)
+
+
+def _dates(data):
+    return data.index.as_unit('ns').asi8
+
+
+def _leading_nans(values):
+    valid = np.flatnonzero(~np.isnan(values))
+    return int(valid[0]) if len(valid) else len(values)
+
+
+class IndicatorStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.hits = 0
+        self.extends = 0
+        self.misses = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+    def path(self, symbol, timeframe, name, params, first=None):
+        parts = [symbol.replace('/', '_').replace('-', '_'), timeframe, name]
+        parts += [f'{key}-{params[key]:g}' for key in sorted(params)]
+        if first is not None:
+            parts.append(pd.Timestamp(first).strftime('%Y%m%d%H%M%S'))
+        return os.path.join(self.store_dir, f"{'_'.join(parts)}.arrow")
+
+    def series(self, symbol, name, params, data, timeframe='1d'):
+        """The lines of indicator `name` over `data`, the same values compute() gives."""
+        online_class, _, columns, lines, anchored = INDICATORS[name]
+        dates = _dates(data)
+        path = self.path(symbol, timeframe, name, params, data.index[0] if anchored else None)
+
+        table, meta = self._read(path)
+        if table is not None:
+            stored_dates = table.column('date').to_numpy()
+            start = np.searchsorted(stored_dates, dates[0])
+            new = dates > meta['last']
+            known = dates[~new]
+            # The bars both have in common must be the same ones, and newer bars must follow on from the stored ones
+            if (len(known) and np.array_equal(stored_dates[start:start + len(known)], known)
+                    and (not new.any() or start + len(known) == len(stored_dates))
+                    and self._unchanged(table, data[~new], columns, start)):
+                if new.any():
+                    self.extends += 1
+                    online = online_class(**params).restore(meta['state'])
+                    table, meta = self._write(path, online, data[new], columns, lines, previous=table)
+                else:
+                    self.hits += 1
+                values = []
+                for line, warmup in zip(lines, meta['warmup']):
+                    line_values = table.column(line).to_numpy()[start:start + len(data)].copy()
+                    line_values[:warmup] = np.nan
+                    values.append(line_values)
+                return tuple(values)
+
+        self.misses += 1
+        table, meta = self._write(path, online_class(**params), data, columns, lines)
+        return tuple(table.column(line).to_numpy() for line in lines)
+
+    def _unchanged(self, table, known, columns, start):
+        # The stored inputs of the bars in common are the ones given now
+        if not set(columns) <= set(table.column_names):
+            return False
+        return all(np.array_equal(table.column(column).to_numpy()[start:start + len(known)], known[column].to_numpy(dtype=float))
+                   for column in columns)
+
+    def invalidate(self, symbol):
+        prefix = f"{symbol.replace('/', '_').replace('-', '_')}_"
+        for name in os.listdir(self.store_dir):
+            if name.startswith(prefix) and name.endswith('.arrow'):
+                os.remove(os.path.join(self.store_dir, name))
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return None, None
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return table, json.loads(table.schema.metadata[_METADATA_KEY])
+
+    def _write(self, path, online, data, columns, lines, previous=None):
+        rows = []
+        for bar in data[list(columns)].itertuples(index=False):
+            value = online.update(*bar)
+            rows.append(value if isinstance(value, tuple) else (value,))
+        values = np.array(rows, dtype=float).reshape(len(rows), len(lines))
+        table = pa.table({
+            'date': _dates(data),
+            **{column: data[column].to_numpy(dtype=float) for column in columns},
+            **{line: values[:, idx] for idx, line in enumerate(lines)},
+        })
+        if previous is not None:
+            table = pa.concat_tables([previous.replace_schema_metadata(None), table])
+        meta = {
+            'last': int(table.column('date')[-1].as_py()),
+            'state': online.snapshot(),
+            'warmup': [_leading_nans(table.column(line).to_numpy()) for line in lines],
+        }
+        table = table.replace_schema_metadata({_METADATA_KEY: json.dumps(meta)})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return table, meta
+
+
+_store = None
+
+
+def get_indicator_store():
+    """Process-wide store, enabled by setting INDICATOR_STORE_DIR."""
+    global _store
+    store_dir = os.getenv('INDICATOR_STORE_DIR')
+    if not store_dir:
+        return None
+    if _store is None or _store.store_dir != store_dir:
+        _store = IndicatorStore(store_dir)
+    return _store
+
+
+def indicator_source(symbol, data):
+    """`lines(name, params)` over `data`: from the store when it is enabled and the symbol known."""
+    store = get_indicator_store()
+    if store is None or symbol is None:
+        return lambda name, params: compute(data, name, params)
+    return lambda name, params: store.series(symbol, name, params, data)
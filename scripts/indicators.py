@@ -0,0 +1,357 @@
+import math
+from collections import deque
+from itertools import repeat
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Indicators used by the strategies, in two forms that give the same numbers as
+# backtrader's (same window sums with math.fsum, SMA-seeded smoothing, population
+# standard deviation):
+#
+# - online classes that take one bar per update(). They only keep the last
+#   `period` values and running totals over them, so an update costs the same
+#   whatever the period and however long the series has run, and
+#   snapshot()/restore() carry that state across restarts;
+# - batch functions over whole numpy arrays, for the vectorized backtests.
+#
+# Values are NaN until the indicator has seen enough bars.
+
+NAN = float('nan')
+
+
+class Indicator:
+    # Attributes computed from the others: left out of snapshots, rebuilt on restore
+    derived = ()
+
+    def snapshot(self):
+        """The indicator's state as plain (JSON friendly) values."""
+        state = {}
+        for name, value in vars(self).items():
+            if name in self.derived:
+                continue
+            if isinstance(value, Indicator):
+                state[name] = value.snapshot()
+            elif isinstance(value, deque):
+                state[name] = list(value)
+            else:
+                state[name] = value
+        return state
+
+    def restore(self, state):
+        """Continue from a snapshot() of an indicator built with the same parameters."""
+        for name, value in state.items():
+            current = getattr(self, name)
+            if isinstance(current, Indicator):
+                current.restore(value)
+            elif isinstance(current, deque):
+                setattr(self, name, deque(value, maxlen=current.maxlen))
+            else:
+                setattr(self, name, value)
+        self.rebuild()
+        return self
+
+    def rebuild(self):
+        pass
+
+
+class SMA(Indicator):
+    # The window's sum is kept exactly, as an integer count of 2**-scale (the finest
+    # power of two the values have needed so far), so an update adds the new value
+    # and takes the oldest off; dividing by the unit rounds once, to what math.fsum
+    # over the window gives. NaN and infinities cannot be counted that way: while
+    # one is in the window, the window goes through fsum. Short windows always do,
+    # fsum over up to FSUM_MAX_PERIOD values costs less than the bookkeeping.
+    FSUM_MAX_PERIOD = 48
+    derived = ('total', 'scale', 'nonfinite')
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.value = NAN
+        self.rebuild()
+
+    def rebuild(self):
+        self.total = 0
+        self.scale = 0
+        self.nonfinite = 0
+        if self.period > self.FSUM_MAX_PERIOD:
+            for value in self.window:
+                self._add(value, 1)
+
+    def _add(self, value, sign):
+        if not math.isfinite(value):
+            self.nonfinite += sign
+            return
+        numerator, denominator = value.as_integer_ratio()
+        scale = denominator.bit_length() - 1
+        if scale > self.scale:
+            self.total <<= scale - self.scale
+            self.scale = scale
+        self.total += sign * (numerator << (self.scale - scale))
+
+    def update(self, value):
+        if self.period <= self.FSUM_MAX_PERIOD:
+            self.window.append(value)
+            if len(self.window) == self.period:
+                self.value = math.fsum(self.window) / self.period
+            return self.value
+        if len(self.window) == self.period:
+            self._add(self.window[0], -1)
+        self.window.append(value)
+        self._add(value, 1)
+        if len(self.window) == self.period:
+            total = math.fsum(self.window) if self.nonfinite else self.total / (1 << self.scale)
+            self.value = total / self.period
+        return self.value
+
+
+class ExponentialSmoothing(Indicator):
+    def __init__(self, period, alpha):
+        self.period = period
+        self.alpha = alpha
+        self.alpha1 = 1.0 - alpha
+        self.seed = SMA(period)
+        self.value = NAN
+
+    def update(self, value):
+        if math.isnan(self.value):
+            self.value = self.seed.update(value)
+        else:
+            self.value = self.value * self.alpha1 + value * self.alpha
+        return self.value
+
+
+class EMA(ExponentialSmoothing):
+    def __init__(self, period):
+        super().__init__(period, 2.0 / (1 + period))
+
+
+class SMMA(ExponentialSmoothing):
+    def __init__(self, period):
+        super().__init__(period, 1.0 / period)
+
+
+def _rsi_value(up, down):
+    if down == 0.0:
+        # backtrader would raise; the batch path's inf/nan give these
+        return 100.0 if up > 0.0 else NAN
+    return 100.0 - 100.0 / (1.0 + up / down)
+
+
+class RSI(Indicator):
+    def __init__(self, period=14):
+        self.period = period
+        self.up = SMMA(period)
+        self.down = SMMA(period)
+        self.previous = NAN
+        self.value = NAN
+
+    def update(self, close):
+        if not math.isnan(self.previous):
+            up = self.up.update(max(close - self.previous, 0.0))
+            down = self.down.update(max(self.previous - close, 0.0))
+            if not math.isnan(up):
+                self.value = _rsi_value(up, down)
+        self.previous = close
+        return self.value
+
+
+class BollingerBands(Indicator):
+    def __init__(self, period=20, devfactor=2.0):
+        self.period = period
+        self.devfactor = devfactor
+        self.mean = SMA(period)
+        self.meansq = SMA(period)
+        self.mid = self.top = self.bot = NAN
+
+    def update(self, close):
+        """Returns (mid, top, bot)."""
+        mid = self.mean.update(close)
+        meansq = self.meansq.update(close ** 2)
+        if not math.isnan(mid):
+            variance = meansq - mid ** 2
+            stddev = self.devfactor * variance ** 0.5 if variance >= 0.0 else NAN
+            self.mid, self.top, self.bot = mid, mid + stddev, mid - stddev
+        return self.mid, self.top, self.bot
+
+
+class MACDHistogram(Indicator):
+    def __init__(self, period_me1=12, period_me2=26, period_signal=9):
+        self.me1 = EMA(period_me1)
+        self.me2 = EMA(period_me2)
+        self.signal = EMA(period_signal)
+        self.value = NAN
+
+    def update(self, close):
+        macd = self.me1.update(close) - self.me2.update(close)
+        if not math.isnan(macd):
+            signal = self.signal.update(macd)
+            if not math.isnan(signal):
+                self.value = macd - signal
+        return self.value
+
+
+class Stochastic(Indicator):
+    """The slow stochastic: %K is the SMA of the raw %K, %D the SMA of %K."""
+
+    # (bar, value) queues of the window's highs and lows that could still become
+    # its highest/lowest, in bar order: the extreme is the first, and each bar is
+    # queued and dropped once
+    derived = ('bars', 'highest', 'lowest')
+
+    def __init__(self, period=14, period_dfast=3, period_dslow=3):
+        self.period = period
+        self.highs = deque(maxlen=period)
+        self.lows = deque(maxlen=period)
+        self.k = SMA(period_dfast)
+        self.d = SMA(period_dslow)
+        self.percK = self.percD = NAN
+        self.rebuild()
+
+    def rebuild(self):
+        self.bars = 0
+        self.highest = deque()
+        self.lowest = deque()
+        for high, low in zip(self.highs, self.lows):
+            self._push(high, low)
+
+    def _push(self, high, low):
+        while self.highest and self.highest[-1][1] <= high:
+            self.highest.pop()
+        self.highest.append((self.bars, high))
+        while self.lowest and self.lowest[-1][1] >= low:
+            self.lowest.pop()
+        self.lowest.append((self.bars, low))
+        self.bars += 1
+        first = self.bars - self.period
+        if self.highest[0][0] < first:
+            self.highest.popleft()
+        if self.lowest[0][0] < first:
+            self.lowest.popleft()
+
+    def update(self, high, low, close):
+        """Returns (percK, percD)."""
+        self.highs.append(high)
+        self.lows.append(low)
+        self._push(high, low)
+        if len(self.highs) == self.period:
+            lowest = self.lowest[0][1]
+            kden = self.highest[0][1] - lowest
+            raw = 100.0 * ((close - lowest) / kden) if kden else NAN
+            self.percK = self.k.update(raw)
+            if not math.isnan(self.percK):
+                self.percD = self.d.update(self.percK)
+        return self.percK, self.percD
+
+
+# Batch versions
+
+
+def window_sums(values, period):
+    """Sum of every `period` long window, each rounded once like math.fsum."""
+    # Every float is a 53 bit integer times a power of two. As integer multiples of
+    # the smallest of those powers, split in a high and a low half, the running
+    # totals are exact in int64 and so are their differences per window. Each half
+    # of a window's sum is then exact as a float and adding them rounds just once.
+    mantissa, exponent = np.frexp(values)
+    exponent = exponent - 53
+    base = int(exponent.min()) if len(values) else 0
+    shift = exponent - base
+    if (np.isfinite(values).all() and base >= -1022
+            and int(shift.max(initial=0)) + 27 + len(values).bit_length() < 63):
+        mantissa = (mantissa * 2.0 ** 53).astype(np.int64)
+        high = np.concatenate([[0], np.cumsum((mantissa >> 27) << shift)])
+        low = np.concatenate([[0], np.cumsum((mantissa & (2 ** 27 - 1)) << shift)])
+        sums = (high[period:] - high[:-period]).astype(float) * 2.0 ** 27 + (low[period:] - low[:-period]).astype(float)
+        return np.ldexp(sums, base)
+    return np.array([math.fsum(window) for window in sliding_window_view(values, period).tolist()])
+
+
+def sma(values, period):
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = window_sums(values, period) / period
+    return out
+
+
+def sma_nan(values, period):
+    # SMA over a series whose leading values are still warming up
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid):
+        out[valid[0]:] = sma(values[valid[0]:], period)
+    return out
+
+
+def exponential_smoothing(values, period, alpha):
+    # Seeded with the SMA of the first `period` valid values, like backtrader
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) < period:
+        return out
+    start = valid[0] + period - 1
+    prev = math.fsum(values[valid[0]:start + 1]) / period
+    out[start] = prev
+    alpha1 = 1.0 - alpha
+    smoothed = []
+    for x in values[start + 1:].tolist():
+        prev = prev * alpha1 + x * alpha
+        smoothed.append(prev)
+    out[start + 1:] = smoothed
+    return out
+
+
+def ema(values, period):
+    return exponential_smoothing(values, period, 2.0 / (1 + period))
+
+
+def smma(values, period):
+    return exponential_smoothing(values, period, 1.0 / period)
+
+
+def _pow(values, exponent):
+    # backtrader squares and takes roots with Python's pow, which is not always bit
+    # for bit numpy's square/sqrt/power, so the builtin is mapped over the values
+    # in C; negative variances give NaN, as np.sqrt would
+    if exponent != 2:
+        values = np.where(values >= 0.0, values, np.nan)
+    return np.fromiter(map(pow, values.tolist(), repeat(exponent)), dtype=float, count=len(values))
+
+
+def rsi(close, period=14):
+    delta = np.full(len(close), np.nan)
+    delta[1:] = close[1:] - close[:-1]
+    upday = np.where(np.isnan(delta), np.nan, np.maximum(delta, 0.0))
+    downday = np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = smma(upday, period) / smma(downday, period)
+        return 100.0 - 100.0 / (1.0 + rs)
+
+
+def bollinger_bands(close, period=20, devfactor=2.0):
+    mid = sma(close, period)
+    stddev = devfactor * _pow(sma(_pow(close, 2), period) - _pow(mid, 2), 0.5)
+    return mid, mid + stddev, mid - stddev
+
+
+def macd_histogram(close, period_me1=12, period_me2=26, period_signal=9):
+    macd = ema(close, period_me1) - ema(close, period_me2)
+    return macd - ema(macd, period_signal)
+
+
+def rolling_extreme(values, period, func):
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = func(sliding_window_view(values, period), axis=1)
+    return out
+
+
+def stochastic(high, low, close, period=14, period_dfast=3, period_dslow=3):
+    """Returns (percK, percD) of the slow stochastic."""
+    lowest = rolling_extreme(low, period, np.min)
+    highest = rolling_extreme(high, period, np.max)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 100.0 * ((close - lowest) / (highest - lowest))
+    k[np.isinf(k)] = np.nan
+    percK = sma_nan(k, period_dfast)
+    return percK, sma_nan(percK, period_dslow)
@@ -0,0 +1,138 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.data_ingestion import engine, symbols, since, CsvSource, YFinanceSource, resume_since, transform
+from scripts.ohlcv_db import ensure_symbol_storage, ensure_all_timestamp_indexes, store_ohlcv
+
+# Concurrent ingestion: fetch -> transform -> write.
+#
+# A pool of fetch threads pulls symbols under a shared token bucket, so total
+# request rate stays bounded however many workers run. Stages are connected by
+# bounded queues: when the writer falls behind, transform blocks, then fetchers
+# block, instead of buffering every symbol in memory. The single writer groups
+# frames from several symbols into one transaction.
+
+_DONE = object()
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def run_pipeline(symbols, source, since, engine=engine, incremental=True, fetch_workers=8, rate=2.0, burst=None,
+                 queue_size=16, batch_rows=50000):
+    """Ingest `symbols` concurrently; returns {symbol: rows stored} and {symbol: error}."""
+    bucket = TokenBucket(rate, burst)
+    fetched = queue.Queue(maxsize=queue_size)
+    transformed = queue.Queue(maxsize=queue_size)
+    stored, errors = {}, {}
+
+    def fetch(symbol):
+        try:
+            symbol_since = resume_since(symbol, since, engine=engine, incremental=incremental)
+            bucket.acquire()
+            ohlcv = source.fetch(symbol, symbol_since)
+        except Exception as e:
+            errors[symbol] = str(e)
+            return
+        if ohlcv is None or ohlcv.empty:
+            stored[symbol] = 0
+            return
+        fetched.put((symbol, ohlcv))
+
+    def transform_stage():
+        while (item := fetched.get()) is not _DONE:
+            symbol, ohlcv = item
+            try:
+                transformed.put((symbol, transform(ohlcv)))
+            except Exception as e:
+                errors[symbol] = str(e)
+        transformed.put(_DONE)
+
+    def write_stage():
+        created = set()
+        pending, pending_rows = [], 0
+
+        def flush():
+            written = {}
+            with engine.begin() as conn:
+                for symbol, df in pending:
+                    written[symbol] = store_ohlcv(engine, symbol, df, conn=conn)
+            # Only counted once the transaction is committed
+            for symbol, rows in written.items():
+                stored[symbol] = rows
+                print(f'Stored {rows} rows for {symbol}')
+            pending.clear()
+
+        while True:
+            try:
+                item = transformed.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _DONE:
+                symbol, df = item
+                try:
+                    if symbol not in created:
+                        ensure_symbol_storage(engine, symbol)
+                        created.add(symbol)
+                    pending.append(item)
+                    pending_rows += len(df)
+                except Exception as e:
+                    # The writer keeps draining the queue, or the stages before it would block for good
+                    errors[symbol] = str(e)
+            # Write when the batch is full, the stream has paused or ended
+            if pending and (item is None or item is _DONE or pending_rows >= batch_rows):
+                try:
+                    flush()
+                except Exception as e:
+                    for symbol, _ in pending:
+                        errors[symbol] = str(e)
+                    pending.clear()
+                pending_rows = 0
+            if item is _DONE:
+                return
+
+    transformer = threading.Thread(target=transform_stage, daemon=True)
+    writer = threading.Thread(target=write_stage, daemon=True)
+    transformer.start()
+    writer.start()
+
+    with ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+        list(executor.map(fetch, symbols))
+    fetched.put(_DONE)
+    transformer.join()
+    writer.join()
+
+    for symbol, error in errors.items():
+        print(f'Failed to ingest {symbol}: {error}')
+    return stored, errors
+
+
+if __name__ == "__main__":
+    # Backfill the unique index on tables created before it was maintained here
+    ensure_all_timestamp_indexes(engine)
+
+    source = CsvSource(os.getenv('OHLCV_SOURCE_DIR')) if os.getenv('OHLCV_SOURCE_DIR') else YFinanceSource()
+    run_pipeline(symbols, source, since, incremental=os.getenv('OHLCV_FULL_REFRESH') is None,
+                 fetch_workers=int(os.getenv('OHLCV_FETCH_WORKERS', '8')),
+                 rate=float(os.getenv('OHLCV_FETCH_RATE', '2')))
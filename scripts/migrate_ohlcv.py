@@ -0,0 +1,10 @@
+import os
+from scripts.data_ingestion import engine
+from scripts.ohlcv_db import migrate_per_symbol_tables
+
+# Move the per-symbol ohlcv_<symbol> tables into the unified, symbol-partitioned
+# `ohlcv` table. Safe to re-run; set OHLCV_DROP_LEGACY=1 to drop the old tables.
+
+if __name__ == "__main__":
+    migrated = migrate_per_symbol_tables(engine, drop=os.getenv('OHLCV_DROP_LEGACY') == '1')
+    print(f"Migrated {sum(migrated.values())} rows from {len(migrated)} tables")
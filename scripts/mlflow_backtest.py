@@ -2,14 +2,13 @@ import pandas as pd
 from sqlalchemy import create_engine
 import backtrader as bt
 import os
-import mlflow
-import mlflow.pyfunc
-import mlflow.tracking
-from mlflow import log_metric, log_param
+from scripts.mlflow_tracking import MlflowTracker
+from scripts.ohlcv_cache import get_ohlcv_cache
+from scripts.ohlcv_db import query_range, query_ohlcv_version
 
 experiment_name = "Crypto Trading Backtesting"
 
-mlflow.set_experiment(experiment_name)
+tracker = MlflowTracker(os.getenv('MLFLOW_TRACKING_URI', 'http://localhost:5050'), experiment_name)
 # RDS connection information
 rds_host = os.getenv('PG_HOST', 'localhost')  # Replace 'localhost' with your actual host if needed
 rds_port = int(os.getenv('PG_PORT', '5432'))  # Convert port to int, replace '5432' with your default port
@@ -21,30 +20,35 @@ print(f"PG_HOST: {rds_host}, PG_PORT: {rds_port}, PG_DATABASE: {rds_db}, PG_USER
 engine = create_engine(f'postgresql+psycopg2://{rds_user}:{rds_password}@{rds_host}:{rds_port}/{rds_db}')
 print(f"PG_HOST: {rds_host}, PG_PORT: {rds_port}, PG_DATABASE: {rds_db}, PG_USER: {rds_user}, PG_PASSWORD: {rds_password}")
 
+def query_ohlcv(symbol, start_date, end_date):
+    data = query_range(engine, symbol, start_date, end_date)
+    print(f"Fetched data:\n{data.head()}\n")  # Print the first few rows of fetched data for debugging
+    
+    # Convert 'date' column to datetime
+    data['date'] = pd.to_datetime(data['date'], format='%Y-%m-%d')
+    
+    # Set 'date' column as index
+    data.set_index('date', inplace=True)
+    
+    # Ensure column names are correctly capitalized for Backtrader
+    data.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}, inplace=True)
+
+    return data
+
+def ohlcv_version(symbol):
+    return query_ohlcv_version(engine, symbol)
+
 def fetch_data(symbol, start_date, end_date):
-    query = f"""
-        SELECT timestamp AS date, open AS open, high AS high, low AS low, close AS close, volume AS volume 
-        FROM public."ohlcv_{symbol.replace('/', '_')}"
-        WHERE timestamp >= '{start_date}' AND timestamp <= '{end_date}';
-    """
     try:
-        print(f"Executing query:\n{query}\n")  # Print the SQL query for debugging purposes
-        
-        data = pd.read_sql(query, con=engine)
-        print(f"Fetched data:\n{data.head()}\n")  # Print the first few rows of fetched data for debugging
+        cache = get_ohlcv_cache()
+        if cache is not None:
+            data = cache.get(symbol, start_date, end_date, query_ohlcv, ohlcv_version)
+        else:
+            data = query_ohlcv(symbol, start_date, end_date)
         
         # Check if data is empty
         if data.empty:
             raise ValueError("No data returned from query.")
-        
-        # Convert 'date' column to datetime
-        data['date'] = pd.to_datetime(data['date'], format='%Y-%m-%d')
-        
-        # Set 'date' column as index
-        data.set_index('date', inplace=True)
-        
-        # Ensure column names are correctly capitalized for Backtrader
-        data.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}, inplace=True)
 
         return data
     except Exception as e:
@@ -213,34 +217,29 @@ def run_backtest(strategy_class, symbol, start_date, end_date):
     print(f'Starting Portfolio Value: {start_value:.2f}')
 
     # Run backtest
-    with mlflow.start_run(run_name=strategy.__name__):  # Set run name to strategy class name
-        results = cerebro.run()
+    results = cerebro.run()
 
-        # Print ending conditions
-        end_value = cerebro.broker.getvalue()
-        print(f'Ending Portfolio Value: {end_value:.2f}')
+    # Print ending conditions
+    end_value = cerebro.broker.getvalue()
+    print(f'Ending Portfolio Value: {end_value:.2f}')
 
-        # Extract strategy parameters
-        strategy_params = strategy.params.__dict__
-        
-        # Prepare results
-        result_dict = {
-            "Starting Portfolio Value": start_value,
-            "Ending Portfolio Value": end_value,
-            "Sharpe Ratio": results[0].analyzers.sharpe.get_analysis().get('sharperatio', 'N/A'),
-            "Max Drawdown": results[0].analyzers.drawdown.get_analysis().get('max', {}).get('drawdown', 'N/A'),
-            "Total Trades": results[0].analyzers.trades.get_analysis().get('total', {}).get('total', 'N/A'),
-            "Winning Trades": results[0].analyzers.trades.get_analysis().get('won', {}).get('total', 'N/A'),
-            "Losing Trades": results[0].analyzers.trades.get_analysis().get('lost', {}).get('total', 'N/A'),
-            "Total Return": results[0].analyzers.returns.get_analysis().get('rtot', 'N/A')
-        }
-
-        # Log parameters and metrics to MLflow
-        for param, value in strategy_params.items():
-            mlflow.log_param(param, value)
-            
-        for key, value in result_dict.items():
-            mlflow.log_metric(key, value)
+    # Extract strategy parameters
+    strategy_params = dict(strategy.params._getpairs())
+    
+    # Prepare results
+    result_dict = {
+        "Starting Portfolio Value": start_value,
+        "Ending Portfolio Value": end_value,
+        "Sharpe Ratio": results[0].analyzers.sharpe.get_analysis().get('sharperatio', 'N/A'),
+        "Max Drawdown": results[0].analyzers.drawdown.get_analysis().get('max', {}).get('drawdown', 'N/A'),
+        "Total Trades": results[0].analyzers.trades.get_analysis().get('total', {}).get('total', 'N/A'),
+        "Winning Trades": results[0].analyzers.trades.get_analysis().get('won', {}).get('total', 'N/A'),
+        "Losing Trades": results[0].analyzers.trades.get_analysis().get('lost', {}).get('total', 'N/A'),
+        "Total Return": results[0].analyzers.returns.get_analysis().get('rtot', 'N/A')
+    }
+
+    # Log parameters and metrics to MLflow in the background; 'N/A' values are skipped
+    tracker.log_run(strategy.__name__, metrics=result_dict, params=strategy_params)
 
     # Plot the results
     cerebro.plot(style='candlestick')
@@ -258,3 +257,4 @@ if __name__ == "__main__":
     
     for strategy in strategies:
         run_backtest(strategy, symbol, start_date, end_date)
+    tracker.flush()
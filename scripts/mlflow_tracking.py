@@ -0,0 +1,210 @@
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+# Buffered MLflow logging.
+#
+# log_run() only queues the run; a background thread creates it and sends all its
+# params and metrics with MLflow's batch API (a few requests per run instead of
+# one per value). When the tracking server is slow or down, or the queue is full,
+# runs are spooled to one JSON file each and replayed once the server answers
+# again, so backtests never wait on experiment tracking. Every run is tagged with
+# its record id: a replay that finds the run already created carries on with it
+# (or skips it when finished) instead of logging it twice.
+
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+SPOOL_TAG = 'spool_id'
+
+
+def _numeric(value):
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return None if math.isnan(value) else float(value)
+
+
+class MlflowTracker:
+    def __init__(self, tracking_uri, experiment_name, spool_dir=None, max_queue=1000, retry_interval=30.0, claim_timeout=600.0):
+        self.tracking_uri = tracking_uri
+        self.experiment_name = experiment_name
+        self.spool_dir = spool_dir or os.getenv('MLFLOW_SPOOL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'backtest', 'mlflow_spool'))
+        self.retry_interval = retry_interval
+        # A run claimed for sending longer ago than this belongs to a process that died
+        self.claim_timeout = claim_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._client = None
+        self._experiment_id = None
+        self._down_until = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Fail fast instead of MLflow's default minutes of retries; the spool retries later
+            os.environ.setdefault('MLFLOW_HTTP_REQUEST_MAX_RETRIES', '0')
+            os.environ.setdefault('MLFLOW_HTTP_REQUEST_TIMEOUT', '10')
+            from mlflow.tracking import MlflowClient
+            self._client = MlflowClient(tracking_uri=self.tracking_uri)
+        return self._client
+
+    @property
+    def experiment_id(self):
+        if self._experiment_id is None:
+            experiment = self.client.get_experiment_by_name(self.experiment_name)
+            if experiment is None:
+                self._experiment_id = self.client.create_experiment(self.experiment_name)
+            else:
+                self._experiment_id = experiment.experiment_id
+        return self._experiment_id
+
+    def log_run(self, run_name, metrics, params=None):
+        """Queue one run; returns immediately."""
+        record = {
+            'id': uuid.uuid4().hex,
+            'run_name': run_name,
+            'timestamp': int(time.time() * 1000),
+            'metrics': {key: _numeric(value) for key, value in metrics.items() if _numeric(value) is not None},
+            'params': {key: str(value) for key, value in (params or {}).items()},
+        }
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._spool(record)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.retry_interval)
+            except queue.Empty:
+                record = None
+            if record is not None:
+                self._deliver(record)
+                self._queue.task_done()
+            if time.monotonic() >= self._down_until:
+                self._replay()
+
+    def _deliver(self, record):
+        if time.monotonic() < self._down_until:
+            self._spool(record)
+            return False
+        try:
+            self._send(record)
+            return True
+        except Exception as e:
+            logging.error(f"MLflow unavailable, spooling run {record['run_name']}: {e}")
+            self._down_until = time.monotonic() + self.retry_interval
+            self._spool(record)
+            return False
+
+    def _find_run(self, record):
+        runs = self.client.search_runs([self.experiment_id], filter_string=f"tags.{SPOOL_TAG} = '{record['id']}'", max_results=1)
+        return runs[0] if runs else None
+
+    def _send(self, record):
+        client = self.client
+        # A spooled run may have been created, or fully sent, by an attempt that failed half way
+        run = self._find_run(record) if record.get('spooled') else None
+        if run is not None and run.info.status == 'FINISHED':
+            return
+        if run is None:
+            run = client.create_run(self.experiment_id, run_name=record['run_name'], start_time=record['timestamp'],
+                                    tags={SPOOL_TAG: record['id']})
+        run_id = run.info.run_id
+
+        from mlflow.entities import Metric, Param
+        metrics = [Metric(key, value, record['timestamp'], 0) for key, value in record['metrics'].items()]
+        params = [Param(key, value) for key, value in record['params'].items()]
+        for start in range(0, len(metrics), MAX_METRICS_PER_BATCH):
+            client.log_batch(run_id, metrics=metrics[start:start + MAX_METRICS_PER_BATCH])
+        for start in range(0, len(params), MAX_PARAMS_PER_BATCH):
+            client.log_batch(run_id, params=params[start:start + MAX_PARAMS_PER_BATCH])
+        client.set_terminated(run_id)
+
+    def _spool(self, record):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Names sort in spool order, so replays keep runs in the order they were logged
+        path = os.path.join(self.spool_dir, f"{time.time_ns():020d}-{record['id']}.json")
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(record, spooled=True), f)
+        os.replace(tmp_path, path)
+
+    def spooled(self):
+        if not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+
+    def _reclaim(self):
+        # Runs left claimed by a process that died while sending go back to the spool
+        if not os.path.isdir(self.spool_dir):
+            return
+        now = time.time()
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith('.sending'):
+                continue
+            claimed = os.path.join(self.spool_dir, name)
+            try:
+                if now - os.path.getmtime(claimed) > self.claim_timeout:
+                    os.rename(claimed, os.path.join(self.spool_dir, name[:name.index('.json.') + len('.json')]))
+            except FileNotFoundError:
+                continue
+
+    def _replay(self):
+        # Oldest first; stop at the first failure and try again after retry_interval
+        self._reclaim()
+        for name in self.spooled():
+            path = os.path.join(self.spool_dir, name)
+            claimed = f'{path}.{os.getpid()}.sending'
+            try:
+                # Several worker processes may share the spool; only one sends each run
+                os.rename(path, claimed)
+                # The claim's age is counted from now
+                os.utime(claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as f:
+                record = json.load(f)
+            try:
+                self._send(record)
+            except Exception as e:
+                os.rename(claimed, path)
+                logging.error(f"MLflow still unavailable, keeping {len(self.spooled())} spooled runs: {e}")
+                self._down_until = time.monotonic() + self.retry_interval
+                return
+            os.remove(claimed)
+
+    def flush(self, timeout=30):
+        """Wait until queued runs are sent or spooled; True if the queue drained in time."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=10):
+        # Whatever could not be sent in time survives on disk for the next process
+        self.flush(timeout)
+        while True:
+            try:
+                self._spool(self._queue.get_nowait())
+            except queue.Empty:
+                return
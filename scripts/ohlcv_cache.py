@@ -0,0 +1,120 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Read-through on-disk cache of per-symbol OHLCV frames.
+#
+# Each symbol is kept in one uncompressed Arrow IPC file so reads can memory-map
+# it and slice the requested date range without loading the rest. The schema
+# metadata records the date range the file covers and the data version (see
+# query_ohlcv_version: it moves when bars are added or revised, the latest one
+# included); a version change drops the file, a request outside the covered
+# range fetches only the missing edges and rewrites it.
+
+_METADATA_KEY = b'ohlcv_cache'
+
+
+class OhlcvCache:
+    def __init__(self, cache_dir, version_ttl=60):
+        self.cache_dir = cache_dir
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, symbol):
+        return os.path.join(self.cache_dir, f"{symbol.replace('/', '_').replace('-', '_')}.arrow")
+
+    def version(self, symbol, load_version):
+        # The version is re-read at most once per `version_ttl` seconds
+        cached = self._versions.get(symbol)
+        if cached is None or time.monotonic() - cached[1] > self.version_ttl:
+            cached = (str(load_version(symbol)), time.monotonic())
+            self._versions[symbol] = cached
+        return cached[0]
+
+    def get(self, symbol, start_date, end_date, load_range, load_version):
+        """Frame for `symbol` between the dates (inclusive).
+
+        `load_range(symbol, start, end)` reads rows from the database and
+        `load_version(symbol)` returns a marker that changes with the stored rows.
+        """
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        version = self.version(symbol, load_version)
+        table, meta = self._read(symbol)
+
+        if table is not None and meta['version'] == version:
+            covered_start, covered_end = pd.Timestamp(meta['start']), pd.Timestamp(meta['end'])
+            if covered_start <= start and end <= covered_end:
+                self.hits += 1
+                return self._slice(table, start, end)
+            pieces = [table.to_pandas()]
+            if start < covered_start:
+                pieces.append(load_range(symbol, start, covered_start))
+            if end > covered_end:
+                pieces.append(load_range(symbol, covered_end, end))
+            data = pd.concat([piece for piece in pieces if not piece.empty])
+            data = data[~data.index.duplicated()].sort_index()
+            start, end = min(start, covered_start), max(end, covered_end)
+        else:
+            data = load_range(symbol, start, end)
+
+        self.misses += 1
+        table = self._write(symbol, data, start, end, version)
+        return self._slice(table, start_date, end_date)
+
+    def invalidate(self, symbol):
+        self._versions.pop(symbol, None)
+        if os.path.exists(self.path(symbol)):
+            os.remove(self.path(symbol))
+
+    def _read(self, symbol):
+        path = self.path(symbol)
+        if not os.path.exists(path):
+            return None, None
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return table, json.loads(table.schema.metadata[_METADATA_KEY])
+
+    def _write(self, symbol, data, start, end, version):
+        table = pa.Table.from_pandas(data, preserve_index=True)
+        meta = {'start': start.isoformat(), 'end': end.isoformat(), 'version': version}
+        table = table.replace_schema_metadata({**table.schema.metadata, _METADATA_KEY: json.dumps(meta)})
+        path = self.path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return table
+
+    def _slice(self, table, start_date, end_date):
+        dates = table.column('date')
+        tz = getattr(dates.type, 'tz', None)
+        bounds = []
+        for value in (start_date, end_date):
+            value = pd.Timestamp(value)
+            if tz is not None:
+                value = (value.tz_localize(tz) if value.tzinfo is None else value).tz_convert('UTC').tz_localize(None)
+            bounds.append(value.to_datetime64())
+        values = dates.to_numpy()
+        lo = np.searchsorted(values, bounds[0], side='left')
+        hi = np.searchsorted(values, bounds[1], side='right')
+        return table.slice(lo, hi - lo).to_pandas()
+
+
+_cache = None
+
+
+def get_ohlcv_cache():
+    """Process-wide cache, enabled by setting OHLCV_CACHE_DIR."""
+    global _cache
+    cache_dir = os.getenv('OHLCV_CACHE_DIR')
+    if not cache_dir:
+        return None
+    if _cache is None or _cache.cache_dir != cache_dir:
+        _cache = OhlcvCache(cache_dir, version_ttl=float(os.getenv('OHLCV_CACHE_VERSION_TTL', '60')))
+    return _cache
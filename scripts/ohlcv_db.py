@@ -0,0 +1,319 @@
+import os
+import time
+from contextlib import nullcontext
+import pandas as pd
+from sqlalchemy import bindparam, column, inspect, table as table_clause, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Shared access to stored OHLCV bars. Dates are always sent as bound parameters
+# so Postgres can reuse plans and answer ranges from the index; only quoted
+# identifiers are interpolated. Tables live in the `public` schema on Postgres;
+# other dialects (SQLite in tests) use the default schema.
+#
+# Two layouts are supported:
+#   - unified: one `ohlcv` table keyed by (symbol, timestamp); on Postgres it is
+#     LIST-partitioned by symbol, one `ohlcv_part_<symbol>` partition per coin
+#   - per-symbol (legacy): one `ohlcv_<symbol>` table per coin
+# The unified layout is used once its table exists (see migrate_per_symbol_tables)
+# or when OHLCV_LAYOUT=unified; OHLCV_LAYOUT=per_symbol forces the legacy tables.
+# The table is probed again after OHLCV_LAYOUT_TTL seconds (default 60), so
+# every process switches to it once another one has migrated.
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+UNIFIED_TABLE = 'ohlcv'
+PARTITION_PREFIX = 'ohlcv_part_'
+
+_unified_tables = {}
+
+
+def canonical_symbol(symbol):
+    # Yahoo uses BTC-USD, the app BTC/USD and table names BTC_USD
+    return symbol.replace('-', '/').replace('_', '/')
+
+
+def table_name(symbol):
+    return f"ohlcv_{canonical_symbol(symbol).replace('/', '_')}"
+
+
+def symbol_from_table(table):
+    return table[len('ohlcv_'):].replace('_', '/')
+
+
+def qualified_table(engine, table):
+    quoted = engine.dialect.identifier_preparer.quote(table)
+    if engine.dialect.name == 'postgresql':
+        return f"public.{quoted}"
+    return quoted
+
+
+def quoted_table(engine, symbol):
+    return qualified_table(engine, table_name(symbol))
+
+
+def table_exists(engine, table):
+    schema = 'public' if engine.dialect.name == 'postgresql' else None
+    return inspect(engine).has_table(table, schema=schema)
+
+
+def unified_layout(engine):
+    layout = os.getenv('OHLCV_LAYOUT')
+    if layout:
+        return layout == 'unified'
+    key = engine.url.render_as_string()
+    unified, expires_at = _unified_tables.get(key, (False, 0.0))
+    if time.monotonic() >= expires_at:
+        try:
+            unified = table_exists(engine, UNIFIED_TABLE)
+        except Exception as e:
+            # Not cached: the next call probes again once the database is reachable
+            print(f"Could not detect OHLCV layout, using per-symbol tables: {e}")
+            return False
+        _unified_tables[key] = (unified, time.monotonic() + float(os.getenv('OHLCV_LAYOUT_TTL', '60')))
+    return unified
+
+
+def per_symbol_tables(engine):
+    schema = 'public' if engine.dialect.name == 'postgresql' else None
+    return [table for table in inspect(engine).get_table_names(schema=schema)
+            if table.startswith('ohlcv_') and not table.startswith(PARTITION_PREFIX)]
+
+
+def query_range(engine, symbol, start_date, end_date):
+    if unified_layout(engine):
+        return query_symbols_range(engine, [symbol], start_date, end_date).drop(columns='symbol')
+
+    query = f"""
+        SELECT timestamp AS date, open AS open, high AS high, low AS low, close AS close, volume AS volume
+        FROM {quoted_table(engine, symbol)}
+        WHERE timestamp >= :start_date AND timestamp <= :end_date
+        ORDER BY timestamp;
+    """
+    print(f"Executing query:\n{query}\nwith start_date={start_date}, end_date={end_date}\n")  # Print the SQL query for debugging purposes
+    return pd.read_sql(text(query), con=engine, params={'start_date': start_date, 'end_date': end_date})
+
+
+def query_symbols_range(engine, symbols, start_date, end_date):
+    """Bars of several symbols in long format (with a `symbol` column).
+
+    One query on the unified table; one per symbol on the legacy layout.
+    """
+    symbols = [canonical_symbol(symbol) for symbol in symbols]
+    if not unified_layout(engine):
+        frames = [query_range(engine, symbol, start_date, end_date).assign(symbol=symbol) for symbol in symbols]
+        return pd.concat(frames, ignore_index=True)[['symbol', 'date', 'open', 'high', 'low', 'close', 'volume']]
+
+    query = f"""
+        SELECT symbol, timestamp AS date, open AS open, high AS high, low AS low, close AS close, volume AS volume
+        FROM {qualified_table(engine, UNIFIED_TABLE)}
+        WHERE symbol IN :symbols AND timestamp >= :start_date AND timestamp <= :end_date
+        ORDER BY symbol, timestamp;
+    """
+    print(f"Executing query:\n{query}\nwith symbols={symbols}, start_date={start_date}, end_date={end_date}\n")  # Print the SQL query for debugging purposes
+    statement = text(query).bindparams(bindparam('symbols', expanding=True))
+    return pd.read_sql(statement, con=engine, params={'symbols': symbols, 'start_date': start_date, 'end_date': end_date})
+
+
+def query_latest_timestamp(engine, symbol):
+    if unified_layout(engine):
+        query = f"SELECT max(timestamp) AS latest FROM {qualified_table(engine, UNIFIED_TABLE)} WHERE symbol = :symbol;"
+        return pd.read_sql(text(query), con=engine, params={'symbol': canonical_symbol(symbol)})['latest'].iloc[0]
+    query = f"SELECT max(timestamp) AS latest FROM {quoted_table(engine, symbol)};"
+    return pd.read_sql(text(query), con=engine)['latest'].iloc[0]
+
+
+def query_ohlcv_version(engine, symbol):
+    """Marker of a symbol's stored bars that moves when a bar is added or revised.
+
+    The latest timestamp, the row count and a sum over every price and volume,
+    in one aggregate over the symbol's rows.
+    """
+    aggregate = "max(timestamp) AS latest, count(*) AS bars, sum(open + high + low + close + volume) AS checksum"
+    if unified_layout(engine):
+        query = f"SELECT {aggregate} FROM {qualified_table(engine, UNIFIED_TABLE)} WHERE symbol = :symbol;"
+        row = pd.read_sql(text(query), con=engine, params={'symbol': canonical_symbol(symbol)}).iloc[0]
+    else:
+        row = pd.read_sql(text(f"SELECT {aggregate} FROM {quoted_table(engine, symbol)};"), con=engine).iloc[0]
+    return f"{row['latest']}|{row['bars']}|{row['checksum']!r}"
+
+
+def has_stored_data(engine, symbol):
+    if unified_layout(engine):
+        return table_exists(engine, UNIFIED_TABLE)
+    return table_exists(engine, table_name(symbol))
+
+
+def ensure_ohlcv_table(engine, table):
+    # Table and index on one connection: a SQLite connection that saw the table
+    # without its index keeps rejecting upserts against it
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {qualified_table(engine, table)} (
+                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume DOUBLE PRECISION
+            )
+        """))
+        ensure_timestamp_index(engine, table, conn=conn)
+
+
+def ensure_unified_table(engine):
+    partitioned = engine.dialect.name == 'postgresql'
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {qualified_table(engine, UNIFIED_TABLE)} (
+                symbol VARCHAR(20) NOT NULL,
+                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume DOUBLE PRECISION,
+                PRIMARY KEY (symbol, timestamp)
+            ){' PARTITION BY LIST (symbol)' if partitioned else ''}
+        """))
+        if partitioned:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {qualified_table(engine, PARTITION_PREFIX + 'default')}
+                PARTITION OF {qualified_table(engine, UNIFIED_TABLE)} DEFAULT
+            """))
+    # Probed again on the next call, which finds the table
+    _unified_tables.pop(engine.url.render_as_string(), None)
+
+
+def ensure_symbol_partition(engine, symbol):
+    if engine.dialect.name != 'postgresql':
+        return
+    symbol = canonical_symbol(symbol)
+    partition = qualified_table(engine, PARTITION_PREFIX + symbol.replace('/', '_'))
+    literal = symbol.replace("'", "''")  # DDL cannot take bound parameters
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {partition}
+            PARTITION OF {qualified_table(engine, UNIFIED_TABLE)} FOR VALUES IN ('{literal}')
+        """))
+
+
+def ensure_symbol_storage(engine, symbol):
+    if unified_layout(engine):
+        ensure_unified_table(engine)
+        ensure_symbol_partition(engine, symbol)
+    else:
+        ensure_ohlcv_table(engine, table_name(symbol))
+
+
+def has_index(engine, conn, table, index):
+    if engine.dialect.name == 'postgresql':
+        query = "SELECT 1 FROM pg_indexes WHERE schemaname = 'public' AND tablename = :table AND indexname = :index"
+    else:
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND name = :index"
+    return conn.execute(text(query), {'table': table, 'index': index}).first() is not None
+
+
+def ensure_timestamp_index(engine, table, conn=None):
+    # A unique index serves the range scans and is the conflict target for upserts.
+    # Tables filled by the old append-only ingestion may hold repeated bars, which
+    # are collapsed to their latest copy first. That scans the whole table, so it
+    # only runs while the index is missing.
+    preparer = engine.dialect.identifier_preparer
+    row_id = 'ctid' if engine.dialect.name == 'postgresql' else 'rowid'
+    qualified = qualified_table(engine, table)
+    index = f'ux_{table}_timestamp'
+    with engine.begin() if conn is None else nullcontext(conn) as conn:
+        if has_index(engine, conn, table, index):
+            return
+        conn.execute(text(f"""
+            DELETE FROM {qualified}
+            WHERE {row_id} IN (
+                SELECT {row_id} FROM (
+                    SELECT {row_id}, row_number() OVER (PARTITION BY timestamp ORDER BY {row_id} DESC) AS copy
+                    FROM {qualified}
+                ) AS copies
+                WHERE copy > 1
+            )
+        """))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {preparer.quote(index)} ON {qualified} (timestamp)"))
+        conn.execute(text(f"DROP INDEX IF EXISTS {preparer.quote(f'ix_{table}_timestamp')}"))
+
+
+def ensure_all_timestamp_indexes(engine):
+    for table in per_symbol_tables(engine):
+        ensure_timestamp_index(engine, table)
+
+
+def _ohlcv_records(df, symbol=None):
+    # A batch may become one multi-row INSERT, which cannot touch the same row twice
+    records = df[OHLCV_COLUMNS].drop_duplicates('timestamp', keep='last').to_dict('records')
+    for record in records:
+        record['timestamp'] = pd.Timestamp(record['timestamp']).to_pydatetime()
+        if symbol is not None:
+            record['symbol'] = symbol
+    return records
+
+
+def _ohlcv_upsert(engine, table, key, table_columns):
+    # INSERT ... ON CONFLICT built as a construct, the same statement on PostgreSQL and SQLite
+    schema = 'public' if engine.dialect.name == 'postgresql' else None
+    target = table_clause(table, *(column(name) for name in table_columns), schema=schema)
+    dialect = postgresql if engine.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(target)
+    return statement, key, {name: statement.excluded[name] for name in ('open', 'high', 'low', 'close', 'volume')}
+
+
+def _execute_batches(engine, upsert, records, batch_size, conn):
+    # Each batch is one multi-row INSERT, so one round trip: executemany would send
+    # the rows one by one on psycopg2 (insertmanyvalues skips ON CONFLICT DO UPDATE)
+    statement, key, updates = upsert
+    with engine.begin() if conn is None else nullcontext(conn) as conn:
+        for start in range(0, len(records), batch_size):
+            batch = statement.values(records[start:start + batch_size])
+            conn.execute(batch.on_conflict_do_update(index_elements=key, set_=updates))
+    return len(records)
+
+
+def upsert_ohlcv(engine, table, df, batch_size=1000, conn=None):
+    """Insert bars, replacing any already stored for the same timestamp.
+
+    Runs in its own transaction unless an open connection is passed in.
+    """
+    upsert = _ohlcv_upsert(engine, table, ['timestamp'], OHLCV_COLUMNS)
+    return _execute_batches(engine, upsert, _ohlcv_records(df), batch_size, conn)
+
+
+def upsert_unified(engine, symbol, df, batch_size=1000, conn=None):
+    upsert = _ohlcv_upsert(engine, UNIFIED_TABLE, ['symbol', 'timestamp'], ['symbol'] + OHLCV_COLUMNS)
+    return _execute_batches(engine, upsert, _ohlcv_records(df, canonical_symbol(symbol)), batch_size, conn)
+
+
+def store_ohlcv(engine, symbol, df, conn=None):
+    if unified_layout(engine):
+        return upsert_unified(engine, symbol, df, conn=conn)
+    return upsert_ohlcv(engine, table_name(symbol), df, conn=conn)
+
+
+def migrate_per_symbol_tables(engine, drop=False):
+    """Copy every legacy ohlcv_<symbol> table into the unified table.
+
+    Runs server side, one INSERT ... SELECT per table; rows already present are
+    kept, so the migration can be re-run. Returns {symbol: rows copied}.
+    """
+    ensure_unified_table(engine)
+    migrated = {}
+    for table in per_symbol_tables(engine):
+        symbol = symbol_from_table(table)
+        ensure_symbol_partition(engine, symbol)
+        with engine.begin() as conn:
+            # SQLite needs the WHERE to tell the SELECT apart from the ON CONFLICT clause
+            result = conn.execute(text(f"""
+                INSERT INTO {qualified_table(engine, UNIFIED_TABLE)} (symbol, timestamp, open, high, low, close, volume)
+                SELECT :symbol, timestamp, open, high, low, close, volume FROM {qualified_table(engine, table)}
+                WHERE true
+                ON CONFLICT (symbol, timestamp) DO NOTHING
+            """), {'symbol': symbol})
+            migrated[symbol] = result.rowcount
+            if drop:
+                conn.execute(text(f"DROP TABLE {qualified_table(engine, table)}"))
+        print(f"Migrated {migrated[symbol]} rows from {table}")
+    return migrated
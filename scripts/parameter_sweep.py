@@ -0,0 +1,103 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.backtest_runner import fetch_data, run_backtest, score_results, RsiBollingerBandsStrategy
+
+# The OHLCV frame is handed to each worker once through the pool initializer and
+# kept here, so individual runs only ship their parameter dict across processes.
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_point(task):
+    strategy_class, initial_cash, fee, vectorized, params = task
+    result = run_backtest(strategy_class, None, initial_cash, fee, None, None,
+                          vectorized=vectorized, data=_worker_data, params=params)
+    result['params'] = params
+    return result
+
+
+def _check_space(strategy_class, space):
+    known = strategy_class.params._getkeys()
+    unknown = [name for name in space if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown parameters for {strategy_class.__name__}: {', '.join(unknown)}")
+    empty = [name for name in space if not len(space[name])]
+    if empty:
+        raise ValueError(f"No candidate values for {', '.join(empty)}")
+
+
+def grid_space(strategy_class, space):
+    """Every combination of the candidate values in `space` ({param: [values]})."""
+    _check_space(strategy_class, space)
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_space(strategy_class, space, n_samples, seed=None):
+    """`n_samples` distinct draws from the grid (the whole grid if it is smaller)."""
+    _check_space(strategy_class, space)
+    names = list(space)
+    sizes = [len(space[name]) for name in names]
+    total = 1
+    for size in sizes:
+        total *= size
+    rng = random.Random(seed)
+    points = []
+    # Sample flat grid positions so large spaces are never materialized
+    for flat in rng.sample(range(total), min(n_samples, total)):
+        params = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            flat, pos = divmod(flat, size)
+            params[name] = space[name][pos]
+        points.append({name: params[name] for name in names})
+    return points
+
+
+def run_sweep(strategy_class, symbol, initial_cash, fee, start_date, end_date, space,
+              n_samples=None, seed=None, vectorized=True, max_workers=None, data=None):
+    """Run `strategy_class` over a parameter space and rank the runs.
+
+    A grid sweep is used unless `n_samples` is given, in which case that many
+    points are drawn at random. Results carry their `params` and a `score`
+    (the score_backtest weighting over the whole sweep), best first.
+    """
+    if n_samples is None:
+        points = grid_space(strategy_class, space)
+    elif n_samples < 1:
+        raise ValueError("n_samples must be at least 1.")
+    else:
+        points = random_space(strategy_class, space, n_samples, seed=seed)
+
+    if data is None:
+        data = fetch_data(symbol, start_date, end_date)
+
+    tasks = [(strategy_class, initial_cash, fee, vectorized, params) for params in points]
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (max_workers * 4))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data,)) as executor:
+        results = list(executor.map(_run_point, tasks, chunksize=chunksize))
+
+    for result, score in zip(results, score_results(results)):
+        result['score'] = score
+    return sorted(results, key=lambda result: result['score'], reverse=True)
+
+
+if __name__ == "__main__":
+    space = {
+        'rsi_period': [7, 14, 21],
+        'bb_period': [10, 20, 30],
+        'bb_dev': [1.5, 2, 2.5],
+        'oversold': [20, 25, 30, 35],
+        'overbought': [65, 70, 75, 80],
+    }
+    ranked = run_sweep(RsiBollingerBandsStrategy, 'ETH/USD', 10000, 0.001, '2023-06-20', '2024-06-20', space)
+    for result in ranked[:10]:
+        print(f"{result['score']:.4f} {result['params']}")
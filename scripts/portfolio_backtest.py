@@ -0,0 +1,129 @@
+import backtrader as bt
+from scripts.backtest_runner import fetch_many, attach_indicator_store
+
+# Portfolio mode: several symbols in one Cerebro run with a shared broker.
+#
+# The strategies are written against a single feed (self.data, self.position,
+# self.buy()), so each asset gets its own instance of the strategy with the feeds
+# rotated to put that asset first. All instances trade from the same cash; a
+# per-asset sizer spends at most the asset's weight of the portfolio value.
+
+
+def align_frames(frames):
+    """Restrict every frame to the dates all of them have, so the feeds tick together."""
+    common = None
+    for data in frames.values():
+        common = data.index if common is None else common.intersection(data.index)
+    if common is None or common.empty:
+        raise ValueError("Symbols have no dates in common.")
+    return {symbol: data.loc[common] for symbol, data in frames.items()}
+
+
+class PortfolioWeightSizer(bt.Sizer):
+    params = (
+        ('weight', 1.0),
+        ('buffer', 0.03),  # left unspent, so a gap up at the next open does not get the order rejected
+    )
+
+    def _getsizing(self, comminfo, cash, data, isbuy):
+        if not isbuy:
+            # Exits close the whole position
+            return self.broker.getposition(data).size
+        budget = min(self.p.weight * self.broker.getvalue(), cash) * (1 - self.p.buffer)
+        return budget / (data.close[0] * (1 + comminfo.p.commission))
+
+
+def asset_strategy(strategy_class):
+    class AssetStrategy(strategy_class):
+        params = (
+            ('asset', 0),
+        )
+
+        def __init__(self):
+            # Indicators, position, buy and sell all default to the first feed
+            asset = self.p.asset
+            self.datas = self.datas[asset:] + self.datas[:asset]
+            self.data = self.data0 = self.datas[0]
+            super().__init__()
+
+    AssetStrategy.__name__ = strategy_class.__name__
+    return AssetStrategy
+
+
+def trade_counts(strategy):
+    trade_analysis = strategy.analyzers.tradeanalyzer.get_analysis()
+    return {
+        'number_of_trades': trade_analysis.get('total', {}).get('closed', 0),
+        'winning_trades': trade_analysis.get('won', {}).get('total', 0),
+        'losing_trades': trade_analysis.get('lost', {}).get('total', 0),
+    }
+
+
+def asset_metrics(strategy, allocated_cash):
+    trade_analysis = strategy.analyzers.tradeanalyzer.get_analysis()
+    realized = trade_analysis.get('pnl', {}).get('net', {}).get('total', 0.0)
+    position = strategy.position
+    unrealized = 0.0
+    if position:
+        entry_commission = strategy.broker.getcommissioninfo(strategy.data).getcommission(position.size, position.price)
+        unrealized = position.size * (strategy.data.close[0] - position.price) - entry_commission
+    pnl = realized + unrealized
+    return dict(trade_counts(strategy), pnl=pnl, total_return=pnl / allocated_cash if allocated_cash else 0.0)
+
+
+def run_portfolio_backtest(strategy_class, symbols, initial_cash, fee, start_date, end_date, weights=None, data=None, params=None):
+    """Backtest `strategy_class` on every symbol at once, sharing `initial_cash`.
+
+    `weights` maps symbol to its share of the portfolio (equal by default). Returns
+    the portfolio metrics in run_backtest's format plus an `assets` dict of
+    per-symbol pnl, return and trade counts.
+    """
+    if data is None:
+        data = fetch_many(symbols, start_date, end_date)
+    data = align_frames({symbol: data[symbol] for symbol in symbols})
+    weights = weights or {symbol: 1.0 / len(symbols) for symbol in symbols}
+
+    cerebro = bt.Cerebro()
+    for symbol in symbols:
+        data_feed = bt.feeds.PandasData(dataname=data[symbol])
+        attach_indicator_store(data_feed, symbol, data[symbol])
+        cerebro.adddata(data_feed, name=symbol)
+
+    strategy = asset_strategy(strategy_class)
+    for asset, symbol in enumerate(symbols):
+        idx = cerebro.addstrategy(strategy, asset=asset, **(params or {}))
+        cerebro.addsizer_byidx(idx, PortfolioWeightSizer, weight=weights[symbol])
+    cerebro.broker.set_cash(float(initial_cash))
+    cerebro.broker.setcommission(commission=fee)
+
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='tradeanalyzer')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio_A, _name='sharpe')
+
+    print(f'Starting Portfolio Value: {cerebro.broker.getvalue():.2f}')
+    result = cerebro.run()
+    ending_value = cerebro.broker.getvalue()
+    print(f'Ending Portfolio Value: {ending_value:.2f}')
+
+    assets = {symbol: asset_metrics(strat, initial_cash * weights[symbol]) for symbol, strat in zip(symbols, result)}
+
+    # Drawdown and Sharpe follow the broker value, so every instance reports the portfolio's
+    drawdown_analysis = result[0].analyzers.drawdown.get_analysis()
+    sharpe_analysis = result[0].analyzers.sharpe.get_analysis()
+
+    return {
+        'backtest_id': 0,
+        'total_return': ending_value / initial_cash - 1,
+        'number_of_trades': sum(asset['number_of_trades'] for asset in assets.values()),
+        'winning_trades': sum(asset['winning_trades'] for asset in assets.values()),
+        'losing_trades': sum(asset['losing_trades'] for asset in assets.values()),
+        'max_drawdown': drawdown_analysis.get('max', {}).get('drawdown', 0.0),
+        'sharpe_ratio': sharpe_analysis.get('sharperatio', 0.0),
+        'assets': assets,
+    }
+
+
+if __name__ == "__main__":
+    from scripts.backtest_runner import MacdStrategy
+
+    print(run_portfolio_backtest(MacdStrategy, ['BTC/USD', 'ETH/USD', 'SOL/USD'], 10000, 0.001, '2023-06-20', '2024-06-20'))
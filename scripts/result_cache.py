@@ -0,0 +1,52 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+# Content addresses of backtest results.
+#
+# A result is fully determined by the strategy (class and effective params),
+# the cash and fee, the run options (e.g. walk-forward) and the bars it ran on.
+# fingerprint() hashes all of these; the bars enter through data_version(), a
+# hash of the frame's dates and values, so any change to the ingested data
+# gives new fingerprints and results computed on the old bars are no longer
+# found. Bump RESULT_VERSION when a change to the engine alters results.
+
+RESULT_VERSION = 2
+
+
+def data_version(data):
+    """Hash of an OHLCV frame as fetch_data returns it, or of a {symbol: frame} dict of them."""
+    digest = hashlib.sha256()
+    frames = data.items() if isinstance(data, dict) else [(None, data)]
+    for symbol, frame in frames:
+        if symbol is not None:
+            digest.update(symbol.encode())
+        digest.update(np.ascontiguousarray(frame.index.as_unit('ns').asi8).tobytes())
+        for column in frame.columns:
+            digest.update(str(column).encode())
+            digest.update(np.ascontiguousarray(frame[column].to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()
+
+
+def _date(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d') if value is not None else None
+
+
+def fingerprint(strategy_class, symbol, start_date, end_date, initial_cash, fee, version, params=None, options=None):
+    """Deterministic key of a backtest result; `version` is the data_version() of its bars."""
+    effective = dict(strategy_class.params._getpairs())
+    effective.update(params or {})
+    key = {
+        'result_version': RESULT_VERSION,
+        'strategy': f'{strategy_class.__module__}.{strategy_class.__qualname__}',
+        'params': effective,
+        'symbol': ','.join(symbol) if isinstance(symbol, (list, tuple)) else symbol,
+        'start_date': _date(start_date),
+        'end_date': _date(end_date),
+        'initial_cash': float(initial_cash),
+        'fee': float(fee),
+        'options': options or {},
+        'data_version': version,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
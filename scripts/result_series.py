@@ -0,0 +1,80 @@
+import numpy as np
+import pyarrow as pa
+
+# Per-bar equity and trade log of a backtest, kept as compact blobs.
+#
+# backtest_runner's SeriesRecorder records the broker value on every bar and
+# each closed trade while Cerebro runs. The equity curve (with its drawdown)
+# and the trades are each encoded as one uncompressed Arrow IPC stream: equity
+# and drawdown as float32, dates as timestamps. A curve is stored with a single
+# write whatever its length, and decode() reads it back without copying the
+# buffers. Only numpy and pyarrow are needed here, so the API can serve them.
+
+# date2num of 1970-01-01
+_EPOCH_NUM = 719163.0
+
+
+def num_to_ns(nums):
+    # backtrader's float days to epoch nanoseconds, at its microsecond resolution
+    micros = np.round((np.asarray(nums, dtype=float) - _EPOCH_NUM) * 86400e6).astype(np.int64)
+    return micros * 1000
+
+
+def drawdown(equity):
+    """Drawdown in percent below the running peak, as backtrader's DrawDown reports it."""
+    peak = np.maximum.accumulate(equity)
+    return 100.0 * (peak - equity) / peak
+
+
+def _encode(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_equity(series):
+    """Arrow IPC bytes of a SeriesRecorder analysis' equity curve: date, equity, drawdown."""
+    equity = np.asarray(series['equity'], dtype=float)
+    return _encode(pa.table({
+        'date': pa.array(series['dates'], type=pa.timestamp('ns')),
+        'equity': pa.array(equity.astype(np.float32)),
+        'drawdown': pa.array(drawdown(equity).astype(np.float32)),
+    }))
+
+
+def encode_trades(series):
+    """Arrow IPC bytes of a SeriesRecorder analysis' closed trades."""
+    trades = dict(series['trades'])
+    for column in ('open_date', 'close_date'):
+        trades[column] = pa.array(trades[column], type=pa.timestamp('ns'))
+    return _encode(pa.table(trades))
+
+
+def decode(blob):
+    """The pa.Table of an encoded blob, backed by the blob's memory."""
+    return pa.ipc.open_stream(pa.py_buffer(blob)).read_all()
+
+
+def downsample(table, points):
+    """At most `points` rows of an equity table for charting.
+
+    The bars are cut into `points` equal buckets. Each keeps its last date and
+    equity, the lowest and highest equity within it and its deepest drawdown,
+    so peaks and troughs survive the reduction.
+    """
+    n = table.num_rows
+    equity = table.column('equity').to_numpy()
+    dd = table.column('drawdown').to_numpy()
+    dates = table.column('date').to_numpy()
+    if n <= points:
+        return {'date': dates, 'equity': equity, 'equity_min': equity, 'equity_max': equity, 'drawdown': dd}
+    starts = np.unique(np.linspace(0, n, points, endpoint=False).astype(np.int64))
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'date': dates[ends],
+        'equity': equity[ends],
+        'equity_min': np.minimum.reduceat(equity, starts),
+        'equity_max': np.maximum.reduceat(equity, starts),
+        'drawdown': np.maximum.reduceat(dd, starts),
+    }
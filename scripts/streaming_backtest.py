@@ -0,0 +1,199 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+import backtrader as bt
+import numpy as np
+
+# Streaming (paper trading) mode: bars arrive one at a time on a Kafka topic and
+# drive an ordinary bt.Strategy through a live feed, so indicators advance one
+# bar per update instead of being recomputed over the whole history. Fills and
+# the equity after every bar are published to an events topic.
+#
+# The bus is anything with KafkaService's produce(topic, message, key=None) and
+# consume(topic, callback, stop=None); InMemoryBus stands in for Kafka in tests.
+#
+# Bar messages: {"symbol": "BTC/USD", "timestamp": ISO string or epoch ms,
+#                "open": .., "high": .., "low": .., "close": .., "volume": ..}
+
+
+class InMemoryBus:
+    def __init__(self):
+        self.topics = defaultdict(list)
+        self._changed = threading.Condition()
+
+    def produce(self, topic, message, key=None, sync=False):
+        # Serialized like KafkaService would, so payloads must be JSON too
+        with self._changed:
+            self.topics[topic].append(json.dumps(message))
+            self._changed.notify_all()
+
+    def messages(self, topic):
+        with self._changed:
+            return [json.loads(message) for message in self.topics[topic]]
+
+    def consume(self, topic, callback, stop=None, **kwargs):
+        offset = 0
+        while stop is None or not stop.is_set():
+            with self._changed:
+                if offset >= len(self.topics[topic]):
+                    self._changed.wait(0.05)
+                    continue
+                message = self.topics[topic][offset]
+            offset += 1
+            callback(json.loads(message))
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).replace(tzinfo=None)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def publish_bars(bus, topic, symbol, data):
+    """Replay a prepared OHLCV frame (as fetch_data returns) onto `topic`."""
+    for date, row in data.iterrows():
+        bus.produce(topic, {
+            'symbol': symbol,
+            'timestamp': date.isoformat(),
+            'open': float(row['Open']),
+            'high': float(row['High']),
+            'low': float(row['Low']),
+            'close': float(row['Close']),
+            'volume': float(row['Volume']),
+        }, key=symbol)
+
+
+class QueueFeed(bt.feed.DataBase):
+    params = (
+        ('bars', None),
+        ('timeout', 0.05),
+    )
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return not self.p.bars.empty()
+
+    def _load(self):
+        try:
+            bar = self.p.bars.get(timeout=self.p.timeout)
+        except queue.Empty:
+            return None  # nothing yet, Cerebro polls again
+        if bar is None:
+            return False  # stream closed
+        self.received_at = bar['received_at']
+        self.lines.datetime[0] = bt.date2num(bar['datetime'])
+        self.lines.open[0] = bar['open']
+        self.lines.high[0] = bar['high']
+        self.lines.low[0] = bar['low']
+        self.lines.close[0] = bar['close']
+        self.lines.volume[0] = bar['volume']
+        self.lines.openinterest[0] = 0.0
+        return True
+
+
+class StreamPublisher(bt.Analyzer):
+    params = (
+        ('bus', None),
+        ('topic', 'paper_trading'),
+        ('symbol', None),
+    )
+
+    def start(self):
+        self.latencies = []
+
+    def notify_order(self, order):
+        if order.status != order.Completed:
+            return
+        self.p.bus.produce(self.p.topic, {
+            'type': 'fill',
+            'symbol': self.p.symbol,
+            'timestamp': self.data.datetime.datetime(0).isoformat(),
+            'side': 'buy' if order.isbuy() else 'sell',
+            'size': order.executed.size,
+            'price': order.executed.price,
+            'commission': order.executed.comm,
+        }, key=self.p.symbol)
+
+    def next(self):
+        self.p.bus.produce(self.p.topic, {
+            'type': 'equity',
+            'symbol': self.p.symbol,
+            'timestamp': self.data.datetime.datetime(0).isoformat(),
+            'value': self.strategy.broker.getvalue(),
+            'cash': self.strategy.broker.getcash(),
+            'position': self.strategy.position.size,
+        }, key=self.p.symbol)
+        # From the bar's arrival to the strategy having acted on it
+        self.latencies.append(time.perf_counter() - self.data.received_at)
+
+    def get_analysis(self):
+        latencies = np.array(self.latencies) * 1000
+        if not len(latencies):
+            return {'bars': 0}
+        return {
+            'bars': len(latencies),
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+            'latency_max_ms': float(latencies.max()),
+        }
+
+
+def run_stream(strategy_class, symbol, bus, bars_topic='ohlcv_bars', events_topic='paper_trading', initial_cash=10000,
+               fee=0.001, params=None, stop=None):
+    """Paper trade `symbol` on bars from `bars_topic` until `stop` is set.
+
+    Blocks; returns per-bar latency stats and the final broker value.
+    """
+    stop = stop or threading.Event()
+    bars = queue.Queue()
+
+    def on_bar(message):
+        if message.get('symbol') != symbol:
+            return
+        bars.put({
+            'received_at': time.perf_counter(),
+            'datetime': parse_timestamp(message['timestamp']),
+            'open': float(message['open']),
+            'high': float(message['high']),
+            'low': float(message['low']),
+            'close': float(message['close']),
+            'volume': float(message['volume']),
+        })
+
+    consumer = threading.Thread(target=bus.consume, args=(bars_topic, on_bar), kwargs={'stop': stop}, daemon=True)
+    consumer.start()
+
+    def close_when_stopped():
+        stop.wait()
+        consumer.join()
+        bars.put(None)
+
+    threading.Thread(target=close_when_stopped, daemon=True).start()
+
+    # exactbars keeps only the lookback each indicator needs, so memory stays flat however long it runs
+    cerebro = bt.Cerebro(stdstats=False, exactbars=1)
+    cerebro.adddata(QueueFeed(bars=bars), name=symbol)
+    cerebro.addstrategy(strategy_class, **(params or {}))
+    cerebro.broker.set_cash(float(initial_cash))
+    cerebro.broker.setcommission(commission=fee)
+    cerebro.addanalyzer(StreamPublisher, _name='stream', bus=bus, topic=events_topic, symbol=symbol)
+
+    result = cerebro.run()
+    return dict(result[0].analyzers.stream.get_analysis(), value=cerebro.broker.getvalue())
+
+
+if __name__ == "__main__":
+    from app.services.kafka_service import KafkaService
+    from scripts.backtest_runner import MacdStrategy
+
+    bus = KafkaService(brokers=os.getenv('KAFKA_BROKERS', 'localhost:9092'), group_id='paper_trading')
+    print(run_stream(MacdStrategy, os.getenv('PAPER_SYMBOL', 'BTC/USD'), bus))
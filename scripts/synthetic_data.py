@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_ohlcv(periods, seed=0, start='2021-03-01', freq='D', price=100.0, volatility=0.02):
+    """Random-walk OHLCV frame shaped like the output of fetch_data."""
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, periods)))
+    open_ = close * np.exp(rng.normal(0, volatility / 2, periods))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, volatility / 2, periods))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, volatility / 2, periods))
+    return pd.DataFrame({
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': rng.integers(100, 1000, periods).astype(float)
+    }, index=pd.date_range(start=start, periods=periods, freq=freq, name='date'))
@@ -0,0 +1,159 @@
+import math
+import numpy as np
+
+from scripts.backtest_runner import fetch_data, RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy
+from scripts.indicator_store import indicator_source
+
+# Vectorized counterpart of run_backtest for the long-only signal strategies.
+# Indicators come from scripts.indicator_store (backtrader's values) and orders
+# mimic the default broker: a market order for a single unit (FixedSize sizer)
+# placed on the signal bar and filled at the next bar's open, with a percentage
+# commission on each side.
+
+RISK_FREE_RATE = 0.01
+
+
+def shifted(values):
+    out = np.full(len(values), np.nan)
+    out[1:] = values[:-1]
+    return out
+
+
+def rsi_bollinger_signals(data, p, lines):
+    close = data['Close'].to_numpy(dtype=float)
+    rsi_line, = lines('rsi', {'period': p['rsi_period']})
+    _, top, bot = lines('bollinger_bands', {'period': p['bb_period'], 'devfactor': p['bb_dev']})
+    entries = (rsi_line < p['oversold']) & (close <= bot)
+    exits = (rsi_line > p['overbought']) | (close >= top)
+    minperiod = max(p['rsi_period'] + 1, p['bb_period'])
+    return entries, exits, minperiod
+
+
+def macd_signals(data, p, lines):
+    histo, = lines('macd_histogram', {'period_me1': p['macd1_period'], 'period_me2': p['macd2_period'],
+                                      'period_signal': p['signal_period']})
+    previous = shifted(histo)
+    entries = (histo > 0) & (previous <= 0)
+    exits = (histo < 0) & (previous >= 0)
+    minperiod = max(p['macd1_period'], p['macd2_period']) + p['signal_period'] - 1
+    return entries, exits, minperiod
+
+
+def stochastic_signals(data, p, lines):
+    percK, _ = lines('stochastic', {'period': p['stoch_period']})
+    previous = shifted(percK)
+    entries = (percK < p['stoch_low']) & (previous >= p['stoch_low'])
+    exits = (percK > p['stoch_high']) & (previous <= p['stoch_high'])
+    # Stochastic (slow) also waits for its %D line: period + 2 + 2 bars
+    minperiod = p['stoch_period'] + 4
+    return entries, exits, minperiod
+
+
+VECTORIZED_SIGNALS = {
+    RsiBollingerBandsStrategy: rsi_bollinger_signals,
+    MacdStrategy: macd_signals,
+    StochasticOscillatorStrategy: stochastic_signals,
+}
+
+
+def strategy_params(strategy_class, overrides=None):
+    params = dict(strategy_class.params._getpairs())
+    params.update(overrides or {})
+    return params
+
+
+def simulate(data, entries, exits, minperiod, initial_cash, fee, size=1):
+    open_ = data['Open'].to_numpy(dtype=float)
+    close = data['Close'].to_numpy(dtype=float)
+    n = len(close)
+
+    entries = entries.copy()
+    exits = exits.copy()
+    entries[:minperiod - 1] = False
+    exits[:minperiod - 1] = False
+    entry_idx = np.flatnonzero(entries)
+    exit_idx = np.flatnonzero(exits)
+
+    cash = float(initial_cash)
+    cash_delta = np.zeros(n)
+    position = np.zeros(n)
+    trades = []
+
+    # Walk the (sparse) signal events only; everything per-bar stays vectorized
+    bar = 0
+    while True:
+        k = np.searchsorted(entry_idx, bar)
+        if k == len(entry_idx) or entry_idx[k] + 1 >= n:
+            break
+        signal = entry_idx[k]
+        fill = signal + 1
+        entry_price = open_[fill]
+        entry_comm = size * entry_price * fee
+        if cash < size * close[signal] or cash < size * entry_price + entry_comm:
+            # Rejected for margin, the strategy is still flat on the fill bar
+            bar = fill
+            continue
+        cash -= size * entry_price + entry_comm
+        cash_delta[fill] -= size * entry_price + entry_comm
+
+        k = np.searchsorted(exit_idx, fill)
+        if k == len(exit_idx) or exit_idx[k] + 1 >= n:
+            position[fill:] = size
+            break
+        exit_fill = exit_idx[k] + 1
+        exit_price = open_[exit_fill]
+        exit_comm = size * exit_price * fee
+        cash += size * exit_price - exit_comm
+        cash_delta[exit_fill] += size * exit_price - exit_comm
+        position[fill:exit_fill] = size
+        trades.append((exit_price - entry_price) * size - entry_comm - exit_comm)
+        bar = exit_fill
+
+    value = float(initial_cash) + np.cumsum(cash_delta) + position * close
+    return value, trades
+
+
+def max_drawdown(value):
+    peak = np.maximum.accumulate(value)
+    return float(np.max(100.0 * (peak - value) / peak))
+
+
+def annual_sharpe_ratio(value, index, initial_cash):
+    # Mirrors SharpeRatio_A with its defaults: yearly returns, 1% risk free rate
+    years = index.year.to_numpy()
+    last_of_year = np.flatnonzero(np.append(years[1:] != years[:-1], True))
+    year_end_values = value[last_of_year].tolist()
+    starts = [float(initial_cash)] + year_end_values[:-1]
+    ret_free = [end / start - 1.0 - RISK_FREE_RATE for start, end in zip(starts, year_end_values)]
+    avg = math.fsum(ret_free) / len(ret_free)
+    dev = math.sqrt(math.fsum((r - avg) ** 2 for r in ret_free) / len(ret_free))
+    try:
+        return avg / dev
+    except ZeroDivisionError:
+        return None
+
+
+def run_vectorized_backtest(strategy_class, symbol, initial_cash, fee, start_date, end_date, data=None, params=None, warmup_bars=0):
+    if strategy_class not in VECTORIZED_SIGNALS:
+        raise ValueError(f"No vectorized implementation for {strategy_class.__name__}")
+
+    if data is None:
+        data = fetch_data(symbol, start_date, end_date)
+
+    signals = VECTORIZED_SIGNALS[strategy_class]
+    entries, exits, minperiod = signals(data, strategy_params(strategy_class, params), indicator_source(symbol, data))
+    # No signal is taken on the warm-up bars, see run_backtest
+    value, trades = simulate(data, entries, exits, max(minperiod, warmup_bars + 1), initial_cash, fee)
+    value, index = value[warmup_bars:], data.index[warmup_bars:]
+
+    winning_trades = sum(1 for pnl in trades if pnl >= 0.0)
+
+    return {
+        'backtest_id': 0,
+        'total_return': value[-1] / initial_cash - 1,
+        'number_of_trades': len(trades),
+        'winning_trades': winning_trades,
+        'losing_trades': len(trades) - winning_trades,
+        'max_drawdown': max_drawdown(value),
+        'sharpe_ratio': annual_sharpe_ratio(value, index, initial_cash)
+    }
@@ -0,0 +1,150 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.backtest_runner import (fetch_data, run_backtest, score_results, RsiBollingerBandsStrategy, MacdStrategy,
+                                     StochasticOscillatorStrategy)
+from scripts.parameter_sweep import grid_space
+from scripts.vectorized_backtest import VECTORIZED_SIGNALS
+
+# Walk-forward testing: the range is cut into consecutive windows, each a train
+# period followed by a test period. Parameters are chosen on the train period
+# (best score over a grid) and the strategy is then run with them on the test
+# period, which it has not seen. Train periods either keep a fixed length and
+# roll forward with the windows, or are anchored at the first bar and grow.
+#
+# A test period starts with warm indicators: the tail of its train period is
+# run first as warm-up, without trading, and the metrics only count from the
+# first test bar.
+#
+# The windows run in parallel, on the caller's executor when it has one (the
+# backtest service shares its strategy pool) or else on a pool of their own;
+# each task carries its slices of the OHLCV frame, which is loaded once.
+
+# Grids searched on the train periods when no space is given
+DEFAULT_SPACES = {
+    RsiBollingerBandsStrategy: {
+        'rsi_period': [7, 14, 21],
+        'bb_period': [14, 20, 30],
+        'oversold': [25, 30, 35],
+    },
+    MacdStrategy: {
+        'macd1_period': [8, 12, 16],
+        'macd2_period': [21, 26, 34],
+        'signal_period': [5, 9],
+    },
+    StochasticOscillatorStrategy: {
+        'stoch_period': [9, 14, 21],
+        'stoch_low': [15, 20, 25],
+        'stoch_high': [75, 80, 85],
+    },
+}
+
+def walk_forward_windows(n_bars, train_bars, test_bars, step=None, anchored=False):
+    """[(train_start, test_start, test_end)] bar positions, ends exclusive; train ends where test starts."""
+    step = step or test_bars
+    if train_bars <= 0 or test_bars <= 0:
+        raise ValueError("train_bars and test_bars must be positive.")
+    if step < test_bars:
+        raise ValueError("step must be at least test_bars, so test periods do not overlap.")
+    windows = []
+    test_start = train_bars
+    while test_start + test_bars <= n_bars:
+        windows.append((0 if anchored else test_start - train_bars, test_start, test_start + test_bars))
+        test_start += step
+    if not windows:
+        raise ValueError(f"{n_bars} bars are not enough for one window of {train_bars} + {test_bars} bars.")
+    return windows
+
+
+def _optimize(strategy_class, data, initial_cash, fee, space):
+    # The train search runs vectorized when the strategy has an implementation for it
+    points = grid_space(strategy_class, space)
+    vectorized = strategy_class in VECTORIZED_SIGNALS
+    results = [run_backtest(strategy_class, None, initial_cash, fee, None, None, vectorized=vectorized, data=data, params=params)
+               for params in points]
+    scores = score_results(results)
+    return points[scores.index(max(scores))]
+
+
+def _run_window(task):
+    strategy_class, initial_cash, fee, space, vectorized, train, warmup_bars, test = task
+    params = _optimize(strategy_class, train, initial_cash, fee, space) if space else {}
+    result = run_backtest(strategy_class, None, initial_cash, fee, None, None, vectorized=vectorized, data=test, params=params,
+                          warmup_bars=warmup_bars)
+    result.pop('backtest_id')
+    return dict(
+        train_start=train.index[0].strftime('%Y-%m-%d'),
+        train_end=train.index[-1].strftime('%Y-%m-%d'),
+        test_start=test.index[warmup_bars].strftime('%Y-%m-%d'),
+        test_end=test.index[-1].strftime('%Y-%m-%d'),
+        params=params,
+        **result,
+    )
+
+
+def aggregate(windows):
+    """run_backtest's metrics over the test periods, as if traded one after the other."""
+    sharpes = [window['sharpe_ratio'] for window in windows if window['sharpe_ratio'] is not None]
+    return {
+        'backtest_id': 0,
+        'total_return': float(math.prod(1 + window['total_return'] for window in windows) - 1),
+        'number_of_trades': sum(window['number_of_trades'] for window in windows),
+        'winning_trades': sum(window['winning_trades'] for window in windows),
+        'losing_trades': sum(window['losing_trades'] for window in windows),
+        'max_drawdown': max(window['max_drawdown'] for window in windows),
+        'sharpe_ratio': sum(sharpes) / len(sharpes) if sharpes else None,
+    }
+
+
+def run_walk_forward(strategy_class, symbol, initial_cash, fee, start_date, end_date, train_bars, test_bars, step=None,
+                     anchored=False, space=None, optimize=True, vectorized=False, max_workers=None, data=None,
+                     warmup_bars=None, executor=None):
+    """Walk-forward test of `strategy_class` over the range.
+
+    `space` ({param: [values]}) is searched on every train period, DEFAULT_SPACES
+    for the strategy if not given; with `optimize` off the test periods run with
+    the default parameters (a plain rolling-window test). Each test period is
+    preceded by `warmup_bars` bars of warm-up, `train_bars` if not given.
+    Returns the aggregate in run_backtest's format plus `windows`, each with its
+    dates, the chosen params and its test metrics.
+
+    The windows run on `executor` if given, else on up to `max_workers`
+    processes (WALK_FORWARD_WORKERS, all CPUs by default); one worker runs
+    them in the calling process.
+    """
+    if data is None:
+        data = fetch_data(symbol, start_date, end_date)
+    windows = walk_forward_windows(len(data), train_bars, test_bars, step=step, anchored=anchored)
+    if optimize:
+        space = space or DEFAULT_SPACES.get(strategy_class)
+    else:
+        space = None
+
+    warmup_bars = train_bars if warmup_bars is None else warmup_bars
+    tasks = []
+    for train_start, test_start, test_end in windows:
+        warmup_start = max(0, test_start - warmup_bars)
+        tasks.append((strategy_class, initial_cash, fee, space, vectorized, data.iloc[train_start:test_start],
+                      test_start - warmup_start, data.iloc[warmup_start:test_end]))
+
+    if executor is not None:
+        results = list(executor.map(_run_window, tasks))
+    else:
+        max_workers = min(max_workers or int(os.getenv('WALK_FORWARD_WORKERS', os.cpu_count() or 1)), len(tasks))
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_run_window, tasks))
+        else:
+            results = [_run_window(task) for task in tasks]
+
+    for idx, result in enumerate(results):
+        result['window'] = idx
+    return dict(aggregate(results), windows=results)
+
+
+if __name__ == "__main__":
+    result = run_walk_forward(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-06-20', '2024-06-20', train_bars=365, test_bars=90)
+    for window in result.pop('windows'):
+        print(window)
+    print(result)
@@ -0,0 +1,292 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import json
+from datetime import date, datetime
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from app import db, jwt
+from app.models.backtest import Backtest, Result, LeaderboardEntry
+from app.services.result_cache_service import store_series
+from scripts.backtest_runner import run_backtest, MacdStrategy
+from scripts.result_series import decode
+from scripts.synthetic_data import generate_ohlcv
+from app.services.leaderboard_service import record_results, rebuild_leaderboard
+from app.routes import backtest as backtest_routes
+
+
+def scenario(name, coin='BTC/USD', start_date='2023-01-01', **extra):
+    return dict(name=name, coin=coin, start_date=start_date, end_date='2023-12-31', inital_cash=10000, fee=0.001, **extra)
+
+
+class RoutesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.tmpdir.name}/test.db'
+        self.app.config['JWT_SECRET_KEY'] = 'test-secret-key-of-at-least-32-bytes'
+        db.init_app(self.app)
+        jwt.init_app(self.app)
+        self.app.register_blueprint(backtest_routes.bp)
+        with self.app.app_context():
+            db.create_all()
+            self.headers = {'Authorization': f"Bearer {create_access_token(identity='tester')}"}
+        self.client = self.app.test_client()
+        self.kafka = patch.object(backtest_routes, 'kafka_service').start()
+
+    def tearDown(self):
+        patch.stopall()
+        with self.app.app_context():
+            db.engine.dispose()
+        self.tmpdir.cleanup()
+
+
+class TestBatchSubmission(RoutesTestCase):
+
+    def test_creates_and_deduplicates(self):
+        existing = self.client.post('/backtests', json=scenario('a'), headers=self.headers).get_json()['backtest_id']
+        self.kafka.reset_mock()
+
+        scenarios = [
+            scenario('a'),
+            scenario('b'),
+            scenario('b'),
+            scenario('c', coin=None, coins=['BTC/USD', 'ETH/USD']),
+            scenario('d', walk_forward={'train_bars': 300, 'test_bars': 90}),
+            scenario('e', start_date='2023-02-01'),
+        ]
+        response = self.client.post('/backtests/batch', json=scenarios, headers=self.headers)
+
+        self.assertEqual(response.status_code, 201)
+        results = response.get_json()['backtests']
+        self.assertEqual(results[0], {'backtest_id': existing, 'created': False})
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(len({result['backtest_id'] for result in results}), 5)
+        with self.app.app_context():
+            self.assertEqual(Backtest.query.count(), 5)
+
+        # Every new backtest in one batched produce, keyed by its id
+        self.kafka.produce_batch.assert_called_once()
+        topic, messages = self.kafka.produce_batch.call_args.args
+        self.assertEqual(topic, 'backtest_scenes')
+        created = [result['backtest_id'] for result in results[1:2] + results[3:]]
+        self.assertEqual(messages, [{'backtest_id': backtest_id} for backtest_id in created])
+        self.assertEqual(self.kafka.produce_batch.call_args.kwargs['keys'], [str(backtest_id) for backtest_id in created])
+
+        # Submitting the same batch again creates nothing
+        again = self.client.post('/backtests/batch', json={'backtests': scenarios}, headers=self.headers)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.get_json()['backtests'], [dict(result, created=False) for result in results])
+
+    def test_cash_and_fee_are_part_of_the_scenario(self):
+        ids = set()
+        for changes in ({}, {'inital_cash': 5000}, {'fee': 0.002}):
+            response = self.client.post('/backtests', json=dict(scenario('a'), **changes), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            ids.add(response.get_json()['backtest_id'])
+        self.assertEqual(len(ids), 3)
+        response = self.client.post('/backtests', json=dict(scenario('a'), fee=0.002), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_values_are_parsed_before_matching(self):
+        existing = self.client.post('/backtests', json=scenario('a'), headers=self.headers).get_json()['backtest_id']
+        # The same scenario with its numbers as strings and a basic format date
+        same = dict(scenario('a'), inital_cash='10000', fee='0.001', end_date='20231231')
+        response = self.client.post('/backtests/batch', json=[same, dict(same, inital_cash=10000.0)], headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['backtests'], [{'backtest_id': existing, 'created': False}] * 2)
+        with self.app.app_context():
+            self.assertEqual(Backtest.query.count(), 1)
+
+        response = self.client.post('/backtests/batch', json=[dict(same, inital_cash='ten')], headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('inital_cash', response.get_json()['msg'])
+
+    def test_invalid_scenario_rejects_batch(self):
+        scenarios = [scenario('a'), scenario('b', walk_forward={'train_bars': 300})]
+        response = self.client.post('/backtests/batch', json=scenarios, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Backtest 1', response.get_json()['msg'])
+        with self.app.app_context():
+            self.assertEqual(Backtest.query.count(), 0)
+        self.kafka.produce_batch.assert_not_called()
+
+        with patch.dict('os.environ', {'BACKTEST_BATCH_MAX': '1'}):
+            response = self.client.post('/backtests/batch', json=[scenario('a'), scenario('b')], headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestListing(RoutesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            for idx in range(25):
+                db.session.add(Backtest(name=f'bt{idx}', symbol='BTC/USD' if idx % 2 else 'ETH/USD',
+                                        start_date=date(2023, 1, 1 + idx), end_date=date(2023, 12, 31),
+                                        inital_cash=10000, fee=0.001, created_at=datetime(2024, 1, 1 + idx)))
+            db.session.flush()
+            # Backtests 1-10 have run; the best of their strategies is the one with the highest return
+            for backtest_id in range(1, 11):
+                for strategy, total_return in (('RsiBollingerBandsStrategy', 0.1), ('MacdStrategy', 0.2 + backtest_id / 100)):
+                    db.session.add(Result(backtest_id=backtest_id, strategy=strategy, total_return=total_return,
+                                          number_of_trades=3, winning_trades=2, losing_trades=1, max_drawdown=5,
+                                          sharpe_ratio=None, is_best=strategy == 'MacdStrategy'))
+            db.session.commit()
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_keyset_pages(self):
+        ids, after = [], None
+        while True:
+            page = self.get('/backtests?limit=10' + (f'&after={after}' if after else '')).get_json()
+            self.assertLessEqual(len(page['backtests']), 10)
+            ids += [backtest['id'] for backtest in page['backtests']]
+            after = page['next']
+            if after is None:
+                break
+        self.assertEqual(ids, list(range(1, 26)))
+
+        page = self.get('/backtests').get_json()
+        self.assertEqual(len(page['backtests']), 25)
+        self.assertIsNone(page['next'])
+        self.assertEqual(page['backtests'][0]['created_at'], '2024-01-01 00:00:00')
+
+    def test_filters(self):
+        backtests = self.get('/backtests?symbol=BTC/USD&start_date=2023-01-05&created_before=2024-01-20').get_json()['backtests']
+        self.assertEqual([backtest['id'] for backtest in backtests], [6, 8, 10, 12, 14, 16, 18])
+        response = self.client.get('/backtests?start_date=01/05/2023', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_export(self):
+        response = self.get('/backtests?format=ndjson&symbol=ETH/USD')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(range(1, 26, 2)))
+
+        response = self.client.get('/backtests?after=20', headers=dict(self.headers, Accept='application/x-ndjson'))
+        self.assertEqual([json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()], [21, 22, 23, 24, 25])
+
+    def test_best_results(self):
+        backtests = self.get('/backtests/best?limit=12').get_json()['backtests']
+        self.assertEqual([backtest['id'] for backtest in backtests], list(range(1, 13)))
+        for backtest in backtests[:10]:
+            self.assertEqual(backtest['best_result']['strategy'], 'MacdStrategy')
+            self.assertAlmostEqual(backtest['best_result']['total_return'], 0.2 + backtest['id'] / 100)
+            self.assertIsNone(backtest['best_result']['sharpe_ratio'])
+        self.assertIsNone(backtests[10]['best_result'])
+
+    def test_results(self):
+        results = self.get('/backtests/3/results').get_json()['results']
+        self.assertEqual([result['strategy'] for result in results], ['RsiBollingerBandsStrategy', 'MacdStrategy'])
+        self.assertEqual(self.client.get('/backtests/20/results', headers=self.headers).status_code, 404)
+
+
+class TestLeaderboard(RoutesTestCase):
+
+    def run_backtest(self, symbol, returns, best, start_date=date(2023, 1, 1), walk_forward=None):
+        # Stores a finished backtest as run_and_evaluate_backtest does
+        backtest = Backtest(name='bt', symbol=symbol, start_date=start_date, end_date=date(2023, 12, 31),
+                            inital_cash=10000, fee=0.001, walk_forward=walk_forward)
+        db.session.add(backtest)
+        db.session.flush()
+        results = [Result(backtest_id=backtest.id, strategy=strategy, total_return=total_return, number_of_trades=4,
+                          winning_trades=2, losing_trades=2, max_drawdown=10, sharpe_ratio=1.5, is_best=strategy == best)
+                   for strategy, total_return in returns.items()]
+        db.session.add_all(results)
+        db.session.flush()
+        if not walk_forward:
+            record_results(symbol, start_date, backtest.end_date, results)
+        db.session.commit()
+        return backtest.id
+
+    def entries(self):
+        return {(entry.symbol, entry.start_date, entry.strategy): (entry.runs, entry.wins, entry.backtest_id, float(entry.total_return))
+                for entry in LeaderboardEntry.query.all()}
+
+    def test_incremental_and_rebuild(self):
+        with self.app.app_context():
+            first = self.run_backtest('BTC/USD', {'Macd': 0.25, 'Rsi': 0.5}, best='Rsi')
+            second = self.run_backtest('BTC/USD', {'Macd': 0.75, 'Rsi': 0.5}, best='Macd')
+            third = self.run_backtest('BTC/USD', {'Macd': 0.5}, best='Macd', start_date=date(2023, 6, 1))
+            self.run_backtest('BTC/USD', {'Macd': 2.0}, best='Macd', walk_forward='{"test_bars": 30, "train_bars": 90}')
+            expected = {
+                ('BTC/USD', date(2023, 1, 1), 'Macd'): (2, 1, second, 0.75),
+                # A tie keeps the earlier result
+                ('BTC/USD', date(2023, 1, 1), 'Rsi'): (2, 1, first, 0.5),
+                ('BTC/USD', date(2023, 6, 1), 'Macd'): (1, 1, third, 0.5),
+            }
+            self.assertEqual(self.entries(), expected)
+
+            self.assertEqual(rebuild_leaderboard(chunk_size=2), 3)
+            self.assertEqual(self.entries(), expected)
+
+    def test_api(self):
+        with self.app.app_context():
+            self.run_backtest('BTC/USD', {'Macd': 0.25, 'Rsi': 0.5}, best='Rsi')
+            self.run_backtest('ETH/USD', {'Macd': 0.75, 'Rsi': 0.1}, best='Macd')
+
+        response = self.client.get('/leaderboard', headers=self.headers)
+        leaderboard = response.get_json()['leaderboard']
+        self.assertEqual([(entry['symbol'], entry['strategy']) for entry in leaderboard],
+                         [('ETH/USD', 'Macd'), ('BTC/USD', 'Rsi'), ('BTC/USD', 'Macd'), ('ETH/USD', 'Rsi')])
+        self.assertEqual(leaderboard[0]['start_date'], '2023-01-01')
+
+        response = self.client.get('/leaderboard?symbol=BTC/USD&order_by=wins&limit=1', headers=self.headers)
+        self.assertEqual([entry['strategy'] for entry in response.get_json()['leaderboard']], ['Rsi'])
+        response = self.client.get('/leaderboard?order_by=name', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestResultSeries(RoutesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        data = generate_ohlcv(3000, seed=2)
+        self.result = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data, series=True)
+        with self.app.app_context():
+            backtest = Backtest(name='bt', symbol='BTC/USD', start_date=date(2023, 1, 1), end_date=date(2023, 12, 31))
+            db.session.add(backtest)
+            db.session.flush()
+            db.session.add(Result(backtest_id=backtest.id, strategy='MacdStrategy', fingerprint='f' * 64))
+            db.session.add(Result(backtest_id=backtest.id, strategy='RsiBollingerBandsStrategy', fingerprint='r' * 64))
+            store_series([('f' * 64, self.result['series'])])
+            db.session.commit()
+
+    def test_equity(self):
+        response = self.client.get('/results/1/equity?points=200', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        curve = response.get_json()
+        self.assertEqual(curve['bars'], 3000)
+        self.assertEqual(len(curve['date']), 200)
+        self.assertAlmostEqual(curve['equity'][-1], self.result['series']['equity'][-1], delta=0.01)
+        self.assertAlmostEqual(max(curve['drawdown']), self.result['max_drawdown'], places=4)
+        self.assertEqual(len(self.client.get('/results/1/equity?points=0', headers=self.headers).get_json()['date']), 3000)
+
+        response = self.client.get('/results/1/equity?format=arrow', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/vnd.apache.arrow.stream')
+        self.assertEqual(decode(response.get_data()).column_names, ['date', 'equity', 'drawdown'])
+
+        # No series recorded for this result, and no such result
+        self.assertEqual(self.client.get('/results/2/equity', headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.get('/results/3/equity', headers=self.headers).status_code, 404)
+
+    def test_trades(self):
+        trades = self.client.get('/results/1/trades', headers=self.headers).get_json()['trades']
+        self.assertEqual(len(trades), self.result['number_of_trades'])
+        self.assertEqual(sum(trade['pnlcomm'] > 0 for trade in trades), self.result['winning_trades'])
+        self.assertLess(trades[0]['open_date'], trades[0]['close_date'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,7 @@ class TestBacktestService(unittest.TestCase):
     @patch('scripts.backtest_runner.create_engine')
     @patch('scripts.backtest_runner.pd.read_sql')
     def test_fetch_data(self, mock_read_sql, mock_create_engine):
-        with patch.dict('os.environ', {'PG_HOST': 'localhost', 'PG_PORT': '5432', 'PG_DATABASE': 'test_db', 'PG_USER': 'user', 'PG_PASSWORD': 'password'}):
+        with patch.dict('os.environ', {'PG_HOST': 'localhost', 'PG_PORT': '5432', 'PG_DATABASE': 'test_db', 'PG_USER': 'user', 'PG_PASSWORD': 'password', 'OHLCV_LAYOUT': 'per_symbol'}):
             mock_engine = MagicMock()
             mock_create_engine.return_value = mock_engine
 
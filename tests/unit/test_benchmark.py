@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import json
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts import backtest_runner
+    from scripts.benchmark import benchmark_size, compare, main, run_benchmarks, STRATEGIES
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_stages(self):
+        engine = backtest_runner._engine
+        with tempfile.TemporaryDirectory() as workdir:
+            stages = benchmark_size(300, workdir, repeat=1, memory=False)
+        self.assertEqual(list(stages), ['fetch_data', 'normalize', 'feed']
+                         + [f'cerebro.run[{strategy.__name__}]' for strategy in STRATEGIES]
+                         + ['analyzers', 'score_backtest', 'worker'])
+        for stage, result in stages.items():
+            self.assertGreater(result['seconds'], 0, stage)
+        self.assertAlmostEqual(stages['feed']['bars_per_sec'], 300 / stages['feed']['seconds'])
+        self.assertIsNone(stages['score_backtest']['bars_per_sec'])
+        # The runner's engine is given back
+        self.assertIs(backtest_runner._engine, engine)
+
+    def test_data_stages_only_and_memory(self):
+        report = run_benchmarks([400], repeat=1, max_run_bars=100)
+        stages = report['results']['400']
+        self.assertEqual(list(stages), ['fetch_data', 'normalize', 'feed'])
+        self.assertTrue(all(result['peak_mb'] > 0 for result in stages.values()))
+        self.assertNotIn('FRAME_CACHE_MAX_BYTES', os.environ)
+
+    def test_regressions(self):
+        baseline = {'results': {'1000': {'feed': {'seconds': 0.1}, 'normalize': {'seconds': 0.0001}}}}
+        report = {'results': {'1000': {'feed': {'seconds': 0.2}, 'normalize': {'seconds': 0.0005}, 'fetch_data': {'seconds': 1.0}}}}
+        # normalize is slower too, but by less than the noise floor; fetch_data has no baseline
+        self.assertEqual(compare(report, baseline), [(1000, 'feed', 0.2, 0.1)])
+        self.assertEqual(compare(report, baseline, tolerance=1.5), [])
+
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'baseline.json')
+            args = ['--sizes', '300', '--repeat', '1', '--no-memory', '--max-run-bars', '0']
+            self.assertEqual(main(args + ['--save-baseline', path]), 0)
+            with open(path) as f:
+                saved = json.load(f)
+            self.assertEqual(list(saved['results']['300']), ['fetch_data', 'normalize', 'feed'])
+
+            for result in saved['results']['300'].values():
+                result['seconds'] /= 1000
+            with open(path, 'w') as f:
+                json.dump(saved, f)
+            self.assertEqual(main(args + ['--baseline', path]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import pandas as pd
+from sqlalchemy import create_engine, text
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.data_ingestion import CsvSource, ingest, ingest_symbol
+    from scripts.ohlcv_db import ensure_timestamp_index
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestDataIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'ohlcv.db')}")
+        self.source = CsvSource(self.tmpdir.name)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def write_source(self, symbol, periods):
+        ohlcv = generate_ohlcv(periods, start='2023-01-01').reset_index().rename(columns={'date': 'Date'})
+        ohlcv.to_csv(os.path.join(self.tmpdir.name, f'{symbol}.csv'), index=False)
+        return ohlcv
+
+    def stored(self, table):
+        with self.engine.connect() as conn:
+            return conn.execute(text(f'SELECT count(*), count(DISTINCT timestamp), max(close) FROM "{table}"')).one()
+
+    def test_incremental_ingestion(self):
+        self.write_source('BTC-USD', 30)
+        self.assertEqual(ingest_symbol('BTC-USD', self.source, '2020-06-20', engine=self.engine), 30)
+
+        # Re-running only re-reads the last stored bar
+        self.assertEqual(ingest_symbol('BTC-USD', self.source, '2020-06-20', engine=self.engine), 1)
+
+        ohlcv = self.write_source('BTC-USD', 40)
+        self.assertEqual(ingest_symbol('BTC-USD', self.source, '2020-06-20', engine=self.engine), 11)
+        count, distinct, max_close = self.stored('ohlcv_BTC_USD')
+        self.assertEqual((count, distinct), (40, 40))
+        self.assertAlmostEqual(max_close, ohlcv['Close'].max())
+
+    def test_full_refresh_is_idempotent(self):
+        self.write_source('ETH-USD', 25)
+        for _ in range(2):
+            stored = ingest(['ETH-USD', 'XRP-USD'], self.source, '2020-06-20', engine=self.engine, incremental=False)
+        self.assertEqual(stored, {'ETH-USD': 25, 'XRP-USD': 0})
+        self.assertEqual(self.stored('ohlcv_ETH_USD')[:2], (25, 25))
+
+    def test_collapses_duplicates_from_append_only_ingestion(self):
+        ohlcv = generate_ohlcv(10, start='2023-01-01').reset_index()
+        ohlcv.columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+        pd.concat([ohlcv, ohlcv]).to_sql('ohlcv_SOL_USD', con=self.engine, index=False)
+
+        ensure_timestamp_index(self.engine, 'ohlcv_SOL_USD')
+        self.assertEqual(self.stored('ohlcv_SOL_USD')[:2], (10, 10))
+
+if __name__ == '__main__':
+    unittest.main()
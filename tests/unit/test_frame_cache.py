@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+import time
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import fetch_data
+    from scripts.frame_cache import FrameCache, get_frame_cache
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def test_lru_eviction_by_size(self):
+        frame = generate_ohlcv(100)
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        cache = FrameCache(max_bytes=2 * size)
+
+        cache.put('a', frame)
+        cache.put('b', frame.copy())
+        self.assertIs(cache.get('a'), frame)
+        cache.put('c', frame.copy())
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'evictions': 1, 'expirations': 0, 'entries': 2,
+                                         'bytes': 2 * size, 'max_bytes': 2 * size})
+
+    def test_oversized_frame_is_not_cached(self):
+        cache = FrameCache(max_bytes=1024)
+        cache.put('a', generate_ohlcv(1000))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.current_bytes, 0)
+
+    @patch('scripts.backtest_runner.query_ohlcv')
+    def test_fetch_data_reuses_frames(self, mock_query_ohlcv):
+        mock_query_ohlcv.return_value = generate_ohlcv(50, start='2022-01-01')
+        get_frame_cache().clear()
+
+        first = fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+        second = fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+        fetch_data('BTC/USD', '2022-01-02', '2022-02-19')
+
+        self.assertIs(first, second)
+        self.assertEqual(mock_query_ohlcv.call_count, 2)
+
+        # Hits and misses are reported with the cache's stats
+        with self.assertLogs(level='DEBUG') as logs:
+            fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Frame cache hit', logs.output[0])
+        self.assertIn(str(get_frame_cache().stats()), logs.output[0])
+
+    @patch('scripts.backtest_runner.query_ohlcv')
+    def test_frames_expire(self, mock_query_ohlcv):
+        # Bars ingested or revised after a frame was loaded are read once its ttl is over
+        mock_query_ohlcv.return_value = generate_ohlcv(50, start='2022-01-01')
+        with patch.dict('os.environ', {'FRAME_CACHE_TTL': '0.1'}):
+            get_frame_cache().clear()
+            first = fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+            revised = generate_ohlcv(50, start='2022-01-01', seed=1)
+            mock_query_ohlcv.return_value = revised
+            self.assertIs(fetch_data('BTC/USD', '2022-01-01', '2022-02-19'), first)
+            time.sleep(0.15)
+            self.assertIs(fetch_data('BTC/USD', '2022-01-01', '2022-02-19'), revised)
+            self.assertEqual(get_frame_cache().stats()['expirations'], 1)
+            self.assertEqual(get_frame_cache().current_bytes, int(revised.memory_usage(index=True, deep=True).sum()))
+        self.assertEqual(mock_query_ohlcv.call_count, 2)
+        get_frame_cache().clear()
+
+    @patch('scripts.backtest_runner.query_ohlcv')
+    def test_disabled(self, mock_query_ohlcv):
+        mock_query_ohlcv.return_value = generate_ohlcv(50, start='2022-01-01')
+        with patch.dict('os.environ', {'FRAME_CACHE_MAX_BYTES': '0'}):
+            self.assertIsNone(get_frame_cache())
+            fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+            fetch_data('BTC/USD', '2022-01-01', '2022-02-19')
+        self.assertEqual(mock_query_ohlcv.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
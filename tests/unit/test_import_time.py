@@ -0,0 +1,55 @@
+import unittest
+import subprocess
+import json
+import os
+import sys
+
+root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cold-start budgets in seconds, generous enough for a loaded CI machine
+BUDGETS = {
+    'app': float(os.getenv('IMPORT_BUDGET_APP', '2.0')),
+    'scripts.backtest_runner': float(os.getenv('IMPORT_BUDGET_BACKTEST_RUNNER', '3.0')),
+}
+
+# Imports the module in a fresh interpreter where any network connection fails,
+# and reports the import time and which heavy modules it pulled in.
+PROBE = """
+import json, socket, sys, time
+def refuse(*args, **kwargs):
+    raise AssertionError('network access during import')
+socket.socket.connect = refuse
+socket.create_connection = refuse
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def probe(module):
+    env = {key: value for key, value in os.environ.items() if not key.startswith('PG_')}
+    runs = []
+    for _ in range(3):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], cwd=root_path, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run['seconds'])
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_app_import(self):
+        result = probe('app')
+        self.assertLess(result['seconds'], BUDGETS['app'])
+        # The web process builds neither the backtest stack nor tracking clients
+        for heavy in ('mlflow', 'backtrader', 'pandas', 'flask_migrate'):
+            self.assertNotIn(heavy, result['modules'])
+
+    def test_backtest_runner_import(self):
+        # Works without database settings: the engine is built on first query
+        result = probe('scripts.backtest_runner')
+        self.assertLess(result['seconds'], BUDGETS['scripts.backtest_runner'])
+        self.assertNotIn('psycopg2', result['modules'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import numpy as np
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.indicator_store import IndicatorStore, INDICATORS, compute
+    from scripts.synthetic_data import generate_ohlcv
+
+PARAMS = {
+    'rsi': {'period': 14},
+    'bollinger_bands': {'period': 20, 'devfactor': 2.0},
+    'macd_histogram': {'period_me1': 12, 'period_me2': 26, 'period_signal': 9},
+    'stochastic': {'period': 14},
+}
+
+
+class TestIndicatorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = IndicatorStore(self.tmpdir.name)
+        self.data = generate_ohlcv(500, start='2023-01-01')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertSameLines(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for expected_line, actual_line in zip(expected, actual):
+            self.assertTrue(np.array_equal(expected_line, actual_line, equal_nan=True))
+
+    def test_read_through(self):
+        for name in INDICATORS:
+            with self.subTest(name=name):
+                expected = compute(self.data, name, PARAMS[name])
+                self.assertSameLines(expected, self.store.series('BTC/USD', name, PARAMS[name], self.data))
+                self.assertSameLines(expected, self.store.series('BTC/USD', name, PARAMS[name], self.data))
+        self.assertEqual(self.store.misses, len(INDICATORS))
+        self.assertEqual(self.store.hits, len(INDICATORS))
+
+    def test_extends_with_new_bars(self):
+        for name in INDICATORS:
+            with self.subTest(name=name):
+                self.store.series('BTC/USD', name, PARAMS[name], self.data.iloc[:300])
+                lines = self.store.series('BTC/USD', name, PARAMS[name], self.data)
+                self.assertSameLines(compute(self.data, name, PARAMS[name]), lines)
+                # A shorter range is then read from the extended series
+                lines = self.store.series('BTC/USD', name, PARAMS[name], self.data.iloc[:400])
+                self.assertSameLines(compute(self.data.iloc[:400], name, PARAMS[name]), lines)
+        self.assertEqual(self.store.extends, len(INDICATORS))
+        self.assertEqual(self.store.misses, len(INDICATORS))
+
+    def test_revised_bar_recomputes(self):
+        revised = self.data.copy()
+        revised.iloc[-1, revised.columns.get_loc('Close')] += 5.0
+        revised.iloc[-1, revised.columns.get_loc('High')] += 5.0
+        for name in INDICATORS:
+            with self.subTest(name=name):
+                self.store.series('BTC/USD', name, PARAMS[name], self.data)
+                self.assertSameLines(compute(revised, name, PARAMS[name]), self.store.series('BTC/USD', name, PARAMS[name], revised))
+                # Later bars build on the revised one
+                more = generate_ohlcv(520, start='2023-01-01')
+                more.iloc[:500] = revised
+                self.assertSameLines(compute(more, name, PARAMS[name]), self.store.series('BTC/USD', name, PARAMS[name], more))
+        self.assertEqual(self.store.misses, 2 * len(INDICATORS))
+        self.assertEqual(self.store.extends, len(INDICATORS))
+
+    def test_later_start(self):
+        for name in INDICATORS:
+            self.store.series('BTC/USD', name, PARAMS[name], self.data)
+        later = self.data.iloc[120:]
+        for name in INDICATORS:
+            with self.subTest(name=name):
+                self.assertSameLines(compute(later, name, PARAMS[name]), self.store.series('BTC/USD', name, PARAMS[name], later))
+        # Smoothed indicators depend on their first bar and get their own series
+        self.assertEqual(self.store.misses, len(INDICATORS) + 2)
+        self.assertEqual(self.store.hits, 2)
+
+    def test_keyed_by_symbol_and_params(self):
+        self.store.series('BTC/USD', 'rsi', {'period': 14}, self.data)
+        other = generate_ohlcv(500, start='2023-01-01', seed=1)
+        self.assertSameLines(compute(other, 'rsi', {'period': 14}), self.store.series('ETH/USD', 'rsi', {'period': 14}, other))
+        self.assertSameLines(compute(self.data, 'rsi', {'period': 7}), self.store.series('BTC/USD', 'rsi', {'period': 7}, self.data))
+        self.assertEqual(self.store.misses, 3)
+
+        self.store.invalidate('BTC/USD')
+        self.store.series('BTC/USD', 'rsi', {'period': 14}, self.data)
+        self.store.series('ETH/USD', 'rsi', {'period': 14}, other)
+        self.assertEqual(self.store.misses, 4)
+
+    def test_backtests_read_from_store(self):
+        data = generate_ohlcv(600, seed=2)
+        with patch.dict('os.environ', {'INDICATOR_STORE_DIR': ''}):
+            expected = {(strategy, vectorized): run_backtest(strategy, 'ETH/USD', 10000, 0.001, None, None, data=data, vectorized=vectorized)
+                        for strategy in (RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy)
+                        for vectorized in (False, True)}
+        with patch.dict('os.environ', {'INDICATOR_STORE_DIR': self.tmpdir.name}):
+            for (strategy, vectorized), result in expected.items():
+                with self.subTest(strategy=strategy.__name__, vectorized=vectorized):
+                    self.assertEqual(result, run_backtest(strategy, 'ETH/USD', 10000, 0.001, None, None, data=data, vectorized=vectorized))
+        self.assertTrue(any(name.endswith('.arrow') for name in os.listdir(self.tmpdir.name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import json
+import math
+import os
+import sys
+import backtrader as bt
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from scripts import indicators
+from scripts.synthetic_data import generate_ohlcv
+
+
+class RecordIndicators(bt.Strategy):
+    def __init__(self):
+        self.rsi = bt.indicators.RelativeStrengthIndex(period=14)
+        self.bbands = bt.indicators.BollingerBands(period=20, devfactor=2.0)
+        self.macd = bt.indicators.MACDHisto(period_me1=12, period_me2=26, period_signal=9)
+        self.stoch = bt.indicators.Stochastic(period=14)
+        self.rows = []
+
+    def next(self):
+        self.rows.append([self.rsi[0], self.bbands.mid[0], self.bbands.top[0], self.bbands.bot[0],
+                          self.macd.histo[0], self.stoch.percK[0], self.stoch.percD[0]])
+
+
+def batch_rows(data):
+    high, low, close = (data[column].to_numpy(dtype=float) for column in ('High', 'Low', 'Close'))
+    return np.column_stack([
+        indicators.rsi(close, 14),
+        *indicators.bollinger_bands(close, 20, 2.0),
+        indicators.macd_histogram(close, 12, 26, 9),
+        *indicators.stochastic(high, low, close, 14),
+    ])
+
+
+def online_indicators():
+    return [indicators.RSI(14), indicators.BollingerBands(20, 2.0), indicators.MACDHistogram(12, 26, 9),
+            indicators.Stochastic(14)]
+
+
+def online_rows(data, online=None):
+    rsi, bbands, macd, stoch = online or online_indicators()
+    rows = []
+    for high, low, close in data[['High', 'Low', 'Close']].itertuples(index=False):
+        rows.append([rsi.update(close), *bbands.update(close), macd.update(close), *stoch.update(high, low, close)])
+    return np.array(rows)
+
+
+class TestIndicators(unittest.TestCase):
+
+    def test_batch_matches_backtrader(self):
+        for seed in range(3):
+            data = generate_ohlcv(600, seed=seed)
+            for runonce in (True, False):
+                with self.subTest(seed=seed, runonce=runonce):
+                    cerebro = bt.Cerebro(stdstats=False, runonce=runonce)
+                    cerebro.adddata(bt.feeds.PandasData(dataname=data))
+                    cerebro.addstrategy(RecordIndicators)
+                    expected = np.array(cerebro.run()[0].rows)
+                    # next() starts once every indicator has warmed up
+                    actual = batch_rows(data)[-len(expected):]
+                    self.assertTrue(np.array_equal(expected, actual))
+
+    def test_online_matches_batch(self):
+        data = generate_ohlcv(600, seed=4)
+        expected = batch_rows(data)
+        actual = online_rows(data)
+        self.assertTrue(np.isnan(actual[0]).all())
+        self.assertTrue(np.array_equal(expected, actual, equal_nan=True))
+
+    def test_snapshot_and_restore(self):
+        data = generate_ohlcv(300, seed=5)
+        expected = online_rows(data)
+
+        online = online_indicators()
+        online_rows(data.iloc[:150], online)
+        # Through JSON, as a restarted process would read it back
+        states = json.loads(json.dumps([indicator.snapshot() for indicator in online]))
+        restored = [indicator.restore(state) for indicator, state in zip(online_indicators(), states)]
+        self.assertTrue(np.array_equal(expected[150:], online_rows(data.iloc[150:], restored), equal_nan=True))
+        # Only the windows are kept, not the history nor the running totals
+        self.assertLessEqual(len(states[3]['highs']), 14)
+        self.assertNotIn('highest', states[3])
+        self.assertNotIn('total', states[1]['mean'])
+
+    def test_window_sums_match_fsum(self):
+        rng = np.random.default_rng(0)
+        series = [
+            rng.random(1000) * 100 + 100,
+            (np.exp(rng.normal(size=1000) * 0.05).cumprod() * 3000) ** 2,
+            rng.normal(size=1000) * 1e-3,
+            np.array([1.0, np.nan, 2.0, 3.0, 4.0]),
+            rng.random(50) * 1e-310,
+        ]
+        for values in series:
+            for period in (1, 3, 5):
+                with self.subTest(first=values[0], period=period):
+                    expected = [math.fsum(window) for window in sliding_window_view(values, period).tolist()]
+                    self.assertTrue(np.array_equal(expected, indicators.window_sums(values, period), equal_nan=True))
+
+    def test_online_sma_matches_fsum(self):
+        rng = np.random.default_rng(1)
+        values = np.concatenate([
+            rng.random(200) * 100 + 100,
+            rng.normal(size=200) * 1e300,
+            rng.random(100) * 1e-310,
+            [1.0, np.nan, 2.0, np.inf, 3.0, np.inf, 4.0, 5.0, 6.0, 7.0, 8.0],
+            rng.normal(size=200) * 1e-3,
+        ])
+        for period in (1, 3, 20, 60, 200):
+            with self.subTest(period=period):
+                sma = indicators.SMA(period)
+                actual = [sma.update(value) for value in values.tolist()]
+                expected = [math.fsum(window) / period for window in sliding_window_view(values, period).tolist()]
+                self.assertTrue(np.array_equal(expected, actual[period - 1:], equal_nan=True))
+                # Restored halfway, the running sum is rebuilt from the window
+                halfway = indicators.SMA(period).restore({'window': values[:500].tolist()})
+                restored = indicators.SMA(period).restore(json.loads(json.dumps(halfway.snapshot())))
+                self.assertTrue(np.array_equal(actual[500:], [restored.update(value) for value in values[500:].tolist()],
+                                               equal_nan=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
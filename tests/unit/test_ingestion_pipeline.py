@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, text
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts import ingestion_pipeline
+    from scripts.ingestion_pipeline import TokenBucket, run_pipeline
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class FakeSource:
+    def __init__(self, periods=30, latency=0.1, failing=()):
+        self.periods = periods
+        self.latency = latency
+        self.failing = failing
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, symbol, since):
+        with self._lock:
+            self.calls.append((symbol, since))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.latency)
+        with self._lock:
+            self.active -= 1
+        if symbol in self.failing:
+            raise ConnectionError('rate limited')
+        return generate_ohlcv(self.periods, seed=len(symbol), start='2023-01-01').reset_index().rename(columns={'date': 'Date'})
+
+
+class TestIngestionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'ohlcv.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+    def test_fetches_concurrently(self):
+        symbols = [f'C{i}-USD' for i in range(8)]
+        source = FakeSource(latency=0.2)
+        start = time.monotonic()
+        stored, errors = run_pipeline(symbols, source, '2020-06-20', engine=self.engine, fetch_workers=8, rate=100, burst=8)
+
+        self.assertLess(time.monotonic() - start, 8 * 0.2)
+        self.assertGreater(source.max_active, 1)
+        self.assertEqual(errors, {})
+        self.assertEqual(stored, {symbol: 30 for symbol in symbols})
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT count(*) FROM "ohlcv_C7_USD"')).scalar(), 30)
+
+    def test_incremental_and_failures(self):
+        run_pipeline(['BTC-USD'], FakeSource(latency=0), '2020-06-20', engine=self.engine, rate=100)
+        source = FakeSource(latency=0, failing=('ETH-USD',))
+        stored, errors = run_pipeline(['BTC-USD', 'ETH-USD'], source, '2020-06-20', engine=self.engine, rate=100, batch_rows=1)
+
+        self.assertIn(('BTC-USD', '2023-01-30'), source.calls)
+        self.assertEqual(list(errors), ['ETH-USD'])
+        self.assertEqual(stored, {'BTC-USD': 30})
+
+    def run_in_thread(self, *args, **kwargs):
+        outcome = []
+        runner = threading.Thread(target=lambda: outcome.append(run_pipeline(*args, **kwargs)), daemon=True)
+        runner.start()
+        runner.join(10)
+        self.assertFalse(runner.is_alive(), 'pipeline hung')
+        return outcome[0]
+
+    def test_storage_failure_does_not_hang(self):
+        symbols = [f'C{i}-USD' for i in range(6)]
+        ensure_symbol_storage = ingestion_pipeline.ensure_symbol_storage
+
+        def failing_storage(engine, symbol):
+            if symbol == 'C0-USD':
+                raise RuntimeError('permission denied')
+            ensure_symbol_storage(engine, symbol)
+
+        with patch.object(ingestion_pipeline, 'ensure_symbol_storage', side_effect=failing_storage):
+            stored, errors = self.run_in_thread(symbols, FakeSource(latency=0.05), '2020-06-20', engine=self.engine, rate=100,
+                                                queue_size=1, batch_rows=1)
+        self.assertEqual(errors, {'C0-USD': 'permission denied'})
+        self.assertEqual(stored, {symbol: 30 for symbol in symbols[1:]})
+
+    def test_failed_batch_is_not_stored(self):
+        store_ohlcv = ingestion_pipeline.store_ohlcv
+
+        def failing_store(engine, symbol, df, conn=None):
+            if symbol == 'ETH-USD':
+                raise RuntimeError('disk full')
+            return store_ohlcv(engine, symbol, df, conn=conn)
+
+        with patch.object(ingestion_pipeline, 'store_ohlcv', side_effect=failing_store):
+            # Both symbols share one transaction, which is rolled back
+            stored, errors = self.run_in_thread(['BTC-USD', 'ETH-USD'], FakeSource(latency=0), '2020-06-20', engine=self.engine,
+                                                rate=100, batch_rows=10000)
+        self.assertEqual(errors, {'BTC-USD': 'disk full', 'ETH-USD': 'disk full'})
+        self.assertEqual(stored, {})
+
+if __name__ == '__main__':
+    unittest.main()
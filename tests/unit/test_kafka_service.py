@@ -0,0 +1,192 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import tempfile
+import threading
+import time
+import json
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from confluent_kafka import KafkaError, KafkaException
+from app.services import kafka_service as kafka_module
+from app.services.kafka_service import KafkaService
+from app.services.consumer_pool import ConsumerPool
+
+
+class FakeMessage:
+    def __init__(self, value, offset=0, topic='backtest_scenes', partition=0):
+        self._value = value
+        self._offset = offset
+        self._topic = topic
+        self._partition = partition
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class FakeProducer:
+    """Keeps produced messages; delivery reports are served on flush(), failing with `error` if set."""
+
+    def __init__(self, config):
+        self.error = None
+        self.messages = []
+        self._pending = []
+
+    def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+        message = FakeMessage(value, topic=topic)
+        self._pending.append((on_delivery, message))
+
+    def poll(self, timeout=0):
+        threading.Event().wait(timeout)
+        return 0
+
+    def flush(self, timeout=None):
+        pending, self._pending = self._pending, []
+        for on_delivery, message in pending:
+            if self.error is None:
+                self.messages.append(message)
+            on_delivery(self.error, message)
+        return 0
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class KafkaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.consumer = MagicMock()
+        patch.object(kafka_module, 'Consumer', return_value=self.consumer).start()
+        patch.object(kafka_module, 'Producer', FakeProducer).start()
+        patch.object(kafka_module, 'AdminClient').start()
+        self.service = KafkaService('localhost:9092')
+        self.commits = []
+        self.consumer.commit.side_effect = lambda message, asynchronous: self.commits.append(message.offset())
+
+    def tearDown(self):
+        self.service.close()
+        patch.stopall()
+
+    def consume(self, messages, callback, retries=2):
+        stop = threading.Event()
+        pending = list(messages)
+
+        def poll(timeout):
+            if pending:
+                return pending.pop(0)
+            stop.set()
+            return None
+
+        self.consumer.poll.side_effect = poll
+        with patch.object(kafka_module.time, 'sleep'):
+            self.service.consume('backtest_scenes', callback, stop=stop, retries=retries)
+
+
+class TestKafkaService(KafkaTestCase):
+
+    def test_commits_after_success(self):
+        handled = []
+
+        def callback(message):
+            # Nothing is committed while the message is in hand
+            self.assertEqual(len(self.commits), len(handled))
+            handled.append(message['backtest_id'])
+
+        self.consume([FakeMessage(json.dumps({'backtest_id': idx}), offset=idx) for idx in range(3)], callback)
+        self.assertEqual(handled, [0, 1, 2])
+        self.assertEqual(self.commits, [0, 1, 2])
+        self.assertEqual(self.service.producer.messages, [])
+
+    def test_retries_before_commit(self):
+        attempts = []
+
+        def callback(message):
+            attempts.append(len(self.commits))
+            if len(attempts) < 3:
+                raise RuntimeError('database unavailable')
+
+        self.consume([FakeMessage(json.dumps({'backtest_id': 1}), offset=7)], callback, retries=2)
+        self.assertEqual(attempts, [0, 0, 0])
+        self.assertEqual(self.commits, [7])
+        self.assertEqual(self.service.producer.messages, [])
+
+    def test_dead_letter_after_retries(self):
+        callback = MagicMock(side_effect=RuntimeError('bad scene'))
+        self.consume([FakeMessage(json.dumps({'backtest_id': 1}), offset=4), FakeMessage('not json', offset=5)], callback, retries=2)
+        self.assertEqual(callback.call_count, 3)
+        dead = self.service.producer.messages
+        self.assertEqual([message.topic() for message in dead], ['backtest_scenes_dlq', 'backtest_scenes_dlq'])
+        self.assertEqual([message.value() for message in dead], [json.dumps({'backtest_id': 1}), 'not json'])
+        # Both are committed once their copy is delivered, so the partition moves on
+        self.assertEqual(self.commits, [4, 5])
+
+    def test_callback_messages_flushed_on_stop(self):
+        # Results produced by the callback are only queued; stopping delivers them
+        self.consume([FakeMessage(json.dumps({'backtest_id': 1}))],
+                     lambda message: self.service.produce('backtest_results', message))
+        self.assertEqual([message.topic() for message in self.service.producer.messages], ['backtest_results'])
+        self.assertEqual(len(self.service.producer), 0)
+        self.consumer.close.assert_called_once()
+
+    def test_failed_dead_letter_is_not_committed(self):
+        self.service.producer.error = KafkaError(KafkaError._MSG_TIMED_OUT)
+        with self.assertRaises(KafkaException):
+            self.consume([FakeMessage('not json', offset=3)], lambda message: None)
+        self.assertEqual(self.commits, [])
+        self.consumer.close.assert_called_once()
+
+
+def idle_poll(timeout):
+    threading.Event().wait(0.05)
+    return None
+
+
+def consume_until_stopped(service, workdir, stop=None):
+    with open(os.path.join(workdir, f'{os.getpid()}.started'), 'w'):
+        pass
+    service.consume('backtest_scenes', lambda message: None, stop=stop)
+    with open(os.path.join(workdir, f'{os.getpid()}.stopped'), 'w') as f:
+        json.dump({'closed': service.new_consumer().close.called}, f)
+
+
+class TestConsumerPool(KafkaTestCase):
+
+    def test_workers_stop_cleanly_on_sigterm(self):
+        self.consumer.poll.side_effect = idle_poll
+        with tempfile.TemporaryDirectory() as workdir:
+            pool = ConsumerPool(consume_until_stopped, 2, args=(self.service, workdir), check_interval=0.1)
+            pool.start()
+            deadline = time.monotonic() + 10
+            while len([name for name in os.listdir(workdir) if name.endswith('.started')]) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            pids = [process.pid for process in pool.processes]
+
+            pool.stop()
+            # Each worker left its loop on SIGTERM, closed its consumer and was not restarted
+            self.assertEqual([process.exitcode for process in pool.processes], [0, 0])
+            self.assertEqual([process.pid for process in pool.processes], pids)
+            for pid in pids:
+                with open(os.path.join(workdir, f'{pid}.stopped')) as f:
+                    self.assertEqual(json.load(f), {'closed': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from flask import Flask
+from app import db, consume_backtest_scenes
+from app.services import kafka_service as kafka_module
+from app.services.mlflow_service import mlflow_service
+
+
+class TestMlflowService(unittest.TestCase):
+
+    def test_worker_closes_tracker(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmpdir}/test.db'
+            db.init_app(app)
+            with patch.object(kafka_module.kafka_service, 'consume', side_effect=RuntimeError('broker gone')), \
+                    patch.object(mlflow_service.tracker, 'close') as close:
+                with self.assertRaises(RuntimeError):
+                    consume_backtest_scenes(app)
+            # Queued runs are sent or spooled even though atexit never runs in a worker
+            close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
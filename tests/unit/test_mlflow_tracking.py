@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock
+import tempfile
+import threading
+import time
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from scripts.mlflow_tracking import MlflowTracker, SPOOL_TAG
+
+
+class FakeTracker(MlflowTracker):
+    """Sends to a list instead of a tracking server."""
+
+    def __init__(self, *args, latency=0.0, **kwargs):
+        super().__init__('http://localhost:5050', 'Backtest_Results', *args, **kwargs)
+        self.latency = latency
+        self.up = True
+        self.sent = []
+        self.sent_event = threading.Event()
+
+    def _send(self, record):
+        time.sleep(self.latency)
+        if not self.up:
+            raise ConnectionError('tracking server down')
+        self.sent.append(record)
+        self.sent_event.set()
+
+
+class TestMlflowTracking(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_log_run_does_not_block(self):
+        tracker = FakeTracker(spool_dir=self.tmpdir.name, latency=0.5)
+        start = time.monotonic()
+        tracker.log_run('MacdStrategy', {'total_return': 0.1, 'sharpe_ratio': None, 'note': 'N/A'}, params={'macd1_period': 12})
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        self.assertTrue(tracker.flush(5))
+        self.assertEqual(len(tracker.sent), 1)
+        self.assertEqual(tracker.sent[0]['metrics'], {'total_return': 0.1})
+        self.assertEqual(tracker.sent[0]['params'], {'macd1_period': '12'})
+
+    def test_spools_while_down_and_replays(self):
+        tracker = FakeTracker(spool_dir=self.tmpdir.name, retry_interval=0.2)
+        tracker.up = False
+        for i in range(3):
+            tracker.log_run(f'run_{i}', {'total_return': i})
+        self.assertTrue(tracker.flush(5))
+        self.assertEqual(len(tracker.spooled()), 3)
+        self.assertEqual(tracker.sent, [])
+
+        tracker.up = True
+        self.assertTrue(tracker.sent_event.wait(5))
+        deadline = time.monotonic() + 5
+        while tracker.spooled() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(tracker.spooled(), [])
+        self.assertEqual([record['run_name'] for record in tracker.sent], ['run_0', 'run_1', 'run_2'])
+
+    def test_full_queue_spools(self):
+        tracker = FakeTracker(spool_dir=self.tmpdir.name, latency=0.3, max_queue=1)
+        for i in range(4):
+            tracker.log_run(f'run_{i}', {'total_return': i})
+        self.assertGreaterEqual(len(tracker.spooled()), 2)
+
+    def test_reclaims_abandoned_claims(self):
+        tracker = FakeTracker(spool_dir=self.tmpdir.name, claim_timeout=60)
+        for name in ('abandoned', 'in_flight'):
+            tracker._spool({'id': name, 'run_name': name, 'timestamp': 0, 'metrics': {}, 'params': {}})
+        abandoned, in_flight = [os.path.join(self.tmpdir.name, name) for name in tracker.spooled()]
+        # Claimed by processes that are gone: one long ago, one still within the timeout
+        os.rename(abandoned, f'{abandoned}.99999.sending')
+        os.utime(f'{abandoned}.99999.sending', (time.time() - 120, time.time() - 120))
+        os.rename(in_flight, f'{in_flight}.99998.sending')
+
+        tracker._replay()
+        self.assertEqual([record['run_name'] for record in tracker.sent], ['abandoned'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), [f'{os.path.basename(in_flight)}.99998.sending'])
+
+    def test_replay_skips_runs_already_sent(self):
+        tracker = MlflowTracker('http://localhost:5050', 'Backtest_Results', spool_dir=self.tmpdir.name)
+        tracker._client = MagicMock()
+        tracker._experiment_id = '1'
+        finished = MagicMock()
+        finished.info.status = 'FINISHED'
+        tracker._client.search_runs.return_value = [finished]
+        tracker._spool({'id': 'abc', 'run_name': 'Backtest_1', 'timestamp': 0, 'metrics': {'total_return': 0.1}, 'params': {}})
+
+        tracker._replay()
+        tracker._client.search_runs.assert_called_once_with(['1'], filter_string=f"tags.{SPOOL_TAG} = 'abc'", max_results=1)
+        tracker._client.create_run.assert_not_called()
+        self.assertEqual(tracker.spooled(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import MagicMock
+import tempfile
+import pandas as pd
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from sqlalchemy import create_engine
+from scripts.ohlcv_cache import OhlcvCache
+from scripts.ohlcv_db import ensure_ohlcv_table, query_range, query_ohlcv_version, table_name, upsert_ohlcv
+from scripts.synthetic_data import generate_ohlcv
+
+
+class TestOhlcvCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = OhlcvCache(self.tmpdir.name, version_ttl=0)
+        self.table = generate_ohlcv(400, start='2023-01-01')
+        self.load_range = MagicMock(side_effect=self.query)
+        self.load_version = MagicMock(return_value=self.table.index[-1])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def query(self, symbol, start_date, end_date):
+        start, end = pd.Timestamp(start_date, tz=self.table.index.tz), pd.Timestamp(end_date, tz=self.table.index.tz)
+        return self.table.loc[start:end]
+
+    def get(self, start_date, end_date):
+        return self.cache.get('BTC/USD', start_date, end_date, self.load_range, self.load_version)
+
+    def test_read_through(self):
+        data = self.get('2023-02-01', '2023-06-30')
+        pd.testing.assert_frame_equal(data, self.table.loc['2023-02-01':'2023-06-30'], check_freq=False)
+        self.assertEqual(self.load_range.call_count, 1)
+
+        data = self.get('2023-03-15', '2023-04-15')
+        pd.testing.assert_frame_equal(data, self.table.loc['2023-03-15':'2023-04-15'], check_freq=False)
+        self.assertEqual(self.load_range.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_extends_covered_range(self):
+        self.get('2023-02-01', '2023-06-30')
+        data = self.get('2023-01-10', '2023-08-01')
+        pd.testing.assert_frame_equal(data, self.table.loc['2023-01-10':'2023-08-01'], check_freq=False)
+
+        # Only the missing edges are read from the database
+        edges = [call.args[1:] for call in self.load_range.call_args_list[1:]]
+        self.assertEqual(edges, [(pd.Timestamp('2023-01-10'), pd.Timestamp('2023-02-01')),
+                                 (pd.Timestamp('2023-06-30'), pd.Timestamp('2023-08-01'))])
+
+        self.get('2023-01-20', '2023-07-20')
+        self.assertEqual(self.load_range.call_count, 3)
+
+    def test_invalidated_by_new_data(self):
+        self.get('2023-02-01', '2023-06-30')
+        self.load_version.return_value = self.table.index[-1] + pd.Timedelta(days=1)
+        self.get('2023-02-01', '2023-06-30')
+        self.assertEqual(self.load_range.call_count, 2)
+
+    def test_timezone_aware_dates(self):
+        self.table = self.table.tz_localize('UTC')
+        data = self.get('2023-02-01', '2023-02-10')
+        self.assertEqual(len(data), 10)
+        self.assertEqual(str(data.index.tz), 'UTC')
+        data = self.get('2023-02-03', '2023-02-04')
+        self.assertEqual(list(data.index), list(self.table.loc['2023-02-03':'2023-02-04'].index))
+
+def bars(data):
+    return data.reset_index().rename(columns={'date': 'timestamp', 'Open': 'open', 'High': 'high', 'Low': 'low',
+                                              'Close': 'close', 'Volume': 'volume'})
+
+
+class TestStoredVersion(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'ohlcv.db')}")
+        self.cache = OhlcvCache(os.path.join(self.tmpdir.name, 'cache'), version_ttl=0)
+        self.data = generate_ohlcv(100, start='2023-01-01')
+        ensure_ohlcv_table(self.engine, table_name('BTC/USD'))
+        upsert_ohlcv(self.engine, table_name('BTC/USD'), bars(self.data))
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def get(self):
+        def load_range(symbol, start, end):
+            data = query_range(self.engine, symbol, start.to_pydatetime(), end.to_pydatetime())
+            return data.set_index(pd.to_datetime(data.pop('date')))
+        return self.cache.get('BTC/USD', '2023-01-01', '2023-04-10', load_range,
+                              lambda symbol: query_ohlcv_version(self.engine, symbol))
+
+    def test_revised_bars_are_read_again(self):
+        self.assertEqual(self.get()['close'].iloc[-1], self.data['Close'].iloc[-1])
+        self.get()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # The last bar is fetched again while still forming: same timestamp, new prices
+        revised = self.data.copy()
+        revised.iloc[-1, revised.columns.get_loc('Close')] += 1.0
+        upsert_ohlcv(self.engine, table_name('BTC/USD'), bars(revised.iloc[-1:]))
+        self.assertEqual(self.get()['close'].iloc[-1], revised['Close'].iloc[-1])
+
+        # A backfill revising an older bar
+        revised.iloc[10, revised.columns.get_loc('Open')] += 1.0
+        upsert_ohlcv(self.engine, table_name('BTC/USD'), bars(revised.iloc[10:11]))
+        self.assertEqual(self.get()['open'].iloc[10], revised['Open'].iloc[10])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
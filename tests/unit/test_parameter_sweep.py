@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.parameter_sweep import grid_space, random_space, run_sweep
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestParameterSweep(unittest.TestCase):
+
+    def test_grid_space(self):
+        points = grid_space(MacdStrategy, {'macd1_period': [8, 12], 'macd2_period': [21, 26, 30]})
+        self.assertEqual(len(points), 6)
+        self.assertIn({'macd1_period': 8, 'macd2_period': 30}, points)
+
+    def test_random_space(self):
+        space = {'stoch_period': list(range(5, 30)), 'stoch_low': [10, 20, 30], 'stoch_high': [70, 80, 90]}
+        points = random_space(StochasticOscillatorStrategy, space, 50, seed=1)
+        self.assertEqual(len(points), 50)
+        self.assertEqual(len({tuple(point.items()) for point in points}), 50)
+        self.assertEqual(points, random_space(StochasticOscillatorStrategy, space, 50, seed=1))
+        self.assertEqual(len(random_space(StochasticOscillatorStrategy, {'stoch_period': [5, 6]}, 10)), 2)
+
+    def test_unknown_parameter(self):
+        with self.assertRaises(ValueError):
+            grid_space(MacdStrategy, {'rsi_period': [14]})
+
+    @patch('scripts.parameter_sweep.fetch_data')
+    def test_empty_space(self, mock_fetch_data):
+        # Rejected before any data is fetched or worker started
+        with self.assertRaises(ValueError):
+            run_sweep(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2022-10-22', {'macd1_period': [8, 12], 'macd2_period': []})
+        with self.assertRaises(ValueError):
+            run_sweep(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2022-10-22', {'macd1_period': [8, 12]}, n_samples=0)
+        mock_fetch_data.assert_not_called()
+
+    @patch('scripts.parameter_sweep.fetch_data')
+    def test_run_sweep(self, mock_fetch_data):
+        data = generate_ohlcv(600, seed=3)
+        mock_fetch_data.return_value = data
+        space = {'macd1_period': [8, 12], 'macd2_period': [21, 26], 'signal_period': [5, 9]}
+
+        ranked = run_sweep(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2022-10-22', space, max_workers=2)
+
+        mock_fetch_data.assert_called_once()
+        self.assertEqual(len(ranked), 8)
+        scores = [result['score'] for result in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        best = ranked[0]
+        expected = run_backtest(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2022-10-22', data=data, params=best['params'])
+        self.assertEqual(best['number_of_trades'], expected['number_of_trades'])
+        self.assertAlmostEqual(best['total_return'], expected['total_return'], places=9)
+
+if __name__ == '__main__':
+    unittest.main()
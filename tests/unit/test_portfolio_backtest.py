@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.portfolio_backtest import run_portfolio_backtest, align_frames
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestPortfolioBacktest(unittest.TestCase):
+
+    def setUp(self):
+        self.symbols = ['BTC/USD', 'ETH/USD', 'SOL/USD']
+        self.data = {symbol: generate_ohlcv(500, seed=seed) for seed, symbol in enumerate(self.symbols)}
+
+    def test_shared_cash_and_per_asset_metrics(self):
+        result = run_portfolio_backtest(StochasticOscillatorStrategy, self.symbols, 10000, 0.001, '2021-03-01', '2022-07-13', data=self.data)
+
+        self.assertEqual(list(result['assets']), self.symbols)
+        self.assertEqual(result['number_of_trades'], sum(asset['number_of_trades'] for asset in result['assets'].values()))
+        # Per-asset pnl adds up to the change in portfolio value
+        self.assertAlmostEqual(sum(asset['pnl'] for asset in result['assets'].values()), result['total_return'] * 10000, places=6)
+
+        # Each asset trades on its own signals, as in a standalone run
+        for symbol in self.symbols:
+            single = run_backtest(StochasticOscillatorStrategy, symbol, 10000, 0.001, '2021-03-01', '2022-07-13', data=self.data[symbol])
+            self.assertEqual(result['assets'][symbol]['number_of_trades'], single['number_of_trades'], symbol)
+
+    def test_fetches_all_symbols_at_once(self):
+        with patch('scripts.portfolio_backtest.fetch_many', return_value=self.data) as mock_fetch_many:
+            result = run_portfolio_backtest(MacdStrategy, self.symbols[:2], 10000, 0.001, '2021-03-01', '2022-07-13',
+                                            weights={'BTC/USD': 0.8, 'ETH/USD': 0.2})
+        mock_fetch_many.assert_called_once_with(self.symbols[:2], '2021-03-01', '2022-07-13')
+        self.assertEqual(list(result['assets']), self.symbols[:2])
+
+    def test_align_frames(self):
+        frames = {'BTC/USD': self.data['BTC/USD'].iloc[10:], 'ETH/USD': self.data['ETH/USD'].iloc[:-5]}
+        aligned = align_frames(frames)
+        self.assertEqual(len(aligned['BTC/USD']), 485)
+        self.assertTrue(aligned['BTC/USD'].index.equals(aligned['ETH/USD'].index))
+
+        with self.assertRaises(ValueError):
+            align_frames({'BTC/USD': self.data['BTC/USD'].iloc[:10], 'ETH/USD': self.data['ETH/USD'].iloc[10:]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+from datetime import date
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from flask import Flask
+from app import db
+from app.models.backtest import Backtest, CachedResult, Result, ResultSeries
+from app.services import backtest_service
+from scripts.backtest_runner import run_backtest, MacdStrategy, RsiBollingerBandsStrategy
+from scripts.result_cache import data_version, fingerprint
+from scripts.synthetic_data import generate_ohlcv
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_fingerprint(self):
+        data = generate_ohlcv(300, seed=1)
+        version = data_version(data)
+        self.assertEqual(version, data_version(data.copy()))
+        key = fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001, version)
+        # Dates and numbers are normalized, params default to the strategy's
+        self.assertEqual(key, fingerprint(MacdStrategy, 'BTC/USD', date(2023, 1, 1), date(2023, 12, 31), 10000.0, 0.001, version,
+                                          params={'macd1_period': MacdStrategy.params.macd1_period}))
+
+        changed = data.copy()
+        changed.iloc[150, changed.columns.get_loc('Close')] += 0.01
+        for other in (
+            fingerprint(RsiBollingerBandsStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001, version),
+            fingerprint(MacdStrategy, 'ETH/USD', '2023-01-01', '2023-12-31', 10000, 0.001, version),
+            fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 5000, 0.001, version),
+            fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.002, version),
+            fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001, version, params={'macd1_period': 8}),
+            fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001, version,
+                        options={'walk_forward': {'train_bars': 100, 'test_bars': 50}}),
+            fingerprint(MacdStrategy, 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001, data_version(changed)),
+        ):
+            self.assertNotEqual(key, other)
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.tmpdir.name}/test.db'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        patch.object(backtest_service, 'kafka_service').start()
+        patch.object(backtest_service, 'mlflow_service').start()
+        self.data = generate_ohlcv(400, seed=5)
+        self.fetch_data = patch.object(backtest_service, 'fetch_data', return_value=self.data).start()
+        self.run_backtest = patch.object(backtest_service, 'run_backtest', wraps=run_backtest).start()
+
+    def tearDown(self):
+        patch.stopall()
+        with self.app.app_context():
+            db.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def run_scenario(self, name, fee=0.001):
+        with self.app.app_context():
+            backtest = Backtest(name=name, symbol='BTC/USD', start_date=date(2023, 1, 1), end_date=date(2024, 2, 4),
+                                inital_cash=10000, fee=fee)
+            db.session.add(backtest)
+            db.session.commit()
+            results = backtest_service.run_and_evaluate_backtest(backtest.id, backtest.symbol, backtest.inital_cash, backtest.fee,
+                                                                 backtest.start_date, backtest.end_date, concurrent=False)
+            stored = [(result.strategy, result.is_best) for result in Result.query.filter_by(backtest_id=backtest.id).order_by(Result.id)]
+            return results, stored
+
+    def test_identical_scenarios_are_not_recomputed(self):
+        strategies = len(backtest_service.STRATEGIES)
+        first, first_stored = self.run_scenario('first')
+        self.assertEqual(self.run_backtest.call_count, strategies)
+
+        # Another name, same scenario: every result comes from the cache
+        second, second_stored = self.run_scenario('second')
+        self.assertEqual(self.run_backtest.call_count, strategies)
+        self.assertEqual([dict(result, backtest_id=0) for result in first], [dict(result, backtest_id=0) for result in second])
+        self.assertEqual(first_stored, second_stored)
+
+        # Both backtests' results point to the equity curves recorded by the first run
+        with self.app.app_context():
+            self.assertEqual(ResultSeries.query.count(), strategies)
+            fingerprints = [[result.fingerprint for result in Result.query.filter_by(backtest_id=backtest_id).order_by(Result.id)]
+                            for backtest_id in (1, 2)]
+            self.assertEqual(fingerprints[0], fingerprints[1])
+            self.assertEqual({series.fingerprint for series in ResultSeries.query}, set(fingerprints[0]))
+
+        # Another fee is another scenario
+        self.run_scenario('third', fee=0.002)
+        self.assertEqual(self.run_backtest.call_count, 2 * strategies)
+        with self.app.app_context():
+            self.assertEqual(CachedResult.query.count(), 2 * strategies)
+
+    def test_new_data_invalidates(self):
+        strategies = len(backtest_service.STRATEGIES)
+        self.run_scenario('first')
+        self.fetch_data.return_value = generate_ohlcv(400, seed=6)
+        self.run_scenario('second')
+        self.assertEqual(self.run_backtest.call_count, 2 * strategies)
+        with self.app.app_context():
+            # Only the results of the current bars are kept
+            self.assertEqual({entry.data_version for entry in CachedResult.query}, {data_version(self.fetch_data.return_value)})
+
+    def test_revised_bar_is_recomputed(self):
+        strategies = len(backtest_service.STRATEGIES)
+        with tempfile.TemporaryDirectory() as store_dir, patch.dict('os.environ', {'INDICATOR_STORE_DIR': store_dir}):
+            first, _ = self.run_scenario('first')
+            # The exchange revises a bar already stored: same dates, other prices
+            revised = self.data.copy()
+            revised.iloc[150:160, revised.columns.get_loc('Close')] *= 0.8
+            self.fetch_data.return_value = revised
+            second, _ = self.run_scenario('second')
+        self.assertEqual(self.run_backtest.call_count, 2 * strategies)
+        self.assertNotEqual([dict(result, backtest_id=0) for result in first], [dict(result, backtest_id=0) for result in second])
+        expected = [run_backtest(strategy, None, 10000, 0.001, None, None, data=revised)
+                    for strategy in backtest_service.STRATEGIES]
+        for result, recomputed in zip(second, expected):
+            self.assertAlmostEqual(result['total_return'], recomputed['total_return'], places=9)
+            self.assertEqual(result['number_of_trades'], recomputed['number_of_trades'])
+
+    def test_walk_forward_windows_share_the_strategy_pool(self):
+        walk_forward = {'train_bars': 200, 'test_bars': 100, 'optimize': False}
+        with ThreadPoolExecutor(2) as executor, \
+                patch.object(backtest_service, 'get_strategy_executor', return_value=executor), \
+                patch.object(executor, 'submit', wraps=executor.submit) as submit, \
+                patch.object(executor, 'map', wraps=executor.map) as map_windows, \
+                self.app.app_context():
+            results = backtest_service.run_and_evaluate_backtest(1, 'BTC/USD', 10000, 0.001, date(2023, 1, 1), date(2024, 2, 4),
+                                                                 walk_forward=walk_forward)
+        # The strategies run here, one after the other, and only their windows go to the pool
+        self.assertEqual(map_windows.call_count, len(backtest_service.STRATEGIES))
+        self.assertEqual({call.args[0] for call in submit.call_args_list}, {map_windows.call_args.args[0]})
+        self.assertEqual([len(result['windows']) for result in results], [2] * len(backtest_service.STRATEGIES))
+        for call in self.run_backtest.call_args_list:
+            self.assertEqual(call.kwargs['walk_forward'], dict(walk_forward, executor=executor))
+
+    def test_redelivered_backtest_is_not_run_again(self):
+        with self.app.app_context():
+            backtest = Backtest(name='once', symbol='BTC/USD', start_date=date(2023, 1, 1), end_date=date(2024, 2, 4),
+                                inital_cash=10000, fee=0.001)
+            db.session.add(backtest)
+            db.session.commit()
+            with patch.dict('os.environ', {'RESULT_CACHE': '0'}), ThreadPoolExecutor(2) as executor, \
+                    patch.object(backtest_service, 'get_strategy_executor', return_value=executor):
+                backtest_service.run_backtest_by_id(backtest.id)
+                backtest_service.run_backtest_by_id(backtest.id)
+            self.assertEqual(Result.query.filter_by(backtest_id=backtest.id).count(), len(backtest_service.STRATEGIES))
+        self.assertEqual(self.run_backtest.call_count, len(backtest_service.STRATEGIES))
+        backtest_service.kafka_service.produce_batch.assert_called_once()
+
+    def test_strategies_run_on_the_process_pool(self):
+        serial, serial_stored = self.run_scenario('serial')
+        backtest_service.kafka_service.reset_mock()
+        backtest_service.mlflow_service.reset_mock()
+        with self.app.app_context():
+            backtest = Backtest(name='pool', symbol='BTC/USD', start_date=date(2023, 1, 1), end_date=date(2024, 2, 4),
+                                inital_cash=10000, fee=0.001)
+            db.session.add(backtest)
+            db.session.commit()
+            # The real runner (a mock cannot be sent to the workers) on the service's own pool
+            with patch.dict('os.environ', {'RESULT_CACHE': '0'}), \
+                    patch.object(backtest_service, 'run_backtest', run_backtest), \
+                    patch.object(backtest_service, '_strategy_executor', None), \
+                    patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+                pooled = backtest_service.run_and_evaluate_backtest(backtest.id, 'BTC/USD', 10000, 0.001, date(2023, 1, 1),
+                                                                    date(2024, 2, 4))
+                executor = backtest_service._strategy_executor
+                executor.shutdown()
+            pooled_stored = [(result.strategy, result.is_best) for result in Result.query.filter_by(backtest_id=backtest.id).order_by(Result.id)]
+        self.assertIsNotNone(executor)
+        self.assertEqual([dict(result, backtest_id=0) for result in pooled], [dict(result, backtest_id=0) for result in serial])
+        self.assertEqual(pooled_stored, serial_stored)
+        # The side effects are batched as in a serial run
+        commit.assert_called_once()
+        backtest_service.kafka_service.produce_batch.assert_called_once()
+        backtest_service.mlflow_service.log_metrics.assert_called_once()
+
+    def test_disabled(self):
+        with patch.dict('os.environ', {'RESULT_CACHE': '0'}):
+            self.run_scenario('first')
+            self.run_scenario('second')
+        self.assertEqual(self.run_backtest.call_count, 2 * len(backtest_service.STRATEGIES))
+
+
+if __name__ == '__main__':
+    unittest.main()
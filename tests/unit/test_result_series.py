@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pyarrow as pa
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.result_series import decode, downsample, drawdown, encode_equity, encode_trades
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestResultSeries(unittest.TestCase):
+
+    def test_recorded_series_match_metrics(self):
+        data = generate_ohlcv(1500, seed=3)
+        for strategy in (MacdStrategy, StochasticOscillatorStrategy):
+            with self.subTest(strategy=strategy.__name__):
+                result = run_backtest(strategy, None, 10000, 0.001, None, None, data=data, series=True)
+                series = result.pop('series')
+                # Recording changes nothing else
+                self.assertEqual(result, run_backtest(strategy, None, 10000, 0.001, None, None, data=data))
+
+                self.assertTrue(np.array_equal(series['dates'], data.index.as_unit('ns').asi8))
+                self.assertEqual(series['equity'][-1] / 10000 - 1, result['total_return'])
+                self.assertEqual(drawdown(series['equity']).max(), result['max_drawdown'])
+                trades = series['trades']
+                self.assertEqual(len(trades['pnl']), result['number_of_trades'])
+                self.assertEqual(int((trades['pnlcomm'] > 0).sum()), result['winning_trades'])
+                self.assertTrue((trades['close_date'] > trades['open_date']).all())
+
+    def test_encoding(self):
+        equity = 10000 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.01, 100_000))
+        series = {
+            'dates': np.arange(100_000, dtype=np.int64) * 60_000_000_000,
+            'equity': equity,
+            'trades': {'open_date': np.array([0], dtype=np.int64), 'close_date': np.array([60_000_000_000], dtype=np.int64),
+                       'size': np.array([1.0]), 'price': np.array([100.0]), 'pnl': np.array([2.0]),
+                       'pnlcomm': np.array([1.8]), 'bars': np.array([1], dtype=np.int32)},
+        }
+        blob = encode_equity(series)
+        # float32 curve and drawdown plus int64 dates, barely more than the raw buffers
+        self.assertLess(len(blob), 100_000 * 16 + 1024)
+
+        buffer = pa.py_buffer(blob)
+        table = decode(buffer)
+        values = table.column('equity').chunk(0).buffers()[1]
+        self.assertTrue(buffer.address <= values.address < buffer.address + buffer.size)
+        self.assertTrue(np.array_equal(table.column('equity').to_numpy(), equity.astype(np.float32)))
+        self.assertTrue(np.array_equal(table.column('date').to_numpy().astype(np.int64), series['dates']))
+
+        trades = decode(encode_trades(series))
+        self.assertEqual(trades.column_names, ['open_date', 'close_date', 'size', 'price', 'pnl', 'pnlcomm', 'bars'])
+        self.assertEqual(trades.column('pnlcomm').to_pylist(), [1.8])
+
+    def test_downsample(self):
+        equity = 10000 * np.cumprod(1 + np.random.default_rng(1).normal(0, 0.01, 10_001))
+        table = decode(encode_equity({'dates': np.arange(10_001, dtype=np.int64), 'equity': equity, 'trades': {
+            'open_date': [], 'close_date': [], 'size': [], 'price': [], 'pnl': [], 'pnlcomm': [], 'bars': []}}))
+        points = downsample(table, 500)
+        self.assertEqual({len(values) for values in points.values()}, {500})
+        full = table.column('equity').to_numpy()
+        self.assertEqual(points['equity_min'].min(), full.min())
+        self.assertEqual(points['equity_max'].max(), full.max())
+        self.assertEqual(points['drawdown'].max(), table.column('drawdown').to_numpy().max())
+        self.assertEqual(points['equity'][-1], full[-1])
+        self.assertEqual(int(points['date'][-1].astype(np.int64)), 10_000)
+
+        self.assertEqual(len(downsample(table, 20_000)['equity']), 10_001)
+
+
+if __name__ == '__main__':
+    unittest.main()
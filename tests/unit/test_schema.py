@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+from datetime import date
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+from flask import Flask
+from sqlalchemy import inspect, text
+from app import db
+from app.models.backtest import Backtest, Result
+from app.schema import upgrade_schema
+
+# The tables as the first release created them
+OLD_SCHEMA = [
+    """CREATE TABLE backtests (id INTEGER PRIMARY KEY, name VARCHAR(255), symbol VARCHAR(20), start_date DATE,
+       end_date DATE, inital_cash INTEGER, fee FLOAT, created_at DATETIME)""",
+    """CREATE TABLE results (id INTEGER PRIMARY KEY, backtest_id INTEGER NOT NULL REFERENCES backtests(id),
+       strategy VARCHAR(255), total_return NUMERIC(10, 2), number_of_trades INTEGER, winning_trades INTEGER,
+       losing_trades INTEGER, max_drawdown NUMERIC(10, 2), sharpe_ratio NUMERIC(10, 2), is_best BOOLEAN)""",
+    "INSERT INTO backtests (id, name, symbol, start_date, end_date, inital_cash, fee) VALUES (1, 'old', 'BTC/USD', '2023-01-01', '2023-12-31', 10000, 0.001)",
+]
+
+
+class TestSchema(unittest.TestCase):
+
+    def test_upgrades_existing_tables(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmpdir}/test.db'
+            db.init_app(app)
+            with app.app_context():
+                with db.engine.begin() as conn:
+                    for statement in OLD_SCHEMA:
+                        conn.execute(text(statement))
+                db.create_all()
+                for _ in range(2):
+                    upgrade_schema(db.engine, db.metadata)
+
+                inspector = inspect(db.engine)
+                self.assertTrue({'symbols', 'walk_forward'} <= {column['name'] for column in inspector.get_columns('backtests')})
+                self.assertIn('fingerprint', {column['name'] for column in inspector.get_columns('results')})
+                self.assertIn('ix_backtests_scenario', {index['name'] for index in inspector.get_indexes('backtests')})
+                self.assertIn('ix_results_backtest_id', {index['name'] for index in inspector.get_indexes('results')})
+
+                # The ORM reads and writes the upgraded tables, old rows included
+                backtest = db.session.get(Backtest, 1)
+                self.assertIsNone(backtest.symbols)
+                db.session.add(Result(backtest_id=1, strategy='MacdStrategy', fingerprint='f' * 64))
+                db.session.commit()
+                self.assertEqual(Result.query.filter_by(backtest_id=1).one().fingerprint, 'f' * 64)
+                self.assertEqual(backtest.start_date, date(2023, 1, 1))
+                db.session.remove()
+                db.engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
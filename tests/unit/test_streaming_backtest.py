@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch
+import threading
+import time
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.streaming_backtest import InMemoryBus, run_stream, publish_bars, parse_timestamp
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestStreamingBacktest(unittest.TestCase):
+
+    def start_stream(self, strategy, bus):
+        stop = threading.Event()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(run_stream(strategy, 'BTC/USD', bus, stop=stop)))
+        thread.start()
+        return stop, thread, result
+
+    def wait_for_equity(self, bus, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if sum(message['type'] == 'equity' for message in bus.messages('paper_trading')) >= count:
+                return
+            time.sleep(0.05)
+        self.fail('stream did not catch up')
+
+    def test_matches_batch_backtest(self):
+        data = generate_ohlcv(400, seed=3)
+        bus = InMemoryBus()
+        stop, thread, result = self.start_stream(StochasticOscillatorStrategy, bus)
+        publish_bars(bus, 'ohlcv_bars', 'ETH/USD', data.iloc[:5])  # other symbols are ignored
+        publish_bars(bus, 'ohlcv_bars', 'BTC/USD', data)
+        self.wait_for_equity(bus, len(data))
+        stop.set()
+        thread.join(10)
+
+        expected = run_backtest(StochasticOscillatorStrategy, 'BTC/USD', 10000, 0.001, '2021-03-01', '2022-04-04', data=data)
+        fills = [message for message in bus.messages('paper_trading') if message['type'] == 'fill']
+        self.assertEqual(result['bars'], len(data))
+        self.assertAlmostEqual(result['value'], 10000 * (1 + expected['total_return']), places=6)
+        # Each closed trade is a buy and a sell; the last one may still be open
+        self.assertIn(len(fills), (2 * expected['number_of_trades'], 2 * expected['number_of_trades'] + 1))
+
+    def test_per_bar_latency(self):
+        data = generate_ohlcv(200, seed=1)
+        bus = InMemoryBus()
+        stop, thread, result = self.start_stream(MacdStrategy, bus)
+        for date, row in data.iterrows():
+            publish_bars(bus, 'ohlcv_bars', 'BTC/USD', data.loc[[date]])
+            time.sleep(0.002)
+        self.wait_for_equity(bus, len(data))
+        stop.set()
+        thread.join(10)
+
+        self.assertEqual(result['bars'], len(data))
+        self.assertLess(result['latency_p50_ms'], 10)
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp('2024-01-02T03:00:00+01:00'), parse_timestamp('2024-01-02T02:00:00'))
+        self.assertEqual(parse_timestamp(1704160800000), parse_timestamp('2024-01-02T02:00:00'))
+
+if __name__ == '__main__':
+    unittest.main()
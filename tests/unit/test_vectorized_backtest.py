@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy
+    from scripts.vectorized_backtest import run_vectorized_backtest
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestVectorizedBacktest(unittest.TestCase):
+
+    def assertSameResult(self, expected, actual):
+        self.assertEqual(expected.keys(), actual.keys())
+        for key in expected:
+            if expected[key] is None:
+                self.assertIsNone(actual[key], key)
+            else:
+                self.assertAlmostEqual(expected[key], actual[key], places=9, msg=key)
+
+    def test_parity_with_cerebro(self):
+        strategies = [RsiBollingerBandsStrategy, MacdStrategy, StochasticOscillatorStrategy]
+        for seed in range(3):
+            data = generate_ohlcv(800, seed=seed)
+            for strategy in strategies:
+                # Low cash also exercises orders rejected for margin
+                for initial_cash in (10000, 105):
+                    with self.subTest(seed=seed, strategy=strategy.__name__, initial_cash=initial_cash):
+                        with patch('scripts.backtest_runner.fetch_data', return_value=data):
+                            expected = run_backtest(strategy, 'ETH/USD', initial_cash, 0.001, '2021-03-01', '2023-05-10')
+                            actual = run_backtest(strategy, 'ETH/USD', initial_cash, 0.001, '2021-03-01', '2023-05-10', vectorized=True)
+                        self.assertSameResult(expected, actual)
+
+    def test_parity_with_custom_params(self):
+        data = generate_ohlcv(800, seed=7)
+        actual = run_vectorized_backtest(MacdStrategy, 'ETH/USD', 10000, 0.002, '2021-03-01', '2023-05-10', data=data,
+                                         params={'macd1_period': 8, 'macd2_period': 21, 'signal_period': 5})
+
+        class TunedMacd(MacdStrategy):
+            params = (('macd1_period', 8), ('macd2_period', 21), ('signal_period', 5))
+
+        with patch('scripts.backtest_runner.fetch_data', return_value=data):
+            expected = run_backtest(TunedMacd, 'ETH/USD', 10000, 0.002, '2021-03-01', '2023-05-10')
+        self.assertSameResult(expected, actual)
+        self.assertGreater(actual['number_of_trades'], 0)
+
+    def test_unsupported_strategy(self):
+        class OtherStrategy(MacdStrategy):
+            pass
+
+        with self.assertRaises(ValueError):
+            run_vectorized_backtest(OtherStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2023-05-10', data=generate_ohlcv(800))
+
+if __name__ == '__main__':
+    unittest.main()
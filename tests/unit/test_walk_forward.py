@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+import math
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.getcwd(), '..'))
+sys.path.append(root_path)
+
+with patch.dict('os.environ', {
+    'PG_HOST': 'localhost',
+    'PG_PORT': '5432',
+    'PG_DATABASE': 'test_db',
+    'PG_USER': 'user',
+    'PG_PASSWORD': 'password'
+}):
+    from scripts.backtest_runner import run_backtest, score_results, MacdStrategy
+    from scripts.vectorized_backtest import annual_sharpe_ratio
+    from scripts.parameter_sweep import grid_space
+    from scripts.walk_forward import walk_forward_windows, run_walk_forward
+    from scripts.synthetic_data import generate_ohlcv
+
+
+class TestWalkForward(unittest.TestCase):
+
+    def test_windows(self):
+        self.assertEqual(walk_forward_windows(100, 40, 20), [(0, 40, 60), (20, 60, 80), (40, 80, 100)])
+        self.assertEqual(walk_forward_windows(100, 40, 20, anchored=True), [(0, 40, 60), (0, 60, 80), (0, 80, 100)])
+        self.assertEqual(walk_forward_windows(100, 40, 20, step=30), [(0, 40, 60), (30, 70, 90)])
+        with self.assertRaises(ValueError):
+            walk_forward_windows(100, 40, 20, step=10)
+        with self.assertRaises(ValueError):
+            walk_forward_windows(50, 40, 20)
+
+    @patch('scripts.backtest_runner.fetch_data')
+    def test_run_walk_forward(self, mock_fetch_data):
+        data = generate_ohlcv(700, seed=3)
+        mock_fetch_data.return_value = data
+        space = {'macd1_period': [8, 12], 'macd2_period': [21, 26]}
+
+        result = run_backtest(MacdStrategy, 'ETH/USD', 10000, 0.001, '2021-03-01', '2023-01-29',
+                              walk_forward={'train_bars': 300, 'test_bars': 100, 'space': space, 'max_workers': 2})
+
+        mock_fetch_data.assert_called_once()
+        windows = result['windows']
+        self.assertEqual([window['window'] for window in windows], [0, 1, 2, 3])
+        for window, (train_start, test_start, test_end) in zip(windows, walk_forward_windows(len(data), 300, 100)):
+            train, test = data.iloc[train_start:test_start], data.iloc[test_start:test_end]
+            self.assertEqual(window['test_start'], test.index[0].strftime('%Y-%m-%d'))
+            self.assertEqual(window['test_end'], test.index[-1].strftime('%Y-%m-%d'))
+            # Best parameters on the train period, then run on the test period
+            points = grid_space(MacdStrategy, space)
+            scores = score_results([run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=train, params=params)
+                                    for params in points])
+            self.assertEqual(window['params'], points[scores.index(max(scores))])
+            # The test period runs after the whole train period as warm-up
+            expected = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data.iloc[train_start:test_end],
+                                    params=window['params'], warmup_bars=test_start - train_start)
+            self.assertEqual(window['number_of_trades'], expected['number_of_trades'])
+            self.assertAlmostEqual(window['total_return'], expected['total_return'], places=9)
+
+        self.assertAlmostEqual(result['total_return'], math.prod(1 + window['total_return'] for window in windows) - 1, places=12)
+        self.assertEqual(result['number_of_trades'], sum(window['number_of_trades'] for window in windows))
+        self.assertEqual(result['max_drawdown'], max(window['max_drawdown'] for window in windows))
+
+    def test_rolling_without_optimization(self):
+        data = generate_ohlcv(500, seed=4)
+        result = run_walk_forward(MacdStrategy, 'ETH/USD', 10000, 0.001, None, None, train_bars=200, test_bars=150,
+                                  optimize=False, vectorized=True, max_workers=2, data=data)
+        self.assertEqual([window['params'] for window in result['windows']], [{}, {}])
+        expected = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data.iloc[150:500], warmup_bars=200)
+        self.assertAlmostEqual(result['windows'][1]['total_return'], expected['total_return'], places=9)
+
+    def test_short_warmup_in_process(self):
+        data = generate_ohlcv(500, seed=4)
+        result = run_walk_forward(MacdStrategy, 'ETH/USD', 10000, 0.001, None, None, train_bars=200, test_bars=150,
+                                  optimize=False, max_workers=1, warmup_bars=60, data=data)
+        expected = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data.iloc[290:500], warmup_bars=60)
+        self.assertEqual(result['windows'][1]['test_start'], data.index[350].strftime('%Y-%m-%d'))
+        self.assertAlmostEqual(result['windows'][1]['total_return'], expected['total_return'], places=9)
+
+    def test_warmup_bars(self):
+        data = generate_ohlcv(900, seed=5)
+        cold = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data)
+        self.assertEqual(run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data, warmup_bars=0), cold)
+
+        warm = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data, warmup_bars=400, series=True)
+        equity = warm.pop('series')['equity']
+        # Nothing is traded on the warm-up bars and the Sharpe ratio is measured after them
+        self.assertTrue((equity[:401] == 10000).all())
+        self.assertAlmostEqual(warm['sharpe_ratio'], annual_sharpe_ratio(equity[400:], data.index[400:], 10000), places=12)
+        self.assertLess(warm['number_of_trades'], cold['number_of_trades'])
+
+        # The vectorized engine warms up the same way
+        vectorized = run_backtest(MacdStrategy, None, 10000, 0.001, None, None, data=data, warmup_bars=400, vectorized=True)
+        for key in ('number_of_trades', 'winning_trades', 'losing_trades'):
+            self.assertEqual(vectorized[key], warm[key])
+        for key in ('total_return', 'max_drawdown', 'sharpe_ratio'):
+            self.assertAlmostEqual(vectorized[key], warm[key], places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
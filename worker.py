@@ -0,0 +1,21 @@
+import logging
+import signal
+import threading
+from app import create_app, start_consumer_pool
+import app.services.backtest_service  # loaded once here, shared by the forked consumers
+
+# Backtest worker: consumes backtest_scenes and runs the backtests, in its own
+# process(es) so CPU-heavy runs never share a GIL with the web server, which only
+# enqueues work. Scale with BACKTEST_CONSUMER_WORKERS or more worker containers.
+
+app = create_app()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    pool = start_consumer_pool(app)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    stop.wait()
+    pool.stop()